@@ -0,0 +1,129 @@
+"""
+Times fetching the shopping list, adding it to the trolley, capturing the trolley and writing product associations
+back to Notion, against local stand-ins for the Sainsbury's and Notion APIs, so no accounts are needed.
+
+Run from the repository root with: PYTHONPATH=src python benchmarks/benchmark_apis.py
+Use --output to save the results as JSON, so they can be compared between releases.
+"""
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import click
+
+from fake_apis import FakeAPIServer
+
+SHOPPING_ITEM_DB = "benchmark-shopping-items"
+RECIPE_DB = "benchmark-recipes"
+CAPTURE_REPEATS = 5
+
+
+class Result(NamedTuple):
+    phase: str
+    items: int
+    seconds: float
+    requests: int
+    injected_errors: int
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def to_json(self) -> dict:
+        return {**self._asdict(), "items_per_second": self.items_per_second}
+
+
+@click.command()
+@click.option("--sizes", default="10,100,1000", show_default=True, help="Comma separated numbers of shopping items.")
+@click.option("--latency-ms", default=20.0, show_default=True, help="Delay before each fake API response.")
+@click.option("--error-rate", default=0.0, show_default=True,
+              help="Fraction of requests to fail with --error-status.")
+@click.option("--error-status", default=503, show_default=True)
+@click.option("--concurrency", default=8, show_default=True, help="Maximum concurrent requests to add items.")
+@click.option("--output", type=click.Path(dir_okay=False, path_type=Path), help="Where to write the results as JSON.")
+def main(sizes: str, latency_ms: float, error_rate: float, error_status: int, concurrency: int, output: Path | None):
+    with FakeAPIServer(shopping_item_db=SHOPPING_ITEM_DB, recipe_db=RECIPE_DB, latency_seconds=latency_ms / 1000,
+                       error_rate=error_rate, error_status=error_status) as server:
+        # The API locations are read on import, so have to be set before importing the app's modules
+        os.environ.update({
+            "SAINSBURYS_API_URL": server.sainsburys_api_url,
+            "NOTION_API_URL": server.notion_api_url,
+            "NOTION_SECRET": "benchmark",
+            "NOTION_SHOPPING_ITEM_DB": SHOPPING_ITEM_DB,
+            "NOTION_RECIPE_DB": RECIPE_DB,
+        })
+        from requests.cookies import RequestsCookieJar
+        from data_model import TrolleyQuantityUnit
+        from main import automatically_order
+        from notion_data_provider import get_items
+        from notion_writer import NotionWriteQueue, AssociationUpdate
+        from shopping_driver import SainsburysAPIClient
+
+        def timed(phase: str, number_of_items: int, function, repeats: int = 1):
+            """Calls `function`, recording the fastest of `repeats` calls, and returns what it returned."""
+            best = None
+            for _ in range(repeats):
+                requests_before, errors_before = server.state.requests, server.state.injected_errors
+                start = time.perf_counter()
+                value = function()
+                result = Result(phase, number_of_items, time.perf_counter() - start,
+                                requests=server.state.requests - requests_before,
+                                injected_errors=server.state.injected_errors - errors_before)
+                if best is None or result.seconds < best.seconds:
+                    best = result
+            results.append(best)
+            return value
+
+        results: list[Result] = []
+        for number_of_items in (int(size) for size in sizes.split(",")):
+            server.load_synthetic_databases(number_of_items)
+            api = SainsburysAPIClient(access_token="benchmark", wc_auth_token="benchmark", cookies=RequestsCookieJar())
+
+            items = timed("get_items", number_of_items, get_items)
+
+            api.empty_trolley()
+            timed("automatically_order", len(items),
+                  lambda: automatically_order(api, items, max_concurrent_requests=concurrency))
+
+            trolley = timed("capture_trolley", len(items), api.capture_trolley, repeats=CAPTURE_REPEATS)
+            if not error_rate:
+                assert len(trolley) == len({item.trolley_item.id for item in items if item.trolley_item})
+
+            updates = [
+                AssociationUpdate(
+                    item_name=item.display_name,
+                    multiplier=1,
+                    sainsburys_item_name=f"Sainsbury's {item.display_name}",
+                    sainsburys_product_uid=str(index),
+                    unit=TrolleyQuantityUnit.ITEMS,
+                    page_id=item.page_id,
+                )
+                for index, item in enumerate(items)
+            ]
+            with tempfile.TemporaryDirectory() as directory:
+                def write_back():
+                    with NotionWriteQueue(journal_path=Path(directory) / "notion_writes.jsonl") as notion_writes:
+                        for update in updates:
+                            notion_writes.put(update)
+                timed("notion_write_back", len(updates), write_back)
+
+    click.echo()
+    click.echo(f"{'Phase':<22}{'Items':>7}{'Seconds':>10}{'Items/s':>10}{'Requests':>10}{'Errors':>8}")
+    for result in results:
+        click.echo(f"{result.phase:<22}{result.items:>7}{result.seconds:>10.3f}{result.items_per_second:>10.0f}"
+                   f"{result.requests:>10}{result.injected_errors:>8}")
+    if output is not None:
+        output.write_text(json.dumps({
+            "latency_ms": latency_ms,
+            "error_rate": error_rate,
+            "error_status": error_status,
+            "concurrency": concurrency,
+            "results": [result.to_json() for result in results],
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compares evaluating ratio expressions with the parser in evaluate_math, with and without its cache, against the
+previous approach of compiling them with Python's compiler and matching the bytecode.
+
+Run from the repository root with: PYTHONPATH=src python benchmarks/benchmark_math.py
+"""
+import re
+import sys
+import timeit
+
+from evaluate_math import evaluate_math_expression, evaluate_math_expressions, _evaluate
+
+EXPRESSIONS = ["1/3", "4/5", "1+2+3", "2*0.25", "(1 + 2) / 12", "6/4 - 1", "1/24", "3.5/7"]
+REPEATS = 20
+NUMBER = 2000
+
+_re_math_expression = re.compile(rb'd([\x00-\xFF]+)S\x00')
+
+
+def compile_and_match_bytecode(expr: str) -> float | None:
+    """The previous evaluator, which only matches the bytecode of older versions of Python (so may give None)."""
+    code = compile(expr, 'userinput', 'eval')
+    match = _re_math_expression.fullmatch(code.co_code)
+    if not match:
+        return None
+    return code.co_consts[int.from_bytes(match.group(1), sys.byteorder)]
+
+
+def main():
+    def best_microseconds(function) -> float:
+        seconds = min(timeit.repeat(function, number=NUMBER, repeat=REPEATS))
+        return seconds / (NUMBER * len(EXPRESSIONS)) * 1e6
+
+    timings = {
+        "compile and match bytecode": best_microseconds(lambda: [compile_and_match_bytecode(e) for e in EXPRESSIONS]),
+        "parse (uncached)": best_microseconds(lambda: [_evaluate.__wrapped__(e) for e in EXPRESSIONS]),
+        "parse (cached)": best_microseconds(lambda: [evaluate_math_expression(e) for e in EXPRESSIONS]),
+        "batch (cached)": best_microseconds(lambda: evaluate_math_expressions(EXPRESSIONS)),
+    }
+    baseline = timings["compile and match bytecode"]
+    print(f"{len(EXPRESSIONS)} expressions, best of {REPEATS}, per expression:")
+    for name, microseconds in timings.items():
+        print(f"  {name + ':':28} {microseconds:6.2f} us ({baseline / microseconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
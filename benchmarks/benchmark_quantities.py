@@ -0,0 +1,35 @@
+"""
+Compares converting shopping item pages to ShoppingItems one at a time with the batch path.
+
+Run from the repository root with: PYTHONPATH=src python benchmarks/benchmark_quantities.py
+"""
+import timeit
+
+from notion_data_provider import shopping_item_for_result, shopping_items_for_results_batch, \
+    quantity_in_meals_for_results
+from synthetic_pages import synthetic_databases
+
+NUMBER_OF_PAGES = 5000
+REPEATS = 20
+
+
+def main():
+    item_pages, ingredient_pages = synthetic_databases(NUMBER_OF_PAGES)
+    quantity_in_meals_for_item_id = quantity_in_meals_for_results(ingredient_pages)
+
+    def per_item():
+        return [shopping_item_for_result(page, quantity_in_meals_for_item_id) for page in item_pages]
+
+    def batch():
+        return shopping_items_for_results_batch(item_pages, quantity_in_meals_for_item_id)
+
+    assert per_item() == batch()
+    per_item_seconds = min(timeit.repeat(per_item, number=1, repeat=REPEATS))
+    batch_seconds = min(timeit.repeat(batch, number=1, repeat=REPEATS))
+    print(f"{NUMBER_OF_PAGES} pages, best of {REPEATS}:")
+    print(f"  per item: {per_item_seconds * 1000:.1f} ms")
+    print(f"  batch:    {batch_seconds * 1000:.1f} ms ({per_item_seconds / batch_seconds:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
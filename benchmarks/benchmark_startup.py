@@ -0,0 +1,77 @@
+"""
+Times how long the command line tool takes to start, by importing `main` and running `main.py --help` in fresh
+interpreters, and lists the slowest imports.
+
+Run from the repository root with: PYTHONPATH=src python benchmarks/benchmark_startup.py
+Exits with an error if the median time to import `main` is over --target-ms, so it can be used to catch
+regressions, or if any of the modules that should only be loaded when needed were imported.
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import click
+
+SRC_DIRECTORY = Path(__file__).resolve().parent.parent / "src"
+# Only needed on some code paths, so shouldn't be imported just to start
+LAZY_MODULES = ["selenium", "tqdm", "cryptography"]
+_IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def _run(arguments: list[str]) -> tuple[float, str]:
+    """Runs Python with the given arguments, returning the seconds it took and what it wrote to stderr."""
+    # Without the Notion configuration, to check that it isn't needed to start
+    environment = {name: value for name, value in os.environ.items() if not name.startswith("NOTION_")}
+    environment["PYTHONPATH"] = str(SRC_DIRECTORY)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, *arguments], env=environment, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise click.ClickException(f"python {' '.join(arguments)} failed:\n{completed.stderr}")
+    return seconds, completed.stderr
+
+
+def _slowest_imports(import_times: str, count: int) -> list[tuple[int, str]]:
+    """The modules imported directly by `main` (or the top level) that took longest, including their imports."""
+    cumulative_for_module = {}
+    for match in _IMPORT_TIME_LINE.finditer(import_times):
+        _, cumulative_us, indent, module = match.groups()
+        # Nesting is shown by two spaces per level, after the single space separating the columns
+        if len(indent) <= 3:
+            cumulative_for_module[module] = int(cumulative_us)
+    return sorted(((us, module) for module, us in cumulative_for_module.items()), reverse=True)[:count]
+
+
+@click.command()
+@click.option("--repeats", default=10, show_default=True, type=click.IntRange(min=1))
+@click.option("--target-ms", default=300.0, show_default=True, help="Maximum median time to import main.")
+def main(repeats: int, target_ms: float):
+    baseline = statistics.median(_run(["-c", "pass"])[0] for _ in range(repeats))
+    import_main = statistics.median(_run(["-c", "import main"])[0] for _ in range(repeats))
+    help_text = statistics.median(_run([str(SRC_DIRECTORY / "main.py"), "--help"])[0] for _ in range(repeats))
+    _, import_times = _run(["-X", "importtime", "-c", "import main"])
+    loaded_lazy_modules = [
+        module for module in LAZY_MODULES if re.search(rf"\|\s+{re.escape(module)}(\.|$)", import_times, re.MULTILINE)
+    ]
+
+    print(f"Median of {repeats} runs:")
+    print(f"  python -c pass:  {baseline * 1000:.0f} ms")
+    print(f"  import main:     {import_main * 1000:.0f} ms ({(import_main - baseline) * 1000:.0f} ms over baseline)")
+    print(f"  main.py --help:  {help_text * 1000:.0f} ms")
+    print("Slowest imports:")
+    for cumulative_us, module in _slowest_imports(import_times, count=10):
+        print(f"  {cumulative_us / 1000:7.1f} ms  {module}")
+
+    if loaded_lazy_modules:
+        raise click.ClickException(f"Importing main loaded {', '.join(loaded_lazy_modules)}")
+    if import_main * 1000 > target_ms:
+        raise click.ClickException(f"Importing main took {import_main * 1000:.0f} ms, over the {target_ms:.0f} ms "
+                                   f"target")
+
+
+if __name__ == "__main__":
+    main()
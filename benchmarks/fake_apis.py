@@ -0,0 +1,243 @@
+"""
+A local stand-in for the parts of the Sainsbury's groceries API and the Notion API that this app uses, for
+benchmarking without live accounts.
+
+Sainsbury's endpoints are served under /groceries-api/gol-services and Notion's under /v1, so pointing
+SAINSBURYS_API_URL and NOTION_API_URL at `FakeAPIServer.sainsburys_api_url` and `.notion_api_url` sends the app's
+requests here. Every response can be delayed by a fixed latency, and a fraction of them replaced with an error.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from synthetic_pages import synthetic_databases
+
+SAINSBURYS_PREFIX = "/groceries-api/gol-services"
+NOTION_PREFIX = "/v1"
+NOTION_MAX_PAGE_SIZE = 100
+
+
+class FakeAPIState:
+    """The basket and Notion databases behind the fake APIs, along with counts of the requests served."""
+    def __init__(self, shopping_item_db: str, recipe_db: str):
+        self.lock = threading.Lock()
+        self.shopping_item_db = shopping_item_db
+        self.recipe_db = recipe_db
+        self.load([], [])
+
+    def load(self, item_pages: list[dict], ingredient_pages: list[dict]):
+        """Replaces the Notion databases, empties the basket and resets the request counts."""
+        with self.lock:
+            self.pages_for_database = {self.shopping_item_db: item_pages, self.recipe_db: ingredient_pages}
+            self.page_for_id = {page["id"]: page for page in item_pages + ingredient_pages}
+            # Basket items by product UID, as (quantity, uom)
+            self.basket: dict[str, tuple[float, str]] = {}
+            self.basket_version = 0
+            # Products that can't be added to the basket, as if they were out of stock
+            self.unavailable_product_uids: set[str] = set()
+            self.requests = 0
+            self.injected_errors = 0
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.basket_version}"'
+
+    def basket_json(self) -> dict:
+        return {
+            "items": [
+                {"product": {"product_uid": uid, "name": f"Product {uid}"}, "quantity": quantity, "uom": uom}
+                for uid, (quantity, uom) in self.basket.items()
+            ]
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which would otherwise wait on delayed ACKs
+    disable_nagle_algorithm = True
+    # Set on the subclass made for each server
+    state: FakeAPIState
+    latency_seconds: float
+    error_rate: float
+    error_status: int
+    rng: random.Random
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict | None, headers: dict[str, str] | None = None):
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _request_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _handle(self, method: str):
+        request_json = self._request_json()
+        with self.state.lock:
+            self.state.requests += 1
+            inject_error = self.rng.random() < self.error_rate
+            if inject_error:
+                self.state.injected_errors += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if inject_error:
+            self._send_json(self.error_status, {"message": "Injected error"}, headers={"Retry-After": "0"})
+            return
+        url = urlparse(self.path)
+        if url.path.startswith(SAINSBURYS_PREFIX):
+            route = self._sainsburys
+            path = url.path[len(SAINSBURYS_PREFIX):]
+        elif url.path.startswith(NOTION_PREFIX):
+            route = self._notion
+            path = url.path[len(NOTION_PREFIX):]
+        else:
+            self._send_json(404, {"message": f"No such endpoint {url.path}"})
+            return
+        with self.state.lock:
+            status, body, headers = route(method, path, parse_qs(url.query), request_json)
+        self._send_json(status, body, headers)
+
+    def _sainsburys(self, method: str, path: str, query: dict, request_json: dict):
+        state = self.state
+        match method, path:
+            case "GET", "/basket/v1/basket":
+                etag = state.etag
+                if self.headers.get("If-None-Match") == etag:
+                    return 304, None, {"ETag": etag}
+                return 200, state.basket_json(), {"ETag": etag}
+            case "POST", "/basket/v1/basket/item" if request_json["product_uid"] in state.unavailable_product_uids:
+                return 400, {"message": "Product unavailable"}, None
+            case "POST", "/basket/v1/basket/item":
+                quantity, _ = state.basket.get(request_json["product_uid"], (0, request_json["uom"]))
+                state.basket[request_json["product_uid"]] = (quantity + request_json["quantity"], request_json["uom"])
+                state.basket_version += 1
+                return 200, state.basket_json(), {"ETag": state.etag}
+            case "PUT", "/basket/v1/basket":
+                for item in request_json["items"]:
+                    if item["quantity"] > 0:
+                        state.basket[item["product_uid"]] = (item["quantity"], item["uom"])
+                    else:
+                        state.basket.pop(item["product_uid"], None)
+                state.basket_version += 1
+                return 200, state.basket_json(), {"ETag": state.etag}
+            case "DELETE", "/basket/v1/basket":
+                state.basket.clear()
+                state.basket_version += 1
+                return 200, state.basket_json(), {"ETag": state.etag}
+            case "GET", "/product/v1/product":
+                term = query["filter[keyword]"][0]
+                page_size = int(query.get("page_size", ["10"])[0])
+                return 200, {"products": [
+                    {"product_uid": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{term}/{index}").int % 10 ** 7),
+                     "name": f"{term} {index}", "retail_price": {"price": 1.0 + index}}
+                    for index in range(page_size)
+                ]}, None
+        return 404, {"message": f"No such endpoint {method} {path}"}, None
+
+    def _notion(self, method: str, path: str, query: dict, request_json: dict):
+        state = self.state
+        parts = path.strip("/").split("/")
+        match method, parts:
+            case "POST", ["databases", database_id, "query"]:
+                pages = state.pages_for_database.get(database_id)
+                if pages is None:
+                    return 404, {"message": f"No such database {database_id}"}, None
+                title_filter = request_json.get("filter", {}).get("title")
+                if title_filter is not None:
+                    # The only exact filter the app uses, to find a shopping item by name
+                    pages = [
+                        page for page in pages
+                        if "".join(text["plain_text"] for text in page["properties"]["Grocery"]["title"])
+                        == title_filter["equals"]
+                    ]
+                start = int(request_json.get("start_cursor") or 0)
+                end = start + min(int(request_json.get("page_size", NOTION_MAX_PAGE_SIZE)), NOTION_MAX_PAGE_SIZE)
+                return 200, {
+                    "object": "list",
+                    "results": pages[start:end],
+                    "has_more": end < len(pages),
+                    "next_cursor": str(end) if end < len(pages) else None,
+                }, None
+            case "PATCH", ["pages", page_id]:
+                page = state.page_for_id.get(page_id)
+                if page is None:
+                    return 404, {"message": f"No such page {page_id}"}, None
+                for name, value in request_json.get("properties", {}).items():
+                    if "rich_text" in value:
+                        value = {"rich_text": [{**text, "plain_text": text["text"]["content"]}
+                                               for text in value["rich_text"]]}
+                    page["properties"][name] = value
+                return 200, page, None
+        return 404, {"message": f"No such endpoint {method} {path}"}, None
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class FakeAPIServer:
+    """Serves the fake APIs on a local port from a background thread, while used as a context manager.
+
+    Each response is delayed by `latency_seconds`, and `error_rate` of them are replaced with an `error_status`
+    response."""
+    def __init__(self, shopping_item_db: str, recipe_db: str, latency_seconds: float = 0, error_rate: float = 0,
+                 error_status: int = 503, port: int = 0, seed: int = 0):
+        self.state = FakeAPIState(shopping_item_db=shopping_item_db, recipe_db=recipe_db)
+        handler = type("Handler", (_Handler,), {
+            "state": self.state,
+            "latency_seconds": latency_seconds,
+            "error_rate": error_rate,
+            "error_status": error_status,
+            "rng": random.Random(seed),
+        })
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def load_synthetic_databases(self, number_of_items: int, seed: int = 0):
+        """Fills the Notion databases with `number_of_items` synthetic shopping items, and recipe ingredients needing
+        some of them, starting with an empty basket."""
+        self.state.load(*synthetic_databases(number_of_items, seed=seed))
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def sainsburys_api_url(self) -> str:
+        return self.url + SAINSBURYS_PREFIX
+
+    @property
+    def notion_api_url(self) -> str:
+        return self.url + NOTION_PREFIX
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,63 @@
+"""
+Synthetic Notion pages shaped like the shopping item and recipe ingredient databases, for benchmarks.
+"""
+import random
+import uuid
+
+GROCERIES = ["Onions", "Carrots", "Leeks", "Potatoes", "Tomatoes", "Peppers", "Garlic", "Ginger", "Lemons", "Limes",
+             "Rice", "Pasta", "Lentils", "Chickpeas", "Milk", "Butter", "Eggs", "Cheddar", "Yoghurt", "Bread"]
+VARIETIES = ["Red", "Brown", "White", "Baby", "Large", "Organic", "Cherry", "Smoked", "Fresh", "Frozen"]
+UNITS = [None, "g", "ml", "tins"]
+
+
+def _text(value: str | None) -> list[dict]:
+    return [{"type": "text", "plain_text": value, "text": {"content": value}}] if value is not None else []
+
+
+def shopping_item_page(rng: random.Random, page_id: str | None = None) -> dict:
+    """A shopping item page, mapped to a product about two thirds of the time."""
+    name = f"{rng.choice(VARIETIES)} {rng.choice(GROCERIES).lower()} {rng.randrange(1000)}"
+    mapped = rng.random() < 0.67
+    unit = rng.choice(["Items", "Kilograms"])
+    return {
+        "id": page_id or str(uuid.UUID(int=rng.getrandbits(128))),
+        "last_edited_time": "2024-01-01T00:00:00.000Z",
+        "properties": {
+            "Grocery": {"title": _text(name)},
+            "Unit": {"rich_text": _text(rng.choice(UNITS))},
+            "Manual quantity": {"number": rng.choice([None, None, 1, 2, 0.5, 250])},
+            "Total Needed": {"formula": {"number": rng.choice([0, 0, 1, 2.5, 400])}},
+            "Weekly Item": {"checkbox": rng.random() < 0.1},
+            "Extra Item": {"checkbox": rng.random() < 0.1},
+            "On-demand Item": {"checkbox": rng.random() < 0.05},
+            "Stocked?": {"checkbox": False},
+            "Aisle": {"select": None},
+            "Sainsbury's Item Name": {"rich_text": _text(f"Sainsbury's {name}" if mapped else None)},
+            "Sainsbury's Product UID": {"rich_text": _text(str(rng.randrange(10 ** 7)) if mapped else None)},
+            "Sainsbury's Multiplier": {"number": rng.choice([1, 0.5, 0.001, 0.25, 2]) if mapped else None},
+            "Sainsbury's Unit": {"select": {"name": unit} if mapped else None},
+        },
+    }
+
+
+def recipe_ingredient_page(rng: random.Random, item_page_id: str) -> dict:
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "last_edited_time": "2024-01-01T00:00:00.000Z",
+        "properties": {
+            "Item": {"relation": [{"id": item_page_id}]},
+            "Total Needed": {"formula": {"number": rng.choice([1, 2, 0.5, 100, 250])}},
+        },
+    }
+
+
+def synthetic_databases(number_of_items: int, seed: int = 0) -> tuple[list[dict], list[dict]]:
+    """Shopping item pages along with recipe ingredient pages needing about a third of them."""
+    rng = random.Random(seed)
+    item_pages = [shopping_item_page(rng) for _ in range(number_of_items)]
+    ingredient_pages = [
+        recipe_ingredient_page(rng, page["id"])
+        for page in item_pages
+        if rng.random() < 0.33
+    ]
+    return item_pages, ingredient_pages
@@ -0,0 +1,206 @@
+"""
+Control of an interactive Sainsbury's browser session through Selenium.
+
+Kept apart from the API client so that the Selenium webdriver stack is only imported when a browser is needed.
+"""
+import json
+import os
+import threading
+import time
+from functools import cached_property
+from urllib.parse import quote
+
+import requests
+from selenium import webdriver
+from selenium.common import TimeoutException, NoSuchElementException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+import tracing
+from data_model import ShoppingItem
+from shopping_driver import SainsburysAPIClient, Credentials, search_term_for_item
+
+
+def _trace_commands(driver: webdriver.Remote, tracer: tracing.Tracer):
+    """Records a span for every command the driver sends to the browser (clicks, page loads, scripts, etc.)."""
+    execute = driver.execute
+
+    def traced_execute(driver_command: str, params: dict | None = None):
+        with tracer.span(tracing.BROWSER, driver_command):
+            return execute(driver_command, params)
+
+    driver.execute = traced_execute
+
+
+class SainsburysShoppingDriver:
+    """
+    Provides basic programmatic control of an interactive Sainsbury's browser session.
+
+    Selenium isn't thread safe, so once logged in every use of the browser holds a lock: credentials are refreshed
+    from whichever thread needs them, while the main thread switches between search tabs.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        options = webdriver.FirefoxOptions()
+        # Let search results be preloaded in tabs without switching the user over to them
+        options.set_preference("browser.tabs.loadDivertedInBackground", True)
+        with tracing.span(tracing.BROWSER, "launch Firefox"):
+            self._driver = webdriver.Firefox(options=options)
+        tracer = tracing.current()
+        if tracer is not None:
+            _trace_commands(self._driver, tracer)
+        self._main_window_handle = self._driver.current_window_handle
+        self._prefetched_window_handle_for_search_term: dict[str, str] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._driver.quit()
+
+    def refresh(self):
+        with self._lock:
+            self._driver.refresh()
+
+    @cached_property
+    def api(self) -> SainsburysAPIClient:
+        """A Sainsbury's API Client using credentials from the browser instance, refreshed from it as needed."""
+        return SainsburysAPIClient.from_credentials(self.credentials(), refresh_credentials=self.credentials)
+
+    def credentials(self) -> Credentials:
+        """The credentials of the logged in browser session.
+
+        The site renews its access token in the background, so this picks up the latest token. If even that has
+        expired, a page is loaded in a new tab to have the site renew it, leaving the tab the user is shopping in
+        alone."""
+        with self._lock:
+            credentials = self._scrape_credentials()
+            if credentials.expires_at is not None and credentials.expires_at < time.time():
+                credentials = self._renew_credentials()
+            return credentials
+
+    def _renew_credentials(self) -> Credentials:
+        user_window_handle = self._driver.current_window_handle
+        self._driver.switch_to.new_window("tab")
+        try:
+            self._driver.get("https://www.sainsburys.co.uk/gol-ui/")
+            return self._scrape_credentials()
+        finally:
+            self._driver.close()
+            self._driver.switch_to.window(user_window_handle)
+
+    def _scrape_credentials(self) -> Credentials:
+        oidc_user = json.loads(
+            self._driver.execute_script(
+                "return window.localStorage.getItem('oidc.user:https://account.sainsburys.co.uk:gol');"
+            )
+        )
+        wc_auth_cookie = next(
+            cookie
+            for cookie in self._driver.get_cookies()
+            if cookie["name"].startswith("WC_AUTHENTICATION_")
+        )
+        cookie_jar = requests.cookies.RequestsCookieJar()
+        for cookie in self._driver.get_cookies():
+            cookie_jar.set(name=cookie["name"], value=cookie["value"], domain=cookie["domain"], path=cookie["path"],
+                           expires=cookie.get("expiry"))
+
+        expiry_times = [oidc_user.get("expires_at"), wc_auth_cookie.get("expiry")]
+        return Credentials(
+            access_token=oidc_user["access_token"],
+            wc_auth_token=wc_auth_cookie["value"],
+            cookies=cookie_jar,
+            expires_at=min((time for time in expiry_times if time is not None), default=None),
+        )
+
+    def _accept_cookies(self):
+        cookie_button = WebDriverWait(self._driver, 5).until(
+            EC.presence_of_element_located((By.ID, "onetrust-accept-btn-handler"))
+        )
+        self._driver.execute_script("""document.getElementById("onetrust-accept-btn-handler").click()""")
+        cookie_button.click()
+        WebDriverWait(self._driver, 10).until(EC.invisibility_of_element(cookie_button))
+
+    def login(self):
+        if 'SAINSBURYS_EMAIL' not in os.environ or 'SAINSBURYS_PASSWORD' not in os.environ:
+            print("In order to login automatically, please set the SAINSBURYS_EMAIL and SAINSBURYS_PASSWORD environment variables.")
+        self._driver.get(
+            "https://www.sainsburys.co.uk/webapp/wcs/stores/servlet/LogonView?catalogId=10122&langId=44&storeId=10151&logonCallerId=LogonButton&URL=TopCategoriesDisplayView")
+        assert "Sainsbury's" in self._driver.title
+        self._accept_cookies()
+        WebDriverWait(self._driver, 3).until(
+            EC.presence_of_element_located((By.ID, "username"))
+        ).send_keys(os.environ['SAINSBURYS_EMAIL'])
+        self._driver.find_element(By.ID, "password").send_keys(os.environ['SAINSBURYS_PASSWORD'])
+        self._driver.find_element(By.ID, "password").send_keys(Keys.RETURN)
+        try:
+            # High timeout as might need to wait for user to enter verification code
+            WebDriverWait(self._driver, 300).until(
+                EC.any_of(
+                    EC.presence_of_element_located((By.CLASS_NAME, "loggedOutLink")),
+                    EC.presence_of_element_located((By.CLASS_NAME, "top-right-links--logout"))
+                )
+            )
+        except TimeoutException:
+            print("Did not detect login")
+            self._driver.quit()
+            exit(1)
+
+    def _find_search_bar_element(self) -> WebElement:
+        try:
+            return self._driver.find_element(By.ID, "search")
+        except NoSuchElementException:
+            return self._driver.find_element(By.ID, "search-bar-input")
+
+    def _close_window(self, window_handle: str):
+        with self._lock:
+            current_window_handle = self._driver.current_window_handle
+            self._driver.switch_to.window(window_handle)
+            self._driver.close()
+            if window_handle != current_window_handle:
+                self._driver.switch_to.window(current_window_handle)
+
+    def prefetch_searches(self, items: list[ShoppingItem]):
+        """Starts loading the search results for each of the given items in a background tab.
+
+        Tabs prefetched for any other items are closed. Does *not* wait for results to load."""
+        with self._lock:
+            search_terms = [search_term_for_item(item) for item in items]
+            for search_term, window_handle in list(self._prefetched_window_handle_for_search_term.items()):
+                if search_term not in search_terms:
+                    self._close_window(self._prefetched_window_handle_for_search_term.pop(search_term))
+            for search_term in search_terms:
+                if search_term in self._prefetched_window_handle_for_search_term:
+                    continue
+                window_handles_before = set(self._driver.window_handles)
+                # Unlike driver.get, this returns without waiting for the page to load
+                self._driver.execute_script(
+                    "window.open(arguments[0], '_blank');",
+                    f"https://www.sainsburys.co.uk/gol-ui/SearchResults/{quote(search_term, safe='')}"
+                )
+                new_window_handles = set(self._driver.window_handles) - window_handles_before
+                if len(new_window_handles) == 1:
+                    self._prefetched_window_handle_for_search_term[search_term] = new_window_handles.pop()
+
+    def search_for_item(self, item: ShoppingItem):
+        """Shows the search results for the given shopping item.
+
+        Switches to a prefetched tab if there is one (closing the previous search tab), otherwise enters the name
+        of the item into the search bar and starts the search. Does *not* wait for results to be shown."""
+        with self._lock:
+            search_term = search_term_for_item(item)
+            prefetched_window_handle = self._prefetched_window_handle_for_search_term.pop(search_term, None)
+            if prefetched_window_handle is not None:
+                previous_window_handle = self._driver.current_window_handle
+                self._driver.switch_to.window(prefetched_window_handle)
+                if previous_window_handle != self._main_window_handle:
+                    self._close_window(previous_window_handle)
+                return
+
+            search_bar_element = self._find_search_bar_element()
+            search_bar_element.clear()
+            search_bar_element.send_keys(search_term)
+            search_bar_element.send_keys(Keys.RETURN)
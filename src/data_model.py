@@ -1,5 +1,7 @@
+import math
+from array import array
 from enum import Enum
-from typing import NamedTuple, TypeAlias
+from typing import NamedTuple, TypeAlias, Iterable
 
 
 class TrolleyQuantityUnit(Enum):
@@ -13,6 +15,11 @@ class TrolleyQuantityByItems(NamedTuple):
     def __bool__(self):
         return bool(self.number_of_items)
 
+    def __add__(self, other):
+        if type(other) == TrolleyQuantityByItems:
+            return TrolleyQuantityByItems(number_of_items=self.number_of_items + other.number_of_items)
+        raise TypeError(f"Cannot add a {type(other)} to a TrolleyQuantityByItems")
+
     def __sub__(self, other):
         if type(other) == TrolleyQuantityByItems:
             difference = self.number_of_items - other.number_of_items
@@ -30,6 +37,11 @@ class TrolleyQuantityByWeight(NamedTuple):
     def __bool__(self):
         return bool(self.weight_kg)
 
+    def __add__(self, other):
+        if type(other) == TrolleyQuantityByWeight:
+            return TrolleyQuantityByWeight(weight_kg=self.weight_kg + other.weight_kg)
+        raise TypeError(f"Cannot add a {type(other)} to a TrolleyQuantityByWeight")
+
     def __sub__(self, other):
         if type(other) == TrolleyQuantityByWeight:
             difference = self.weight_kg - other.weight_kg
@@ -50,29 +62,226 @@ class TrolleyItem(NamedTuple):
     quantity: TrolleyQuantity
 
 
+class TrolleyItemChange(NamedTuple):
+    before: TrolleyItem
+    after: TrolleyItem
+
+
+class TrolleyDiff(NamedTuple):
+    """The changes needed to turn one trolley into another."""
+    added: list[TrolleyItem]
+    removed: list[TrolleyItem]
+    changed: list[TrolleyItemChange]
+
+    @property
+    def number_of_changes(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    @property
+    def increases(self) -> list[TrolleyItem]:
+        """The items that were added or increased in quantity, with the quantity of the increase."""
+        return self.added + [
+            change.after._replace(quantity=change.after.quantity - change.before.quantity)
+            if type(change.after.quantity) == type(change.before.quantity)
+            else change.after
+            for change in self.changed
+            if type(change.after.quantity) != type(change.before.quantity) or change.after.quantity > change.before.quantity
+        ]
+
+
+# How a quantity is stored in a trolley's `quantity_kinds` array
+_QUANTITY_KIND_ITEMS = 0
+_QUANTITY_KIND_WEIGHT = 1
+# Weights pass through float arithmetic (multipliers) so are equal if they're within this of each other
+_WEIGHT_TOLERANCE_KG = 1e-6
+
+
+def _packed_quantity(quantity: TrolleyQuantity) -> tuple[int, float]:
+    if isinstance(quantity, TrolleyQuantityByWeight):
+        return _QUANTITY_KIND_WEIGHT, quantity.weight_kg
+    if isinstance(quantity, TrolleyQuantityByItems):
+        return _QUANTITY_KIND_ITEMS, quantity.number_of_items
+    raise TypeError(f"Unexpected quantity type {type(quantity)}")
+
+
+def _unpacked_quantity(kind: int, amount: float) -> TrolleyQuantity:
+    if kind == _QUANTITY_KIND_WEIGHT:
+        return TrolleyQuantityByWeight(weight_kg=amount)
+    return TrolleyQuantityByItems(number_of_items=int(amount))
+
+
 class Trolley:
-    def __init__(self, items: list[TrolleyItem]):
-        self.items = items
+    """The items in a trolley, at most one per id.
+
+    Items are indexed by id, so looking one up, adding to it, changing or removing it doesn't depend on the size of
+    the trolley. Quantities are stored packed in arrays and only built into `TrolleyItem`s when read, so adding to
+    or diffing large trolleys doesn't allocate a new quantity per item."""
+    __slots__ = ("_ids", "_names", "_quantity_kinds", "_quantity_amounts", "_index_for_id")
+
+    def __init__(self, items: Iterable[TrolleyItem] = ()):
+        self._ids: list[str] = []
+        self._names: list[str] = []
+        self._quantity_kinds = array("b")
+        self._quantity_amounts = array("d")
+        self._index_for_id: dict[str, int] = {}
+        for item in items:
+            self.add(item)
+
+    @classmethod
+    def from_items(cls, items: Iterable[TrolleyItem]) -> "Trolley":
+        """Builds a trolley from the given items, combining the quantities of any that share an id."""
+        return cls(items=items)
+
+    @property
+    def items(self) -> list[TrolleyItem]:
+        return list(self)
+
+    def _item_at(self, index: int) -> TrolleyItem:
+        return TrolleyItem(
+            id=self._ids[index],
+            name=self._names[index],
+            quantity=_unpacked_quantity(self._quantity_kinds[index], self._quantity_amounts[index]),
+        )
 
     def __iter__(self):
-        return iter(self.items)
+        return (self._item_at(index) for index in range(len(self._ids)))
 
     def __len__(self):
-        return len(self.items)
+        return len(self._ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._index_for_id
+
+    def get(self, item_id: str) -> TrolleyItem | None:
+        index = self._index_for_id.get(item_id)
+        return None if index is None else self._item_at(index)
+
+    def copy(self) -> "Trolley":
+        trolley = Trolley()
+        trolley._ids = self._ids.copy()
+        trolley._names = self._names.copy()
+        trolley._quantity_kinds = array("b", self._quantity_kinds)
+        trolley._quantity_amounts = array("d", self._quantity_amounts)
+        trolley._index_for_id = self._index_for_id.copy()
+        return trolley
+
+    def _append(self, item_id: str, name: str, kind: int, amount: float):
+        self._index_for_id[item_id] = len(self._ids)
+        self._ids.append(item_id)
+        self._names.append(name)
+        self._quantity_kinds.append(kind)
+        self._quantity_amounts.append(amount)
+
+    def remove(self, item_id: str):
+        """Removes the item with the given id, if it's in the trolley.
+
+        The last item takes the removed item's place, so the order of the remaining items can change."""
+        index = self._index_for_id.pop(item_id, None)
+        if index is None:
+            return
+        last_index = len(self._ids) - 1
+        if index != last_index:
+            self._ids[index] = self._ids[last_index]
+            self._names[index] = self._names[last_index]
+            self._quantity_kinds[index] = self._quantity_kinds[last_index]
+            self._quantity_amounts[index] = self._quantity_amounts[last_index]
+            self._index_for_id[self._ids[index]] = index
+        del self._ids[last_index], self._names[last_index]
+        del self._quantity_kinds[last_index], self._quantity_amounts[last_index]
 
     def items_added(self, since: "Trolley"):
-        old_quantity_for_item_id = {item.id: item.quantity for item in since}
         diff_trolley = []
-        for item in self.items:
-            if item.id in old_quantity_for_item_id:
-                diff_item = TrolleyItem(name=item.name, quantity=item.quantity - old_quantity_for_item_id[item.id],
-                                       id=item.id)
+        for index, item_id in enumerate(self._ids):
+            old_index = since._index_for_id.get(item_id)
+            if old_index is None:
+                diff_trolley.append(self._item_at(index))
+            elif self._quantity_amounts[index] != since._quantity_amounts[old_index] \
+                    or self._quantity_kinds[index] != since._quantity_kinds[old_index]:
+                item = self._item_at(index)
+                diff_item = item._replace(quantity=item.quantity - since._item_at(old_index).quantity)
                 if diff_item.quantity:
                     diff_trolley.append(diff_item)
-            else:
-                diff_trolley.append(item)
         return diff_trolley
 
+    def add(self, item: TrolleyItem):
+        """Adds the quantity of the given item to what's already in the trolley."""
+        kind, amount = _packed_quantity(item.quantity)
+        index = self._index_for_id.get(item.id)
+        if index is None:
+            self._append(item.id, item.name, kind, amount)
+        elif self._quantity_kinds[index] != kind:
+            raise TypeError(f"Cannot add a {type(item.quantity)} to the quantity of {item.id} in the trolley")
+        else:
+            self._quantity_amounts[index] += amount
+
+    def set(self, item: TrolleyItem):
+        """Replaces the quantity of the given item in the trolley, removing it if the quantity is zero."""
+        if not item.quantity:
+            self.remove(item.id)
+            return
+        kind, amount = _packed_quantity(item.quantity)
+        index = self._index_for_id.get(item.id)
+        if index is None:
+            self._append(item.id, item.name, kind, amount)
+        else:
+            self._names[index] = item.name
+            self._quantity_kinds[index] = kind
+            self._quantity_amounts[index] = amount
+
+    def merge(self, other: "Trolley"):
+        """Adds the quantities of all the items in `other` to this trolley."""
+        for item in other:
+            self.add(item)
+
+    def clear(self):
+        self._ids.clear()
+        self._names.clear()
+        del self._quantity_kinds[:], self._quantity_amounts[:]
+        self._index_for_id.clear()
+
+    def _quantity_equal_at(self, index: int, other: "Trolley", other_index: int) -> bool:
+        kind = self._quantity_kinds[index]
+        if kind != other._quantity_kinds[other_index]:
+            return False
+        amount, other_amount = self._quantity_amounts[index], other._quantity_amounts[other_index]
+        if kind == _QUANTITY_KIND_WEIGHT:
+            return math.isclose(amount, other_amount, abs_tol=_WEIGHT_TOLERANCE_KG)
+        return amount == other_amount
+
+    def diff(self, target: "Trolley") -> TrolleyDiff:
+        """Finds the items that need to be added, removed or changed in quantity to turn this trolley into `target`."""
+        added = []
+        changed = []
+        for target_index, item_id in enumerate(target._ids):
+            index = self._index_for_id.get(item_id)
+            if index is None:
+                added.append(target._item_at(target_index))
+            elif not self._quantity_equal_at(index, target, target_index):
+                changed.append(TrolleyItemChange(before=self._item_at(index), after=target._item_at(target_index)))
+        removed = [self._item_at(index) for index, item_id in enumerate(self._ids) if item_id not in target]
+        return TrolleyDiff(added=added, removed=removed, changed=changed)
+
+
+class Product(NamedTuple):
+    """A product that can be added to the trolley, as found by searching."""
+    id: str
+    name: str
+    # Price per item (or per kg for loose items) in pounds, if known
+    price: float | None = None
+
+    def __str__(self):
+        return self.name + (f" (£{self.price:.2f})" if self.price is not None else "")
+
+
+class ProductMapping(NamedTuple):
+    """The product to order for a shopping item, and how much of it to order per unit of the item."""
+    product_id: str
+    product_name: str
+    multiplier: float
+    unit: TrolleyQuantityUnit
+    # The unit of the shopping item's quantity, which the multiplier converts from
+    display_unit: str | None = None
+
 
 class DisplayQuantity(NamedTuple):
     value: int | float
@@ -86,3 +295,22 @@ class ShoppingItem(NamedTuple):
     display_name: str
     display_quantity: DisplayQuantity
     trolley_item: TrolleyItem | None
+    # The id of the page the item came from in the data provider, if any
+    page_id: str | None = None
+
+
+def trolley_for_items(items: Iterable[ShoppingItem]) -> tuple[Trolley, list[ShoppingItem]]:
+    """Builds the trolley of the given items' products, combining the quantities of items that share a product.
+
+    Also returns the items whose product an earlier item needs in a different unit (e.g. by weight rather than by the
+    item), which can't be combined with it so are left to order manually."""
+    trolley = Trolley()
+    mixed_unit_items = []
+    for item in items:
+        if not item.trolley_item:
+            continue
+        try:
+            trolley.add(item.trolley_item)
+        except TypeError:
+            mixed_unit_items.append(item)
+    return trolley, mixed_unit_items
@@ -1,19 +1,164 @@
-import sys
+"""
+Evaluates the arithmetic expressions typed in for ratios, such as `1/3`, `2*400g` or `500g/1kg`.
 
+Expressions are made of numbers, `+ - * /` and brackets, and numbers can be followed by a unit of weight or volume.
+Units cancel out, so `500g/1kg` is 0.5, and adding a weight to a volume is an error. A result that is still a
+quantity, such as `2*400g`, is only accepted when a unit to give it in is asked for, so it's 0.8 in kg. Nothing is
+ever passed to Python's compiler, so any input is safe to evaluate.
+"""
 import re
+from functools import lru_cache
+from typing import Iterable, NamedTuple
 
-_re_math_expression = re.compile(rb'd([\x00-\xFF]+)S\x00')
+# The size of each unit in kilograms or litres, along with what it measures
+_UNITS = {
+    "mg": (0.000001, "weight"),
+    "g": (0.001, "weight"),
+    "kg": (1, "weight"),
+    "ml": (0.001, "volume"),
+    "cl": (0.01, "volume"),
+    "l": (1, "volume"),
+}
+_TOKEN = re.compile(
+    r"(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?P<unit>[a-zA-Z]+)?|(?P<operator>[-+*/()])|(?P<other>\S)")
+CACHE_SIZE = 1024
 
 
-def evaluate_math_expression(expr: str) -> float:
-    try:
-        code = compile(expr, 'userinput', 'eval')
-    except SyntaxError:
-        raise ValueError(f"Malformed expression: {expr}")
-    match = _re_math_expression.fullmatch(code.co_code)
-    if not match:
-        raise ValueError(f"Not a simple algebraic expression: {expr}")
+class _Quantity(NamedTuple):
+    value: float
+    # The power of each kind of unit, e.g. (("weight", 1),) for a weight, or () for a plain number
+    dimensions: tuple[tuple[str, int], ...] = ()
+
+
+def _combine(a: tuple[tuple[str, int], ...], b: tuple[tuple[str, int], ...], sign: int
+             ) -> tuple[tuple[str, int], ...]:
+    if not b:
+        return a
+    powers = dict(a)
+    for dimension, power in b:
+        powers[dimension] = powers.get(dimension, 0) + sign * power
+    return tuple(sorted((dimension, power) for dimension, power in powers.items() if power))
+
+
+class _Parser:
+    """Parses and evaluates an expression by recursive descent over its tokens."""
+    def __init__(self, expression: str):
+        self._expression = expression
+        self._tokens = self._tokenize(expression)
+        self._position = 0
+
+    def _tokenize(self, expression: str) -> list[tuple[str, str | _Quantity]]:
+        tokens = []
+        for number, unit, operator, other in _TOKEN.findall(expression):
+            if operator:
+                tokens.append(("operator", operator))
+            elif number:
+                tokens.append(("number", self._quantity(number, unit or None)))
+            else:
+                raise ValueError(f"Malformed expression: {expression}")
+        return tokens
+
+    def _quantity(self, number: str, unit: str | None) -> _Quantity:
+        value = int(number) if number.isdigit() else float(number)
+        if unit is None:
+            return _Quantity(value)
+        if unit.lower() not in _UNITS:
+            raise ValueError(f"Unknown unit '{unit}' in expression: {self._expression}")
+        size, dimension = _UNITS[unit.lower()]
+        return _Quantity(value * size, ((dimension, 1),))
+
+    def _peek(self) -> str | None:
+        if self._position < len(self._tokens) and self._tokens[self._position][0] == "operator":
+            return self._tokens[self._position][1]
+        return None
+
+    def _next(self) -> tuple[str, str | _Quantity]:
+        if self._position >= len(self._tokens):
+            raise ValueError(f"Malformed expression: {self._expression}")
+        self._position += 1
+        return self._tokens[self._position - 1]
+
+    def parse(self) -> _Quantity:
+        result = self._sum()
+        if self._position != len(self._tokens):
+            raise ValueError(f"Malformed expression: {self._expression}")
+        return result
+
+    def _sum(self) -> _Quantity:
+        result = self._product()
+        while self._peek() in ("+", "-"):
+            operator = self._next()[1]
+            operand = self._product()
+            if operand.dimensions != result.dimensions:
+                raise ValueError(f"Can't {'add' if operator == '+' else 'subtract'} quantities of different units: "
+                                 f"{self._expression}")
+            result = result._replace(
+                value=result.value + operand.value if operator == "+" else result.value - operand.value)
+        return result
+
+    def _product(self) -> _Quantity:
+        result = self._factor()
+        while self._peek() in ("*", "/"):
+            operator = self._next()[1]
+            operand = self._factor()
+            if operator == "*":
+                result = _Quantity(result.value * operand.value, _combine(result.dimensions, operand.dimensions, 1))
+            elif operand.value == 0:
+                raise ValueError(f"Division by zero: {self._expression}")
+            else:
+                result = _Quantity(result.value / operand.value, _combine(result.dimensions, operand.dimensions, -1))
+        return result
+
+    def _factor(self) -> _Quantity:
+        kind, token = self._next()
+        if kind == "number":
+            return token
+        if token in ("+", "-"):
+            operand = self._factor()
+            return operand if token == "+" else operand._replace(value=-operand.value)
+        if token == "(":
+            result = self._sum()
+            if self._next() != ("operator", ")"):
+                raise ValueError(f"Malformed expression: {self._expression}")
+            return result
+        raise ValueError(f"Malformed expression: {self._expression}")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _evaluate(expr: str) -> _Quantity:
     try:
-        return code.co_consts[int.from_bytes(match.group(1), sys.byteorder)]
-    except IndexError:
-        raise ValueError(f"Expression not evaluated as constant: {expr}")
+        return _Parser(expr).parse()
+    except RecursionError:
+        raise ValueError(f"Expression nested too deeply: {expr[:20]}...") from None
+
+
+def _value_in_unit(quantity: _Quantity, unit: str | None, expr: str) -> float:
+    if not quantity.dimensions:
+        return quantity.value
+    if unit is not None:
+        size, dimension = _UNITS[unit.lower()]
+        if quantity.dimensions == ((dimension, 1),):
+            return quantity.value / size
+        raise ValueError(f"Expected a number or a quantity in {unit}: {expr}")
+    raise ValueError(f"Expected a number without units: {expr}")
+
+
+def evaluate_math_expression(expr: str, unit: str | None = None) -> float:
+    """Evaluates an arithmetic expression to a plain number, or if `unit` is given (e.g. "kg"), optionally to a
+    quantity measured like it, which is given in that unit.
+
+    Raises ValueError if the expression isn't valid or its result still has any other units."""
+    return _value_in_unit(_evaluate(expr), unit, expr)
+
+
+def evaluate_math_expressions(exprs: Iterable[str], unit: str | None = None) -> list[float | None]:
+    """Evaluates each of the given expressions like `evaluate_math_expression`, with None for any that aren't valid.
+
+    Repeated expressions are only parsed once."""
+    values = []
+    for expr in exprs:
+        try:
+            values.append(_value_in_unit(_evaluate(expr), unit, expr))
+        except ValueError:
+            values.append(None)
+    return values
@@ -0,0 +1,90 @@
+"""
+Pooled, keep-alive HTTP sessions used by the Sainsbury's and Notion API clients.
+"""
+from typing import NamedTuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+import tracing
+from request_scheduler import RequestScheduler, default_scheduler
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_TIMEOUT_SECONDS = 30
+
+
+class ConnectionStats(NamedTuple):
+    connections_opened: int
+    requests_sent: int
+
+    @property
+    def connections_reused(self) -> int:
+        return self.requests_sent - self.connections_opened
+
+    def __str__(self):
+        return (f"{self.requests_sent} requests over {self.connections_opened} connections "
+                f"({self.connections_reused} reused)")
+
+
+class PooledSession(requests.Session):
+    """A requests Session that keeps a bounded pool of connections alive between requests.
+
+    Requests are paced and retried on 429/5xx responses by a `RequestScheduler` (by default the one shared by all
+    sessions), idempotent requests are retried on connection errors, and every request gets a default timeout
+    unless one is passed explicitly."""
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, max_retries: int = DEFAULT_MAX_RETRIES,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS, keep_alive: bool = True,
+                 scheduler: RequestScheduler | None = None):
+        super().__init__()
+        self.timeout = timeout
+        self.scheduler = scheduler or default_scheduler()
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            # Wait for a free connection rather than opening (and then discarding) an extra one
+            pool_block=True,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=0.5,
+                # Retrying on the response status is left to the scheduler, so it can adapt to it
+                respect_retry_after_header=False,
+            ),
+        )
+        self.mount("https://", self._adapter)
+        self.mount("http://", self._adapter)
+        if not keep_alive:
+            self.headers["Connection"] = "close"
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        tracer = tracing.current()
+        if tracer is None:
+            return self.scheduler.send(method, url, lambda: super(PooledSession, self).request(method, url, **kwargs))
+        return self._traced_request(tracer, method, url, **kwargs)
+
+    def _traced_request(self, tracer: tracing.Tracer, method, url, **kwargs):
+        attempts = 0
+
+        def send():
+            nonlocal attempts
+            attempts += 1
+            return super(PooledSession, self).request(method, url, **kwargs)
+
+        with tracer.span(tracing.HTTP, tracing.http_span_name(method, url)) as details:
+            try:
+                response = self.scheduler.send(method, url, send)
+            finally:
+                details["retries"] = attempts - 1
+            details.update(status=response.status_code, bytes=len(response.content))
+        return response
+
+    def connection_stats(self) -> ConnectionStats:
+        """Counts the connections opened and requests sent so far across all hosts in the pool."""
+        pools = self._adapter.poolmanager.pools
+        host_pools = [pool for pool in map(pools.get, pools.keys()) if pool is not None]
+        return ConnectionStats(
+            connections_opened=sum(pool.num_connections for pool in host_pools),
+            requests_sent=sum(pool.num_requests for pool in host_pools),
+        )
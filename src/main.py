@@ -1,60 +1,479 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from collections.abc import Sized
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Callable, TYPE_CHECKING
+
 import click
-from tqdm import tqdm
 
-from data_model import TrolleyQuantityByItems, TrolleyQuantityUnit, TrolleyQuantityByWeight, ShoppingItem, TrolleyItem
+from data_model import TrolleyQuantityByItems, TrolleyQuantityUnit, TrolleyQuantityByWeight, ShoppingItem, TrolleyItem, \
+    Trolley, Product, ProductMapping, trolley_for_items
 from evaluate_math import evaluate_math_expression
-from notion_data_provider import get_items, store_sainsburys_info_for_item
-from shopping_driver import SainsburysShoppingDriver
+import notion_data_provider
+import tracing
+from notion_mirror import NotionMirror, iter_mirrored_items
+from notion_data_provider import iter_items, trolley_item_for_mapping
+from notion_writer import NotionWriteQueue, AssociationUpdate
+from order_plan import OrderPlan, match_similar_item
+from product_matcher import ProductMatcher, Match, load_product_matcher
+from product_search_cache import ProductSearchCache
+from run_journal import RunJournal, item_key
+from shopping_driver import Credentials, ProductSearches, DEFAULT_MAX_CONCURRENT_REQUESTS
+
+if TYPE_CHECKING:
+    from browser_driver import SainsburysShoppingDriver
+
+MAX_SUGGESTIONS = 5
+# How long to wait for the rest of a key that is sent as several bytes
+KEY_SEQUENCE_TIMEOUT_SECONDS = 0.05
+# How long to hold up an item for its product suggestions, if they haven't arrived yet
+SUGGESTION_WAIT_SECONDS = 1.0
 
 
-def main():
+@click.command()
+@click.option("--concurrency", default=DEFAULT_MAX_CONCURRENT_REQUESTS, show_default=True, type=click.IntRange(min=1),
+              help="Maximum number of items to add to the trolley at once.")
+@click.option("--reconcile", is_flag=True,
+              help="Only change what differs from the current trolley instead of emptying it and adding everything.")
+@click.option("--lookahead", default=2, show_default=True, type=click.IntRange(min=0),
+              help="Number of upcoming manual items to preload search results for in background tabs.")
+@click.option("--mirror", is_flag=True,
+              help="Build the shopping list from a local copy of the Notion databases, only fetching what changed.")
+@click.option("--full-sync", is_flag=True, help="With --mirror, transfer every page again rather than only changes.")
+@click.option("--fresh-login", is_flag=True, help="Log in through the browser even if a saved session is still valid.")
+@click.option("--connection-stats", is_flag=True, help="Report HTTP connection reuse before quitting.")
+@click.option("--resume", is_flag=True,
+              help="Carry on from where the last run stopped, rather than emptying the trolley and starting again.")
+@click.option("--plan", "plan_path", type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help="Order the shopping list saved in this plan (made with plan.py) instead of fetching it.")
+@click.option("--trace", "trace_path", type=click.Path(dir_okay=False, path_type=Path),
+              help="Time every request, browser command and phase, summarising them before quitting and saving them "
+                   "to this file as a Chrome trace.")
+def main(concurrency: int, reconcile: bool, lookahead: int, mirror: bool, full_sync: bool, fresh_login: bool,
+         connection_stats: bool, resume: bool, plan_path: Path | None, trace_path: Path | None):
     click.secho("        Sainsbury's Assistant        ", fg="black", bg=208, bold=False)
-    items = get_items()
+    if trace_path is not None:
+        # Reported on the way out, however the run ends
+        atexit.register(report_trace, tracing.enable(), trace_path)
+    # Only loaded once the command line has been parsed, as encryption is slow to import
+    import session_cache
+    timings = PhaseTimings()
+    run_journal = RunJournal()
+    resumed = run_journal.last_run() if resume else None
+    if resume and (resumed is None or resumed.finished):
+        click.echo("There's no unfinished run to resume, so starting a new one")
+        resumed = None
+    if resumed is not None:
+        click.echo(f"Resuming the last run ({len(resumed.added_keys)} items already added to the trolley, "
+                   f"{len(resumed.handled_keys)} added manually)")
+        reconcile = resumed.reconcile
+        run_journal.resume()
+    else:
+        run_journal.start(reconcile=reconcile)
 
-    with SainsburysShoppingDriver() as driver:
-        click.echo("Logging in...", nl=False)
-        driver.login()
+    items_from_mirror = False
+    if resumed is not None and resumed.items_complete:
+        # The whole list was fetched last time, so there's no need to ask Notion again
+        items = iter(resumed.items)
+    elif plan_path is not None:
+        plan = OrderPlan.load(plan_path)
+        click.echo(f"Ordering the plan made at {plan.created_at.astimezone():%H:%M on %d %b}")
+        items = run_journal.journal_items(plan.items)
+    else:
+        # Items arrive in the background while logging in, and can be ordered as soon as each page arrives
+        items_from_mirror = mirror
+        items = BackgroundIterator(run_journal.journal_items(timings.timed_iter(
+            "Fetch shopping list",
+            iter_mirrored_items(full_sync=full_sync) if mirror else iter_items()
+        )))
 
-        click.echo("\rPress any key when ready to empty trolley and add items", nl=False)
-        click.getchar()
+    # Items without a product are matched against those with one, which are indexed while logging in
+    matcher_loader = ThreadPoolExecutor(max_workers=1)
+    product_matcher = matcher_loader.submit(load_product_matcher, mirror)
+    matcher_loader.shutdown(wait=False)
+    items_matched = []
 
-        driver.api.empty_trolley()
-        items_to_order_manually = automatically_order(driver, items)
+    with LazyBrowser(timings) as browser, NotionWriteQueue() as notion_writes, ProductSearchCache() as search_cache, \
+            run_journal:
+        api = None if fresh_login else session_cache.load_api_client()
+        if api is not None and api.is_authenticated():
+            click.echo("Using saved Sainsbury's session")
+        else:
+            session_cache.clear()
+            api = browser.driver.api
+        # Expired credentials are replaced from the browser (logging in if it hasn't been needed until then)
+        api.refresh_credentials = browser.credentials
+        api.search_cache = search_cache
+        with ProductSearches(api, max_concurrent_requests=concurrency) as product_searches:
+            # Products are searched for as soon as items turn out to need ordering manually
+            if plan_path is None:
+                items = map_similar_items(items, get_matcher=product_matcher.result, matched=items_matched)
+            # A plan's items were matched when it was made, so it's ordered exactly as it was saved
+            items = BackgroundIterator(product_searches.start_for_unmapped(items))
 
-        if items_to_order_manually:
-            print(f"\nPlease manually add the remaining {len(items_to_order_manually)} items:")
+            if resumed is not None and resumed.manual_keys is not None:
+                # Everything that could be was added automatically last time
+                item_for_key = {item_key(item): item for item in items}
+                items_to_order_manually = [item_for_key[key] for key in resumed.manual_keys if key in item_for_key]
+            elif reconcile:
+                click.echo("\rPress any key when ready to update trolley                ", nl=False)
+                with timings.waiting():
+                    click.getchar()
+                with timings.phase("Update trolley"):
+                    items = list(items)
+                    changed_item_ids = None
+                    if items_from_mirror:
+                        with NotionMirror() as notion_mirror:
+                            changed_item_ids = notion_mirror.changed_item_ids()
+                    items_to_order_manually = reconcile_order(api, items, max_concurrent_requests=concurrency,
+                                                              changed_item_ids=changed_item_ids)
+                    if changed_item_ids is not None:
+                        # Items that failed to update are tried again next time
+                        with NotionMirror() as notion_mirror:
+                            notion_mirror.clear_changed_items(
+                                changed_item_ids - {item.page_id for item in items_to_order_manually})
+            else:
+                if resumed is None:
+                    click.echo("\rPress any key when ready to empty trolley and add items", nl=False)
+                else:
+                    click.echo("\rPress any key when ready to add the rest of the items", nl=False)
+                with timings.waiting():
+                    click.getchar()
+                with timings.phase("Add items to trolley"):
+                    if resumed is None:
+                        api.empty_trolley()
+                    else:
+                        trolley = api.trolley
+                        items = (item for item in items if not already_added(item, resumed.added_keys, trolley))
+                    items_to_order_manually = automatically_order(api, items, max_concurrent_requests=concurrency,
+                                                                  on_added=run_journal.record_added)
+            if resumed is None or resumed.manual_keys is None:
+                run_journal.record_manual(items_to_order_manually)
+            if resumed is not None:
+                items_to_order_manually = [
+                    item for item in items_to_order_manually if item_key(item) not in resumed.handled_keys
+                ]
+            timings.report()
+            for item, match in items_matched:
+                click.echo(f"Ordered {item.display_name} like {match.display_name}: {match.mapping.product_name}")
+            browser.refresh()
 
-        for item_index, item in enumerate(items_to_order_manually):
-            driver.search_for_item(item)
-            old_trolley = driver.api.capture_trolley()
+            if items_to_order_manually:
+                with tracing.span(tracing.PHASE, "Order manually"):
+                    order_manually(browser, api, items_to_order_manually, lookahead=lookahead,
+                                   notion_writes=notion_writes, product_searches=product_searches,
+                                   matcher=product_matcher.result(), run_journal=run_journal)
+            run_journal.record_finished()
+            if connection_stats:
+                click.echo(f"Sainsbury's API: {api.connection_stats()}")
+                click.echo(f"Notion API: {notion_data_provider.connection_stats()}")
+            if browser.started:
+                input("Finished list. Press [Enter] to quit")
+            else:
+                click.echo("Finished list.")
+
+
+def order_manually(browser: "LazyBrowser", api, items: list[ShoppingItem], lookahead: int,
+                   notion_writes: NotionWriteQueue, product_searches: ProductSearches, matcher: ProductMatcher,
+                   run_journal: RunJournal):
+    print(f"\nPlease manually add the remaining {len(items)} items:")
+    for item in items:
+        product_searches.start(item)
+    with api.watch_trolley() as watcher:
+        for item_index, item in enumerate(items):
+            browser.driver.search_for_item(item)
+            browser.driver.prefetch_searches(items[item_index + 1:item_index + 1 + lookahead])
+            old_trolley = watcher.trolley
+            watcher.poll_soon()
             click.echo(
-                f"({item_index + 1}/{len(items_to_order_manually)}) "
-                f"Add {item.display_name} ({item.display_quantity}) "
-                f"then press any key to save and continue, [m] to set manual ratio, or [x] to skip saving")
+                f"({item_index + 1}/{len(items)}) "
+                f"Add {item.display_name} ({item.display_quantity}) and it will be saved once it's in the trolley. "
+                f"Press [m] first to set manual ratio, [x] to skip saving, or any other key to save now")
+            suggestions = (product_searches.results(item, timeout=SUGGESTION_WAIT_SECONDS) or [])[:MAX_SUGGESTIONS]
+            if suggestions:
+                click.echo(f"Or press [1-{len(suggestions)}] to add one of:")
+                for number, product in enumerate(suggestions, start=1):
+                    click.echo(f"  [{number}] {product}")
+            similar = (
+                matcher.best_match(item.display_name, item.display_quantity.unit)
+                if item.display_quantity.value > 0 else None
+            )
+            if similar is not None:
+                click.echo(f"Or press [s] to order it like {similar.display_name}: {similar.mapping.product_name}")
 
-            char = click.getchar()
+            get_manual_multiplier = False
+            while True:
+                char, new_items_in_trolley = wait_for_key_or_new_items(watcher, since=old_trolley)
+                if char == "m" and not new_items_in_trolley:
+                    get_manual_multiplier = True
+                    click.echo("Waiting for the item to be added to the trolley...")
+                    continue
+                if char is not None and char.isdigit() and 1 <= int(char) <= len(suggestions) \
+                        and not new_items_in_trolley:
+                    add_suggestion(api, watcher, suggestions[int(char) - 1])
+                    continue
+                break
             click.echo()
 
-            if char != "x":
-                new_items_in_trolley = driver.api.capture_trolley().items_added(since=old_trolley)
+            if char == "s" and similar is not None and not new_items_in_trolley:
+                order_like_similar_item(api, watcher, item, similar, notion_writes=notion_writes, matcher=matcher)
+            elif char != "x":
                 if len(new_items_in_trolley) != 1 or item.display_quantity.value <= 0:
                     click.echo("Found no or multiple new items in trolley so did not record choice")
-                    continue
-
-                new_item_in_trolley = new_items_in_trolley[0]
-                try:
+                else:
                     record_item_association(
-                        get_manual_multiplier=char == "m",
+                        get_manual_multiplier=get_manual_multiplier or char == "m",
                         shopping_item=item,
-                        trolley_item=new_item_in_trolley,
+                        trolley_item=new_items_in_trolley[0],
+                        notion_writes=notion_writes,
+                        matcher=matcher,
                     )
-                except ValueError as e:
-                    print(f"Encountered error when recording item association for: {item.display_name}")
-                    print(e)
-        input("Finished list. Press [Enter] to quit")
+            run_journal.record_handled(item)
+
+
+def order_like_similar_item(api, watcher, item: ShoppingItem, similar: Match, notion_writes: NotionWriteQueue,
+                            matcher: ProductMatcher):
+    """Adds the product of a similarly named item to the trolley, saving it as the item's product too."""
+    trolley_item = trolley_item_for_mapping(similar.mapping, item.display_quantity.value)
+    try:
+        api.add_item(trolley_item)
+    except Exception as e:
+        click.echo(f"Couldn't add {trolley_item.name} ({e}), please add it in the browser instead")
+        return
+    # Make sure the watcher has seen it, so that it isn't taken as the choice for the next item
+    watcher.refresh()
+    click.echo(f"Added '{trolley_item.name}' as for {similar.display_name}")
+    save_product_mapping(item, similar.mapping, notion_writes=notion_writes, matcher=matcher)
+
+
+def add_suggestion(api, watcher, product: Product):
+    """Adds one of the given product to the trolley, leaving the watcher to notice it and save the choice."""
+    try:
+        api.add_item(TrolleyItem(id=product.id, name=product.name, quantity=TrolleyQuantityByItems(1)))
+    except Exception as e:
+        click.echo(f"Couldn't add {product.name} ({e}), please add it in the browser instead")
+        return
+    click.echo(f"Added {product.name}, change the quantity in the browser if needed")
+    watcher.poll_soon()
+
+
+def wait_for_key_or_new_items(watcher, since: Trolley) -> tuple[str | None, list[TrolleyItem]]:
+    """Waits until either a key is pressed or items are added to the trolley.
+
+    Returns the key pressed (or None if items were added first) along with the items added since `since`."""
+    with _unbuffered_stdin():
+        while True:
+            char = _read_key(timeout=0.1)
+            if char is not None:
+                # Check now rather than waiting for the next poll, in case the item has only just been added
+                return char, since.diff(watcher.refresh()).increases
+            try:
+                watcher.diffs.get_nowait()
+            except queue.Empty:
+                continue
+            new_items_in_trolley = since.diff(watcher.trolley).increases
+            if new_items_in_trolley:
+                return None, new_items_in_trolley
+
+
+@contextmanager
+def _unbuffered_stdin():
+    """Makes key presses readable straight away, rather than only once Enter is pressed."""
+    if os.name == "nt" or not sys.stdin.isatty():
+        yield
+        return
+    import termios
+    import tty
+    original_attributes = termios.tcgetattr(sys.stdin)
+    try:
+        tty.setcbreak(sys.stdin)
+        yield
+    finally:
+        termios.tcsetattr(sys.stdin, termios.TCSADRAIN, original_attributes)
+
+
+def _read_key(timeout: float) -> str | None:
+    """Reads a single key press, or returns None if there isn't one within `timeout` seconds.
+
+    Keys that arrive as several bytes, such as arrow keys (escape sequences) and non-ASCII characters (UTF-8), are
+    read whole, so that they count as one key press rather than several."""
+    if os.name == "nt":
+        import msvcrt
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if msvcrt.kbhit():
+                char = msvcrt.getwch()
+                if char in ("\x00", "\xe0"):
+                    # A function or arrow key, which is followed by its scan code
+                    char += msvcrt.getwch()
+                return char
+            time.sleep(0.01)
+        return None
+    import select
+    readable, _, _ = select.select([sys.stdin], [], [], timeout)
+    if not readable:
+        return None
+    fd = sys.stdin.fileno()
+
+    def read_next_byte() -> bytes:
+        # The rest of a key's bytes are sent along with the first, so only wait briefly for them
+        readable, _, _ = select.select([fd], [], [], KEY_SEQUENCE_TIMEOUT_SECONDS)
+        return os.read(fd, 1) if readable else b""
+
+    data = os.read(fd, 1)
+    if not data:
+        # End of input, so no key will ever be pressed
+        time.sleep(timeout)
+        return None
+    if data == b"\x1b":
+        data += read_next_byte()
+        if data == b"\x1b[":
+            # e.g. "\x1b[A" for the up arrow, which ends with a byte from "@" to "~"
+            while byte := read_next_byte():
+                data += byte
+                if 0x40 <= byte[0] <= 0x7e:
+                    break
+        elif data == b"\x1bO":
+            # e.g. "\x1bOP" for F1
+            data += read_next_byte()
+    elif data[0] >= 0xc0:
+        # The first byte of a UTF-8 character says how many bytes follow it
+        length = 2 if data[0] < 0xe0 else 3 if data[0] < 0xf0 else 4
+        while len(data) < length and (byte := read_next_byte()):
+            data += byte
+    return data.decode(errors="replace")
+
+
+class PhaseTimings:
+    """Records how long each phase of a run takes, including phases run in the background."""
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.duration_for_phase = {}
+        self.time_spent_waiting = 0
+
+    @contextmanager
+    def waiting(self):
+        """Excludes the time spent waiting for the user from the total."""
+        start_time = time.perf_counter()
+        try:
+            with tracing.span(tracing.PHASE, "Wait for input"):
+                yield
+        finally:
+            self.time_spent_waiting += time.perf_counter() - start_time
+
+    @contextmanager
+    def phase(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            with tracing.span(tracing.PHASE, name):
+                yield
+        finally:
+            self.duration_for_phase[name] = time.perf_counter() - start_time
 
+    def timed_iter(self, name: str, iterable: Iterable):
+        with self.phase(name):
+            yield from iterable
 
-def record_item_association(get_manual_multiplier: bool, shopping_item: ShoppingItem, trolley_item: TrolleyItem):
+    def report(self):
+        elapsed = time.perf_counter() - self.start_time - self.time_spent_waiting
+        click.echo("\r", nl=False)
+        for name, duration in self.duration_for_phase.items():
+            click.echo(f"{name}: {duration:.1f}s")
+        click.echo(f"Took {elapsed:.1f}s excluding waiting for input "
+                   f"({max(sum(self.duration_for_phase.values()) - elapsed, 0):.1f}s saved by overlapping phases)")
+
+
+def report_trace(tracer: tracing.Tracer, path: Path):
+    click.echo()
+    for line in tracer.summary_lines():
+        click.echo(line)
+    tracer.export_chrome_trace(path)
+    click.echo(f"Saved trace to {path}")
+
+
+class BackgroundIterator:
+    """Consumes an iterable on a background thread, so that its items are ready by the time they're needed.
+
+    Can only be iterated once. Exceptions raised by the iterable are raised again when they are reached."""
+    _END = object()
+
+    def __init__(self, iterable: Iterable):
+        self._queue = queue.Queue()
+        threading.Thread(target=self._consume, args=(iterable,), daemon=True).start()
+
+    def _consume(self, iterable: Iterable):
+        try:
+            for item in iterable:
+                self._queue.put((item, None))
+            self._queue.put((self._END, None))
+        except Exception as e:
+            self._queue.put((self._END, e))
+
+    def __iter__(self) -> Iterator:
+        while True:
+            item, error = self._queue.get()
+            if item is self._END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+
+
+class LazyBrowser:
+    """Starts and logs in to a browser session the first time it is needed, saving the session for later runs.
+
+    It may first be needed on a worker thread, for credentials, so only one thread starts it."""
+    def __init__(self, timings: PhaseTimings):
+        self._timings = timings
+        self._driver = None
+        self._start_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._driver is not None:
+            self._driver.__exit__(exc_type, exc_val, exc_tb)
+
+    @property
+    def started(self) -> bool:
+        return self._driver is not None
+
+    @property
+    def driver(self) -> "SainsburysShoppingDriver":
+        with self._start_lock:
+            if self._driver is None:
+                import session_cache
+                with self._timings.phase("Start browser"):
+                    # Only loaded when a browser is needed, as Selenium is slow to import
+                    from browser_driver import SainsburysShoppingDriver
+                    self._driver = SainsburysShoppingDriver()
+                click.echo("Logging in...", nl=False)
+                with self._timings.phase("Log in"):
+                    self._driver.login()
+                session_cache.save_api_client(self._driver.api)
+            return self._driver
+
+    def credentials(self) -> Credentials:
+        """The browser session's latest credentials, saving them for later runs."""
+        import session_cache
+        credentials = self.driver.credentials()
+        session_cache.save_credentials(credentials)
+        return credentials
+
+    def refresh(self):
+        if self._driver is not None:
+            self._driver.refresh()
+
+
+def record_item_association(get_manual_multiplier: bool, shopping_item: ShoppingItem, trolley_item: TrolleyItem,
+                            notion_writes: NotionWriteQueue, matcher: ProductMatcher):
     if isinstance(trolley_item.quantity, TrolleyQuantityByItems):
         unit = TrolleyQuantityUnit.ITEMS
     elif isinstance(trolley_item.quantity, TrolleyQuantityByWeight):
@@ -69,36 +488,135 @@ def record_item_association(get_manual_multiplier: bool, shopping_item: Shopping
         multiplier = None
         while multiplier is None:
             try:
+                # A weight can be typed in for a ratio in kg (e.g. "2*400g"), but any other units are a mistake
                 multiplier = evaluate_math_expression(click.prompt(
                     f"Detected '{trolley_item.name}' for Notion item '{shopping_item.display_name}'. "
-                    f"Set ratio [{unit_display_name}/{shopping_item.display_quantity.unit or 'item'}]: "))
+                    f"Set ratio [{unit_display_name}/{shopping_item.display_quantity.unit or 'item'}]: "),
+                    unit="kg" if unit == TrolleyQuantityUnit.KILOGRAMS else None)
             except ValueError as e:
                 click.secho(str(e), fg="red")
     click.echo(
         f"Recorded '{trolley_item.name}' ({multiplier} {unit_display_name}/{shopping_item.display_quantity.unit or 'item'})")
-    store_sainsburys_info_for_item(
-        shopping_item.display_name,
+    save_product_mapping(shopping_item, ProductMapping(
+        product_id=trolley_item.id,
+        product_name=trolley_item.name,
         multiplier=multiplier,
-        sainsburys_item_name=trolley_item.name,
-        sainsburys_product_uid=trolley_item.id,
-        unit=unit
-    )
+        unit=unit,
+        display_unit=shopping_item.display_quantity.unit,
+    ), notion_writes=notion_writes, matcher=matcher)
+
+
+def save_product_mapping(shopping_item: ShoppingItem, mapping: ProductMapping, notion_writes: NotionWriteQueue,
+                         matcher: ProductMatcher):
+    notion_writes.put(AssociationUpdate(
+        item_name=shopping_item.display_name,
+        multiplier=mapping.multiplier,
+        sainsburys_item_name=mapping.product_name,
+        sainsburys_product_uid=mapping.product_id,
+        unit=mapping.unit,
+        page_id=shopping_item.page_id,
+    ))
+    # Similarly named items can use the same product from now on
+    matcher.add(shopping_item.display_name, mapping)
+
+
+def map_similar_items(items: Iterable[ShoppingItem], get_matcher: Callable[[], ProductMatcher],
+                      matched: list[tuple[ShoppingItem, Match]]) -> Iterator[ShoppingItem]:
+    """Passes the given items through, giving those without a product the product of a closely matching item.
+
+    Each item given a product is appended to `matched` along with the item it matched."""
+    for item in items:
+        if not item.trolley_item and item.display_quantity.value > 0:
+            item, match = match_similar_item(item, get_matcher())
+            if match is not None:
+                matched.append((item, match))
+        yield item
+
+
+def already_added(item: ShoppingItem, added_keys: set[str], trolley: Trolley) -> bool:
+    """Whether an item was added to the trolley before the last run stopped, going by its journal and the trolley.
 
+    Items the journal says were added are only trusted if their product is still in the trolley, and items it
+    doesn't mention may have been added just before the run stopped, if enough of their product is in the trolley."""
+    if not item.trolley_item:
+        return False
+    in_trolley = trolley.get(item.trolley_item.id)
+    if in_trolley is None:
+        return False
+    if item_key(item) in added_keys:
+        return True
+    return type(in_trolley.quantity) == type(item.trolley_item.quantity) \
+        and in_trolley.quantity >= item.trolley_item.quantity
 
-def automatically_order(driver, items):
-    items_to_order_manually = []
 
+def automatically_order(api, items: Iterable[ShoppingItem], max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS,
+                        on_added: Callable[[ShoppingItem], None] | None = None):
+    received_items = []
+    orderable_item_indices = []
+    failed_item_indices = set()
+
+    from tqdm import tqdm
     print("\rAdding items to trolley...                                    ")
-    for item in tqdm(items):
-        if item.trolley_item:
-            try:
-                driver.api.add_item(item.trolley_item)
-                continue
-            except Exception as e:
-                click.secho(f"Failed to automatically order {item.display_name}: {e}")
-        items_to_order_manually.append(item)
-    driver.refresh()
-    return items_to_order_manually
+    with tqdm(total=len(items) if isinstance(items, Sized) else None) as progress:
+        def trolley_items_to_add():
+            # Items are ordered as they arrive, so the list may still be loading
+            for item in items:
+                received_items.append(item)
+                if item.trolley_item:
+                    orderable_item_indices.append(len(received_items) - 1)
+                    yield item.trolley_item
+                else:
+                    progress.update()
+
+        for orderable_index, error in api.add_items(
+                trolley_items_to_add(),
+                max_concurrent_requests=max_concurrent_requests,
+        ):
+            index = orderable_item_indices[orderable_index]
+            if error is not None:
+                click.secho(f"Failed to automatically order {received_items[index].display_name}: {error}")
+                failed_item_indices.add(index)
+            elif on_added is not None:
+                on_added(received_items[index])
+            progress.update()
+    return [
+        item
+        for index, item in enumerate(received_items)
+        if not item.trolley_item or index in failed_item_indices
+    ]
+
+
+def reconcile_order(api, items, max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS,
+                    changed_item_ids: set[str] | None = None):
+    """Updates the trolley to match the items, returning those left to order manually.
+
+    If the ids of the items that have changed since the trolley was last reconciled are given, the quantities of
+    products for unchanged items are left alone, as they may have been adjusted by hand in the meantime."""
+    target_trolley, mixed_unit_items = trolley_for_items(items)
+    for item in mixed_unit_items:
+        click.secho(f"{item.display_name} needs {item.trolley_item.name} in a different unit to another item, "
+                    f"so it's left to order manually", fg="yellow")
+    diff = api.trolley.diff(target_trolley)
+    if changed_item_ids is not None:
+        changed_product_ids = {item.trolley_item.id for item in items
+                               if item.trolley_item and item.page_id in changed_item_ids}
+        diff = diff._replace(changed=[change for change in diff.changed if change.after.id in changed_product_ids])
+    failed_product_ids = set()
+
+    from tqdm import tqdm
+    print(f"\rUpdating trolley: {len(diff.added)} to add, {len(diff.changed)} to change, "
+          f"{len(diff.removed)} to remove...")
+    with tqdm(total=diff.number_of_changes) as progress:
+        for trolley_item, error in api.apply_trolley_diff(diff, max_concurrent_requests=max_concurrent_requests):
+            if error is not None:
+                click.secho(f"Failed to update {trolley_item.name} in trolley: {error}")
+                failed_product_ids.add(trolley_item.id)
+            progress.update()
+    return [
+        item
+        for item in items
+        if not item.trolley_item or item.trolley_item.id in failed_product_ids or item in mixed_unit_items
+    ]
 
 
 if __name__ == '__main__':
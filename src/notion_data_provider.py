@@ -2,121 +2,357 @@
 A data provider that assumes a certain layout of Notion database
 and uses that as a persistent data store and source of the shopping list.
 """
+import functools
 import math
+import operator
 import os
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Iterable, NamedTuple
 
 import click
-import requests
 
 from data_model import ShoppingItem, TrolleyQuantityUnit, TrolleyItem, TrolleyQuantity, TrolleyQuantityByItems, \
-    TrolleyQuantityByWeight, DisplayQuantity
+    TrolleyQuantityByWeight, DisplayQuantity, ProductMapping
+from http_session import PooledSession, ConnectionStats
+from request_scheduler import default_scheduler, HostLimits
 
-if 'NOTION_SECRET' not in os.environ or 'NOTION_SHOPPING_ITEM_DB' not in os.environ or 'NOTION_RECIPE_DB' not in os.environ:
-    print(
-        "In order to use the Notion data provider for Sainsbury's, please set: \n"
-        "- the NOTION_SECRET environment variable to a secret for a Connection in your Notion workspace "
-        "that has access to your grocery databases, \n"
-        "- the NOTION_SHOPPING_ITEM_DB environment variable to the ID of the Shopping Item database in your Notion "
-        "workspace, \n"
-        "- the NOTION_RECIPE_DB environment variable to the ID of the Recipe database in your Notion workspace.\n"
-        "Note that your databases have to have a very specific structure which is only specified in the source code "
-        "of this app.")
+SETUP_MESSAGE = (
+    "In order to use the Notion data provider for Sainsbury's, please set: \n"
+    "- the NOTION_SECRET environment variable to a secret for a Connection in your Notion workspace "
+    "that has access to your grocery databases, \n"
+    "- the NOTION_SHOPPING_ITEM_DB environment variable to the ID of the Shopping Item database in your Notion "
+    "workspace, \n"
+    "- the NOTION_RECIPE_DB environment variable to the ID of the Recipe database in your Notion workspace.\n"
+    "Note that your databases have to have a very specific structure which is only specified in the source code "
+    "of this app.")
 
-notion_secret = os.environ['NOTION_SECRET']
-notion_shopping_items_db = os.environ['NOTION_SHOPPING_ITEM_DB']
-notion_recipes_db = os.environ['NOTION_RECIPE_DB']
 
+class NotionConfig(NamedTuple):
+    secret: str
+    shopping_item_db: str
+    recipe_db: str
 
-def get_items() -> list[ShoppingItem]:
-    response = requests.post(
-        url=f"https://api.notion.com/v1/databases/{notion_shopping_items_db}/query",
-        headers={
-            "Authorization": f"Bearer {notion_secret}",
-            "Notion-Version": "2022-06-28",
-            "Content-Type": "application/json",
-        },
-        json={
-            "filter": {
-                "and": [
-                    {
-                        "or": [
-                            {
-                                "property": "Total Needed",
-                                "formula": {
-                                    "number": {
-                                        "greater_than": 0
-                                    }
-                                }
-                            },
-                            {
-                                "property": "Weekly Item",
-                                "checkbox": {
-                                    "equals": True
-                                }
-                            },
-                            {
-                                "property": "Extra Item",
-                                "checkbox": {
-                                    "equals": True
-                                }
-                            },
-                            {
-                                "property": "Manual quantity",
-                                "number": {
-                                    "is_not_empty": True
-                                }
-                            },
-                            {
-                                "property": "On-demand Item",
-                                "checkbox": {
-                                    "equals": True
-                                }
-                            }
-                        ]
-                    },
-                    {
-                        "property": "Stocked?",
-                        "checkbox": {
-                            "equals": False
+
+@functools.cache
+def notion_config() -> NotionConfig:
+    """The Notion connection and database ids, read from the environment the first time they're needed."""
+    try:
+        return NotionConfig(
+            secret=os.environ['NOTION_SECRET'],
+            shopping_item_db=os.environ['NOTION_SHOPPING_ITEM_DB'],
+            recipe_db=os.environ['NOTION_RECIPE_DB'],
+        )
+    except KeyError:
+        raise click.ClickException(SETUP_MESSAGE) from None
+
+
+# Where the Notion API is, which can be pointed somewhere else (e.g. a local stand-in for benchmarking)
+NOTION_API_URL = os.environ.get('NOTION_API_URL', "https://api.notion.com/v1").rstrip("/")
+
+SHOPPING_LIST_FILTER = {
+    "and": [
+        {
+            "or": [
+                {
+                    "property": "Total Needed",
+                    "formula": {
+                        "number": {
+                            "greater_than": 0
                         }
                     }
-                ]
-            },
-            "sorts": [
+                },
                 {
-                    "property": "Aisle",
-                    "direction": "ascending"
+                    "property": "Weekly Item",
+                    "checkbox": {
+                        "equals": True
+                    }
                 },
                 {
-                    "property": "Grocery",
-                    "direction": "ascending"
+                    "property": "Extra Item",
+                    "checkbox": {
+                        "equals": True
+                    }
+                },
+                {
+                    "property": "Manual quantity",
+                    "number": {
+                        "is_not_empty": True
+                    }
+                },
+                {
+                    "property": "On-demand Item",
+                    "checkbox": {
+                        "equals": True
+                    }
                 }
             ]
+        },
+        {
+            "property": "Stocked?",
+            "checkbox": {
+                "equals": False
+            }
         }
+    ]
+}
+
+SHOPPING_LIST_SORTS = [
+    {
+        "property": "Aisle",
+        "direction": "ascending"
+    },
+    {
+        "property": "Grocery",
+        "direction": "ascending"
+    }
+]
+
+# Due to notion API limitation
+# Get ingredients with this item
+RECIPE_INGREDIENT_FILTER = {
+    "property": "Total Needed",
+    "formula": {
+        "number": {
+            "greater_than": 0
+        }
+    }
+}
+
+
+def is_on_shopping_list(result: dict) -> bool:
+    """Checks whether a shopping item page matches SHOPPING_LIST_FILTER."""
+    properties = result["properties"]
+    return (
+        (
+            (properties["Total Needed"]["formula"]["number"] or 0) > 0 or
+            properties["Weekly Item"]["checkbox"] or
+            properties["Extra Item"]["checkbox"] or
+            properties["Manual quantity"]["number"] is not None or
+            properties["On-demand Item"]["checkbox"]
+        ) and
+        not properties["Stocked?"]["checkbox"]
     )
 
-    assert response.json()["has_more"] is False
-    results = response.json()["results"]
-    quantity_in_meals_for_item_id = get_quantity_in_meals_for_item_id_dict()
-    shopping_items = [
-        shopping_item_for_result(result, quantity_in_meals_for_item_id)
-        for result
-        in results
-    ]
+
+def is_needed_in_recipes(result: dict) -> bool:
+    """Checks whether a recipe ingredient page matches RECIPE_INGREDIENT_FILTER."""
+    return (result["properties"]["Total Needed"]["formula"]["number"] or 0) > 0
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _notion_session() -> PooledSession:
+    global _session
+    with _session_lock:
+        if _session is None:
+            # Notion allows an average of three requests per second, with some bursts above that
+            default_scheduler().configure_host("api.notion.com", HostLimits(requests_per_second=3, burst=10))
+            _session = PooledSession()
+            _session.headers.update({
+                "Authorization": f"Bearer {notion_config().secret}",
+                "Notion-Version": "2022-06-28",
+                "Content-Type": "application/json",
+            })
+        return _session
+
+
+def connection_stats() -> ConnectionStats:
+    return _notion_session().connection_stats()
+
+
+def get_items() -> list[ShoppingItem]:
+    return list(iter_items())
+
+
+def iter_items() -> Iterator[ShoppingItem]:
+    """Yields the items on the shopping list as each page of results arrives from Notion.
+
+    Items needing a quantity of zero are skipped, with a warning for each page that contains any."""
+    # The recipe totals come from a separate database so can be fetched while the shopping list query runs
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        quantity_in_meals_for_item_id_future = executor.submit(get_quantity_in_meals_for_item_id_dict)
+        for results in _query_shopping_list_pages():
+            yield from shopping_items_for_results(results, quantity_in_meals_for_item_id_future.result())
+
+
+def shopping_items_for_results(results: list[dict], quantity_in_meals_for_item_id: dict[str, float]
+                               ) -> list[ShoppingItem]:
+    """Converts shopping item pages to ShoppingItems, skipping (with a warning) those needing a quantity of zero."""
+    shopping_items = shopping_items_for_results_batch(results, quantity_in_meals_for_item_id)
     zero_quantity_shopping_items = [
         shopping_item.display_name
         for shopping_item in shopping_items
         if shopping_item.display_quantity.value == 0
     ]
     if zero_quantity_shopping_items:
-        click.secho(f"⚠️ The following items have a quantity of 0 and will be skipped: {zero_quantity_shopping_items}", fg="yellow")
-    non_zero_quantity_shopping_items = [
+        click.secho(f"⚠️ The following items have a quantity of 0 and will be skipped: {zero_quantity_shopping_items}", fg="yellow",
+                    err=True)
+    return [
         shopping_item
         for shopping_item in shopping_items
         if not (shopping_item.display_quantity.value == 0)
     ]
 
-    return non_zero_quantity_shopping_items
+
+def query_database_pages(database_id: str, query: dict, filter_properties: list[str] | None = None
+                         ) -> Iterator[list[dict]]:
+    """Yields each page of results for the given database query, following the cursor until there are no more.
+
+    If `filter_properties` (a list of property ids) is given, the results only include those properties. The next
+    page is requested while the current one is being used."""
+    def query_page(start_cursor: str | None) -> dict:
+        response = _notion_session().post(
+            url=f"{NOTION_API_URL}/databases/{database_id}/query",
+            params={"filter_properties": filter_properties} if filter_properties else None,
+            json=query if start_cursor is None else {**query, "start_cursor": start_cursor},
+        )
+        assert response.ok, response.json()
+        return response.json()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        response_json = query_page(start_cursor=None)
+        while True:
+            next_response_future = (
+                executor.submit(query_page, response_json["next_cursor"])
+                if response_json["has_more"]
+                else None
+            )
+            yield response_json["results"]
+            if next_response_future is None:
+                return
+            response_json = next_response_future.result()
+
+
+def _query_shopping_list_pages() -> Iterator[list[dict]]:
+    return query_database_pages(
+        notion_config().shopping_item_db,
+        {
+            "filter": SHOPPING_LIST_FILTER,
+            "sorts": SHOPPING_LIST_SORTS,
+        }
+    )
+
+
+# Codes for the Sainsbury's Unit of each page in the batch columns
+_UNMAPPED = 0
+_ITEMS = 1
+_KILOGRAMS = 2
+_UNIT_CODE_FOR_NAME = {TrolleyQuantityUnit.ITEMS.value: _ITEMS, TrolleyQuantityUnit.KILOGRAMS.value: _KILOGRAMS}
+def shopping_items_for_results_batch(results: list[dict], quantity_in_meals_for_item_id: dict[str, float]
+                                     ) -> list[ShoppingItem]:
+    """Converts shopping item pages to ShoppingItems, giving the same items as `shopping_item_for_result`.
+
+    Each page's properties are read once into flat columns, then the totals, multiplied quantities and rounding
+    are computed a column at a time. Quantities are immutable, so pages needing the same quantity share one."""
+    page_ids = []
+    display_names = []
+    display_units = []
+    manual_quantities = []
+    marked_as_needed = []
+    product_ids = []
+    product_names = []
+    multipliers = array("d")
+    unit_codes = array("b")
+    for result in results:
+        properties = result["properties"]
+        page_ids.append(result["id"])
+        display_names.append(properties["Grocery"]["title"][0]["plain_text"])
+        unit_text = properties["Unit"]["rich_text"]
+        display_units.append(unit_text[0]["plain_text"] if unit_text else None)
+        manual_quantities.append(properties["Manual quantity"]["number"] or 0)
+        marked_as_needed.append(properties["Extra Item"]["checkbox"] or properties["Weekly Item"]["checkbox"]
+                                or properties["On-demand Item"]["checkbox"])
+
+        item_name_text = properties["Sainsbury's Item Name"]["rich_text"]
+        unit_select = properties["Sainsbury's Unit"]["select"]
+        multiplier = properties["Sainsbury's Multiplier"]["number"]
+        product_uid_text = properties["Sainsbury's Product UID"]["rich_text"]
+        if item_name_text and unit_select and multiplier and product_uid_text:
+            assert "name" in unit_select
+            unit_code = _UNIT_CODE_FOR_NAME.get(unit_select["name"])
+            if unit_code is None:
+                raise ValueError(f"Encountered unrecognised Sainsbury's Unit value '{unit_select['name']}'")
+            unit_codes.append(unit_code)
+            multipliers.append(multiplier)
+            product_ids.append(product_uid_text[0]["plain_text"])
+            product_names.append(item_name_text[0]["plain_text"])
+        else:
+            unit_codes.append(_UNMAPPED)
+            multipliers.append(0)
+            product_ids.append(None)
+            product_names.append(None)
+
+    # Totals keep the type Notion gave them (int or float), as they're shown to the user
+    totals = [
+        quantity_in_meals_for_item_id.get(page_id, 0) + manual_quantity
+        for page_id, manual_quantity in zip(page_ids, manual_quantities)
+    ]
+    # Some items will be marked as required without an explicit quantity, use default of 1 unit
+    totals = [1 if total == 0 and needed else total for total, needed in zip(totals, marked_as_needed)]
+    values = array("d", map(operator.mul, totals, multipliers))
+
+    quantity_for_value = {}
+    quantities = []
+    for unit_code, value in zip(unit_codes, values):
+        quantity = quantity_for_value.get((unit_code, value))
+        if quantity is None and unit_code != _UNMAPPED:
+            if unit_code == _KILOGRAMS:
+                quantity = TrolleyQuantityByWeight(weight_kg=value)
+            else:
+                quantity = TrolleyQuantityByItems(number_of_items=_number_of_items_to_order(value))
+            quantity_for_value[unit_code, value] = quantity
+        quantities.append(quantity)
+
+    display_quantity_for_total = {}
+    display_quantities = []
+    for total, display_unit in zip(totals, display_units):
+        # 1 and 1.0 are equal but display differently, so keep them apart
+        key = (type(total), total, display_unit)
+        display_quantity = display_quantity_for_total.get(key)
+        if display_quantity is None:
+            display_quantity = display_quantity_for_total[key] = DisplayQuantity(value=total, unit=display_unit)
+        display_quantities.append(display_quantity)
+
+    return [
+        ShoppingItem(
+            display_name=display_name,
+            display_quantity=display_quantity,
+            trolley_item=None if quantity is None else TrolleyItem(id=product_id, name=product_name, quantity=quantity),
+            page_id=page_id,
+        )
+        for display_name, display_quantity, product_id, product_name, quantity, page_id
+        in zip(display_names, display_quantities, product_ids, product_names, quantities, page_ids)
+    ]
+
+
+def _display_name_for_result(result: dict) -> str:
+    return result["properties"]["Grocery"]["title"][0]["plain_text"]
+
+
+def _display_unit_for_result(result: dict) -> str | None:
+    unit_text = result["properties"]["Unit"]["rich_text"]
+    return unit_text[0]["plain_text"] if unit_text else None
+
+
+def product_mappings_for_results(results: Iterable[dict]) -> Iterator[tuple[str, ProductMapping]]:
+    """Yields the name and product mapping of each of the given shopping item pages that has one."""
+    for result in results:
+        mapping = product_mapping_for_result(result)
+        if mapping is not None and result["properties"]["Grocery"]["title"]:
+            yield _display_name_for_result(result), mapping
+
+
+def iter_product_mappings() -> Iterator[tuple[str, ProductMapping]]:
+    """Yields the name and product mapping of every shopping item that has been mapped to a product."""
+    for results in query_database_pages(
+            notion_config().shopping_item_db,
+            {"filter": {"property": "Sainsbury's Product UID", "rich_text": {"is_not_empty": True}}},
+    ):
+        yield from product_mappings_for_results(results)
 
 
 def shopping_item_for_result(result: dict, quantity_in_meals_for_item_id: dict[str, float]) -> ShoppingItem:
@@ -125,84 +361,89 @@ def shopping_item_for_result(result: dict, quantity_in_meals_for_item_id: dict[s
     if total_needed == 0 and (result["properties"]["Extra Item"]["checkbox"] or result["properties"]["Weekly Item"]["checkbox"] or result["properties"]["On-demand Item"]["checkbox"]):
         # Some items will be marked as required without an explicit quantity, use default of 1 unit
         total_needed = 1
-    unit_string = result["properties"]["Unit"]["rich_text"][0]["plain_text"] if result["properties"]["Unit"][
-        "rich_text"] else None
     return ShoppingItem(
-        display_name=result["properties"]["Grocery"]["title"][0]["plain_text"],
-        display_quantity=DisplayQuantity(value=total_needed, unit=unit_string),
+        display_name=_display_name_for_result(result),
+        display_quantity=DisplayQuantity(value=total_needed, unit=_display_unit_for_result(result)),
         trolley_item=trolley_item_for_result(result, total_needed),
+        page_id=result["id"],
     )
 
 
 def trolley_item_for_result(result: dict, total_needed: float) -> TrolleyItem | None:
+    mapping = product_mapping_for_result(result)
+    if mapping is None:
+        return None
+    return trolley_item_for_mapping(mapping, total_needed)
+
+
+def trolley_item_for_mapping(mapping: ProductMapping, total_needed: float) -> TrolleyItem:
+    return TrolleyItem(
+        id=mapping.product_id,
+        name=mapping.product_name,
+        quantity=trolley_quantity(total_needed, mapping.multiplier, mapping.unit),
+    )
+
+
+def product_mapping_for_result(result: dict) -> ProductMapping | None:
+    """The Sainsbury's product recorded for a shopping item page, if one has been."""
     if (
             result["properties"]["Sainsbury's Item Name"]["rich_text"] and
             result["properties"]["Sainsbury's Unit"]["select"] and
             result["properties"]["Sainsbury's Multiplier"]["number"] and
             result["properties"]["Sainsbury's Product UID"]["rich_text"]
     ):
-        return TrolleyItem(
-            id=result["properties"]["Sainsbury's Product UID"]["rich_text"][0]["plain_text"],
-            name=result["properties"]["Sainsbury's Item Name"]["rich_text"][0]["plain_text"],
-            quantity=trolley_quantity_for_result(result, total_needed)
+        assert "name" in result["properties"]["Sainsbury's Unit"]["select"]
+        unit_name = result["properties"]["Sainsbury's Unit"]["select"]["name"]
+        try:
+            unit = TrolleyQuantityUnit(unit_name)
+        except ValueError:
+            raise ValueError(f"Encountered unrecognised Sainsbury's Unit value '{unit_name}'")
+        return ProductMapping(
+            product_id=result["properties"]["Sainsbury's Product UID"]["rich_text"][0]["plain_text"],
+            product_name=result["properties"]["Sainsbury's Item Name"]["rich_text"][0]["plain_text"],
+            multiplier=result["properties"]["Sainsbury's Multiplier"]["number"],
+            unit=unit,
+            display_unit=_display_unit_for_result(result),
         )
     return None
 
 
 def trolley_quantity_for_result(result: dict, total_needed: float) -> TrolleyQuantity:
-    assert "name" in result["properties"]["Sainsbury's Unit"]["select"]
-    value = total_needed * result["properties"]["Sainsbury's Multiplier"]["number"]
-    match result["properties"]["Sainsbury's Unit"]["select"]["name"]:
-        case "Items":
-            tolerance = 0.2
-            if value != 0 and value <= tolerance:
-                # Make sure we get things that we need even if we don't need much of them
-                value = 1
-            return TrolleyQuantityByItems(number_of_items=math.ceil(value - tolerance))
-        case "Kilograms":
+    mapping = product_mapping_for_result(result)
+    assert mapping is not None
+    return trolley_quantity(total_needed, mapping.multiplier, mapping.unit)
+
+
+# Orders of Items within this of a whole number are rounded down
+_ITEMS_TOLERANCE = 0.2
+
+
+def _number_of_items_to_order(value: float) -> int:
+    """Rounds a quantity of Items up to a whole number (or down, if it's only just over one), but never to zero."""
+    if value != 0 and value <= _ITEMS_TOLERANCE:
+        # Make sure we get things that we need even if we don't need much of them
+        return 1
+    return math.ceil(value - _ITEMS_TOLERANCE)
+
+
+def trolley_quantity(total_needed: float, multiplier: float, unit: TrolleyQuantityUnit) -> TrolleyQuantity:
+    value = total_needed * multiplier
+    match unit:
+        case TrolleyQuantityUnit.ITEMS:
+            return TrolleyQuantityByItems(number_of_items=_number_of_items_to_order(value))
+        case TrolleyQuantityUnit.KILOGRAMS:
             return TrolleyQuantityByWeight(weight_kg=value)
-        case unrecognised_unit:
-            raise ValueError(f"Encountered unrecognised Sainsbury's Unit value '{unrecognised_unit}'")
 
 
 def get_quantity_in_meals_for_item_id_dict() -> dict[str, float]:
-    # Due to notion API limitation
-    # Get ingredients with this item
-    filter = {
-        "property": "Total Needed",
-        "formula": {
-            "number": {
-                "greater_than": 0
-            }
-        }
-    }
-    response = requests.post(
-        url=f"https://api.notion.com/v1/databases/{notion_recipes_db}/query",
-        headers={
-            "Authorization": f"Bearer {notion_secret}",
-            "Notion-Version": "2022-06-28",
-            "Content-Type": "application/json",
-        },
-        json={
-            "filter": filter
-        }
-    )
-    results = response.json()["results"]
-    while response.json()["has_more"]:
-        response = requests.post(
-            url=f"https://api.notion.com/v1/databases/{notion_recipes_db}/query",
-            headers={
-                "Authorization": f"Bearer {notion_secret}",
-                "Notion-Version": "2022-06-28",
-                "Content-Type": "application/json",
-            },
-            json={
-                "filter": filter,
-                "start_cursor": response.json()["next_cursor"]
-            }
-        )
-        results += response.json()["results"]
+    return quantity_in_meals_for_results([
+        result
+        for page in query_database_pages(notion_config().recipe_db, {"filter": RECIPE_INGREDIENT_FILTER})
+        for result in page
+    ])
+
 
+def quantity_in_meals_for_results(results: list[dict]) -> dict[str, float]:
     result_ids = [result["id"] for result in results]
     # Check didn't double count any
     assert len(result_ids) == len(set(result_ids))
@@ -210,24 +451,30 @@ def get_quantity_in_meals_for_item_id_dict() -> dict[str, float]:
     quantity_dict = {}
 
     for result in results:
-        assert len(result["properties"]["Item"]["relation"]) == 1
-        item_id = result["properties"]["Item"]["relation"][0]["id"]
-        if item_id not in quantity_dict:
-            quantity_dict[item_id] = 0
-        quantity_dict[item_id] += result["properties"]["Total Needed"]["formula"]["number"]
+        for item_id, quantity in meal_contributions_for_result(result):
+            if item_id not in quantity_dict:
+                quantity_dict[item_id] = 0
+            quantity_dict[item_id] += quantity
 
     return quantity_dict
 
 
-def store_sainsburys_info_for_item(item_name: str, multiplier: float, sainsburys_item_name: str, sainsburys_product_uid: str,
-                                   unit: TrolleyQuantityUnit):
-    response = requests.post(
-        url=f"https://api.notion.com/v1/databases/{notion_shopping_items_db}/query",
-        headers={
-            "Authorization": f"Bearer {notion_secret}",
-            "Notion-Version": "2022-06-28",
-            "Content-Type": "application/json",
-        },
+def meal_contributions_for_result(result: dict) -> list[tuple[str, float]]:
+    """The quantity of each shopping item that a recipe ingredient page needs.
+
+    An ingredient related to several items needs its total of each of them, as a rollup of it would count."""
+    quantity = result["properties"]["Total Needed"]["formula"]["number"] or 0
+    return [(relation["id"], quantity) for relation in result["properties"]["Item"]["relation"]]
+
+
+class ItemNameLookupError(Exception):
+    """Raised when a shopping item name doesn't identify exactly one page in the database."""
+
+
+def _page_id_for_item_name(item_name: str) -> str:
+    # Only needed for updates without a page id, such as those journaled before items carried theirs
+    response = _notion_session().post(
+        url=f"{NOTION_API_URL}/databases/{notion_config().shopping_item_db}/query",
         json={
             "filter": {
                 "property": "Grocery",
@@ -237,21 +484,25 @@ def store_sainsburys_info_for_item(item_name: str, multiplier: float, sainsburys
             }
         }
     )
-
+    response.raise_for_status()
     assert response.json()["has_more"] is False
-    results = response.json()["results"]
-    if len(results) != 1:
-        raise ValueError(f"Multiple shopping items in database with the name {item_name}")
-
-    item_id = results[0]["id"]
-
-    response = requests.patch(
-        url=f"https://api.notion.com/v1/pages/{item_id}",
-        headers={
-            "Authorization": f"Bearer {notion_secret}",
-            "Notion-Version": "2022-06-28",
-            "Content-Type": "application/json",
-        },
+    page_ids = {result["id"] for result in response.json()["results"]}
+    if not page_ids:
+        raise ItemNameLookupError(f"No shopping item in database with the name {item_name}")
+    if len(page_ids) > 1:
+        raise ItemNameLookupError(f"Multiple shopping items in database with the name {item_name}")
+    return next(iter(page_ids))
+
+
+def store_sainsburys_info_for_item(item_name: str, multiplier: float, sainsburys_item_name: str, sainsburys_product_uid: str,
+                                   unit: TrolleyQuantityUnit, page_id: str | None = None):
+    """Records the Sainsbury's product to order for a shopping item.
+
+    The item's page is found by name if its `page_id` isn't given."""
+    item_id = page_id or _page_id_for_item_name(item_name)
+
+    response = _notion_session().patch(
+        url=f"{NOTION_API_URL}/pages/{item_id}",
         json={
             "properties": {
                 "Sainsbury's Multiplier": {
@@ -285,4 +536,5 @@ def store_sainsburys_info_for_item(item_name: str, multiplier: float, sainsburys
             }
         }
     )
-    assert response.ok, response.json()
+    # Raised rather than asserted so that callers can tell temporary failures (429/5xx) apart
+    response.raise_for_status()
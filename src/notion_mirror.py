@@ -0,0 +1,295 @@
+"""
+A local SQLite mirror of the Notion shopping item and recipe databases, kept up to date incrementally.
+
+Pages are only transferred again when their last_edited_time moves on, with one exception: formula values (such as
+"Total Needed") change without updating last_edited_time when a related page is edited, so each sync also fetches
+just that property of the pages that currently match the shopping list or recipe ingredient filters. That finds
+pages whose formula changed, and pages that started or stopped matching. Pages that are deleted or archived in
+Notion are only removed from the mirror by a full resync.
+"""
+import json
+import sqlite3
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Iterable
+
+from data_model import ShoppingItem, ProductMapping
+from notion_data_provider import query_database_pages, notion_config, \
+    SHOPPING_LIST_FILTER, SHOPPING_LIST_SORTS, RECIPE_INGREDIENT_FILTER, is_on_shopping_list, is_needed_in_recipes, \
+    shopping_items_for_results, meal_contributions_for_result, product_mappings_for_results
+from storage import data_directory
+
+# Notion truncates last_edited_time to the minute, so look back a little further than the last sync
+_LAST_EDITED_TIME_RESOLUTION = timedelta(minutes=1)
+# The only formula the filters and the mirror's users read, whose value changes without last_edited_time moving on
+_FORMULA_PROPERTY = "Total Needed"
+# Version of the mirror's schema (stored as its user_version) from which meal totals are kept
+_MEAL_TOTALS_VERSION = 1
+
+
+def _formula_property_ids(pages: Iterable[str]) -> list[str] | None:
+    """The id of the formula property, read from the first of the given mirrored pages, or None if there isn't one."""
+    for page in pages:
+        property_id = json.loads(page)["properties"].get(_FORMULA_PROPERTY, {}).get("id")
+        # Notion gives property ids URL-encoded, and requests encodes them again
+        return None if property_id is None else [urllib.parse.unquote(property_id)]
+    return None
+
+
+class SyncResult(NamedTuple):
+    changed_page_ids: set[str]
+    removed_page_ids: set[str]
+
+
+class NotionMirror:
+    def __init__(self, path: Path | None = None):
+        self._connection = sqlite3.connect(path or data_directory() / "notion_mirror.sqlite3",
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    page_id TEXT PRIMARY KEY,
+                    database_id TEXT NOT NULL,
+                    page TEXT NOT NULL,
+                    -- Whether the page matched the database's filter when it was last transferred
+                    matches_filter INTEGER NOT NULL,
+                    -- Position in the sorted results of the last sync that transferred the page
+                    position INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS pages_by_database ON pages (database_id, matches_filter, position);
+                CREATE TABLE IF NOT EXISTS syncs (
+                    database_id TEXT PRIMARY KEY,
+                    synced_at TEXT NOT NULL
+                );
+                -- What each recipe ingredient page currently needs of each shopping item
+                CREATE TABLE IF NOT EXISTS meal_contributions (
+                    ingredient_page_id TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    -- Untyped, so that whole numbers from Notion stay integers (they're shown to the user)
+                    quantity NOT NULL,
+                    PRIMARY KEY (ingredient_page_id, item_id)
+                );
+                CREATE INDEX IF NOT EXISTS meal_contributions_by_item ON meal_contributions (item_id);
+                -- The sum of the contributions for each shopping item that needs any
+                CREATE TABLE IF NOT EXISTS meal_totals (
+                    item_id TEXT PRIMARY KEY,
+                    quantity NOT NULL
+                );
+                -- The shopping items whose pages or meal totals have changed since they were last reconciled
+                CREATE TABLE IF NOT EXISTS changed_items (
+                    item_id TEXT PRIMARY KEY
+                );
+            """)
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] < _MEAL_TOTALS_VERSION:
+                # Mirrored before meal totals were kept, so build them from all the mirrored pages
+                self._update_meal_totals(page_id for page_id, in self._connection.execute(
+                    "SELECT page_id FROM pages WHERE database_id = ?", (notion_config().recipe_db,)))
+                self._connection.execute(f"PRAGMA user_version = {_MEAL_TOTALS_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def sync(self, full: bool = False) -> dict[str, SyncResult]:
+        """Brings both databases up to date, returning the changes for each database id.
+
+        A full resync transfers every page and also removes pages that no longer exist in Notion. It happens
+        automatically for a database that has never been synced."""
+        config = notion_config()
+        recipes_sync_result = self._sync_database(
+            config.recipe_db, RECIPE_INGREDIENT_FILTER, is_needed_in_recipes, [], full)
+        with self._connection:
+            self._update_meal_totals(recipes_sync_result.changed_page_ids | recipes_sync_result.removed_page_ids)
+        shopping_items_sync_result = self._sync_database(
+            config.shopping_item_db, SHOPPING_LIST_FILTER, is_on_shopping_list, SHOPPING_LIST_SORTS, full)
+        with self._connection:
+            self._record_changed_items(shopping_items_sync_result.changed_page_ids)
+        return {
+            config.shopping_item_db: shopping_items_sync_result,
+            config.recipe_db: recipes_sync_result,
+        }
+
+    def _update_meal_totals(self, ingredient_page_ids: Iterable[str]):
+        """Replaces the contributions of the given recipe ingredient pages, re-summing only the items they affect.
+
+        Must be called within a transaction."""
+        affected_item_ids = set()
+        for ingredient_page_id in ingredient_page_ids:
+            row = self._connection.execute(
+                "SELECT page, matches_filter FROM pages WHERE page_id = ?", (ingredient_page_id,)
+            ).fetchone()
+            # Pages that have been removed or no longer match the filter don't need anything
+            contributions = meal_contributions_for_result(json.loads(row[0])) if row and row[1] else []
+            previous_contributions = self._connection.execute(
+                "SELECT item_id, quantity FROM meal_contributions WHERE ingredient_page_id = ?", (ingredient_page_id,)
+            ).fetchall()
+            if sorted(contributions) == sorted(previous_contributions):
+                continue
+            affected_item_ids.update(item_id for item_id, _ in previous_contributions)
+            affected_item_ids.update(item_id for item_id, _ in contributions)
+            self._connection.execute("DELETE FROM meal_contributions WHERE ingredient_page_id = ?",
+                                     (ingredient_page_id,))
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO meal_contributions (ingredient_page_id, item_id, quantity) VALUES (?, ?, ?)",
+                ((ingredient_page_id, item_id, quantity) for item_id, quantity in contributions)
+            )
+
+        changed_item_ids = set()
+        for item_id in affected_item_ids:
+            previous_total = self._connection.execute(
+                "SELECT quantity FROM meal_totals WHERE item_id = ?", (item_id,)).fetchone()
+            total = self._connection.execute(
+                "SELECT SUM(quantity) FROM meal_contributions WHERE item_id = ?", (item_id,)).fetchone()
+            previous_total = previous_total[0] if previous_total else None
+            total = total[0] if total[0] else None
+            if total == previous_total:
+                continue
+            changed_item_ids.add(item_id)
+            if total is None:
+                self._connection.execute("DELETE FROM meal_totals WHERE item_id = ?", (item_id,))
+            else:
+                self._connection.execute("INSERT OR REPLACE INTO meal_totals (item_id, quantity) VALUES (?, ?)",
+                                         (item_id, total))
+        self._record_changed_items(changed_item_ids)
+
+    def _record_changed_items(self, item_ids: Iterable[str]):
+        self._connection.executemany("INSERT OR IGNORE INTO changed_items (item_id) VALUES (?)",
+                                     ((item_id,) for item_id in item_ids))
+
+    def _sync_database(self, database_id: str, query_filter: dict, matches_filter: Callable[[dict], bool],
+                       sorts: list[dict], full: bool) -> SyncResult:
+        sync_started_at = datetime.now(timezone.utc)
+        synced_at = self._connection.execute(
+            "SELECT synced_at FROM syncs WHERE database_id = ?", (database_id,)
+        ).fetchone()
+        previous_page_for_id = dict(self._connection.execute(
+            "SELECT page_id, page FROM pages WHERE database_id = ?", (database_id,)
+        ))
+        previously_matching_page_ids = {
+            page_id
+            for page_id, in self._connection.execute(
+                "SELECT page_id FROM pages WHERE database_id = ? AND matches_filter", (database_id,)
+            )
+        }
+        updated_pages = None
+        if not full and synced_at is not None:
+            updated_pages = self._updated_pages(database_id, query_filter, sorts, datetime.fromisoformat(synced_at[0]),
+                                                previous_page_for_id)
+        full = updated_pages is None
+        if full:
+            updated_pages = [
+                result
+                for results in query_database_pages(database_id, {"sorts": sorts} if sorts else {})
+                for result in results
+            ]
+
+        transferred_page_ids = set()
+        changed_page_ids = set()
+        with self._connection:
+            for position, result in enumerate(updated_pages):
+                page = json.dumps(result, sort_keys=True)
+                transferred_page_ids.add(result["id"])
+                if previous_page_for_id.get(result["id"]) != page:
+                    changed_page_ids.add(result["id"])
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO pages (page_id, database_id, page, matches_filter, position) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (result["id"], database_id, page, matches_filter(result), position)
+                )
+
+            if full:
+                removed_page_ids = previous_page_for_id.keys() - transferred_page_ids
+                self._connection.executemany("DELETE FROM pages WHERE page_id = ?",
+                                             ((page_id,) for page_id in removed_page_ids))
+            else:
+                removed_page_ids = set()
+                # Anything that matched before but wasn't returned by either query must no longer match
+                no_longer_matching_page_ids = previously_matching_page_ids - transferred_page_ids
+                changed_page_ids |= no_longer_matching_page_ids
+                self._connection.executemany("UPDATE pages SET matches_filter = 0 WHERE page_id = ?",
+                                             ((page_id,) for page_id in no_longer_matching_page_ids))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO syncs (database_id, synced_at) VALUES (?, ?)",
+                (database_id, sync_started_at.isoformat())
+            )
+        return SyncResult(changed_page_ids=changed_page_ids, removed_page_ids=removed_page_ids)
+
+    def _updated_pages(self, database_id: str, query_filter: dict, sorts: list[dict], synced_at: datetime,
+                       previous_page_for_id: dict[str, str]) -> list[dict] | None:
+        """Fetches the pages edited since the last sync, along with the current formula values of the pages that
+        match the filter, merged into their mirrored copies.
+
+        The matching pages come first, in sorted order. Returns None if a matching page isn't in the mirror, as only
+        a full sync can fetch it."""
+        edited_page_for_id = {
+            result["id"]: result
+            for results in query_database_pages(database_id, {
+                "filter": {
+                    "timestamp": "last_edited_time",
+                    "last_edited_time": {"on_or_after": (synced_at - _LAST_EDITED_TIME_RESOLUTION).isoformat()},
+                },
+            })
+            for result in results
+        }
+        formula_property_ids = _formula_property_ids(previous_page_for_id.values())
+        pages = []
+        for results in query_database_pages(database_id, {"filter": query_filter, **({"sorts": sorts} if sorts else {})},
+                                            filter_properties=formula_property_ids):
+            for result in results:
+                page = edited_page_for_id.pop(result["id"], None)
+                if page is None and formula_property_ids is None:
+                    # The whole page was returned
+                    page = result
+                elif page is None:
+                    if result["id"] not in previous_page_for_id:
+                        return None
+                    page = json.loads(previous_page_for_id[result["id"]])
+                    page["properties"].update(result["properties"])
+                pages.append(page)
+        return pages + list(edited_page_for_id.values())
+
+    def pages(self, database_id: str, matching_filter_only: bool = False) -> Iterator[dict]:
+        """Yields the mirrored pages of a database, in the order of the last sync."""
+        for page, in self._connection.execute(
+                "SELECT page FROM pages WHERE database_id = ? AND (matches_filter OR NOT ?) ORDER BY position",
+                (database_id, matching_filter_only)
+        ):
+            yield json.loads(page)
+
+    def get_quantity_in_meals_for_item_id_dict(self) -> dict[str, float]:
+        return dict(self._connection.execute("SELECT item_id, quantity FROM meal_totals"))
+
+    def changed_item_ids(self) -> set[str]:
+        """The ids of the shopping items whose pages or quantities needed in meals have changed since they were last
+        passed to `clear_changed_items`."""
+        return {item_id for item_id, in self._connection.execute("SELECT item_id FROM changed_items")}
+
+    def clear_changed_items(self, item_ids: Iterable[str]):
+        """Records that the given items' changes have been reconciled with the trolley."""
+        with self._connection:
+            self._connection.executemany("DELETE FROM changed_items WHERE item_id = ?",
+                                         ((item_id,) for item_id in item_ids))
+
+    def product_mappings(self) -> Iterator[tuple[str, ProductMapping]]:
+        """Yields the name and product mapping of every mirrored shopping item that has one."""
+        return product_mappings_for_results(self.pages(notion_config().shopping_item_db))
+
+    def get_items(self) -> list[ShoppingItem]:
+        """Builds the shopping list from the mirrored pages, without any requests to Notion."""
+        return shopping_items_for_results(
+            list(self.pages(notion_config().shopping_item_db, matching_filter_only=True)),
+            self.get_quantity_in_meals_for_item_id_dict(),
+        )
+
+
+def iter_mirrored_items(full_sync: bool) -> Iterator[ShoppingItem]:
+    """Brings the mirror up to date and yields the shopping list from it."""
+    with NotionMirror() as notion_mirror:
+        notion_mirror.sync(full=full_sync)
+        yield from notion_mirror.get_items()
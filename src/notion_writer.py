@@ -0,0 +1,197 @@
+"""
+A write-behind queue for shopping item updates, so that recording an association doesn't wait on Notion.
+
+Each update is appended to a journal before it is queued and is only marked as done once Notion has accepted it,
+so updates still pending when the app stops (or crashes) are sent the next time a queue is opened.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import click
+
+from data_model import TrolleyQuantityUnit
+from notion_data_provider import store_sainsburys_info_for_item, ItemNameLookupError
+from storage import data_directory
+
+# How long closing waits for queued updates to be sent before leaving them in the journal for next time
+DEFAULT_CLOSE_TIMEOUT_SECONDS = 30.0
+
+
+class AssociationUpdate(NamedTuple):
+    item_name: str
+    multiplier: float
+    sainsburys_item_name: str
+    sainsburys_product_uid: str
+    unit: TrolleyQuantityUnit
+    page_id: str | None = None
+
+    @property
+    def key(self) -> str:
+        return self.page_id or self.item_name
+
+    def to_json(self) -> dict:
+        return {**self._asdict(), "unit": self.unit.value}
+
+    @classmethod
+    def from_json(cls, value: dict) -> "AssociationUpdate":
+        return cls(**{**value, "unit": TrolleyQuantityUnit(value["unit"])})
+
+
+def _store(update: AssociationUpdate):
+    store_sainsburys_info_for_item(
+        update.item_name,
+        multiplier=update.multiplier,
+        sainsburys_item_name=update.sainsburys_item_name,
+        sainsburys_product_uid=update.sainsburys_product_uid,
+        unit=update.unit,
+        page_id=update.page_id,
+    )
+
+
+class NotionWriteQueue:
+    """Sends association updates to Notion on a background thread.
+
+    Repeated updates to the same item that haven't been sent yet are coalesced, keeping only the latest."""
+    def __init__(self, journal_path: Path | None = None, write: Callable[[AssociationUpdate], None] = _store,
+                 close_timeout: float = DEFAULT_CLOSE_TIMEOUT_SECONDS):
+        self._journal_path = journal_path or data_directory() / "notion_writes.jsonl"
+        self._write = write
+        self._close_timeout = close_timeout
+        self._condition = threading.Condition()
+        # Pending updates by item, along with their sequence number in the journal
+        self._pending: dict[str, tuple[int, AssociationUpdate]] = {}
+        # Updates that kept failing, which are left in the journal to be sent next time
+        self._failed: dict[str, tuple[int, AssociationUpdate]] = {}
+        self._in_flight = 0
+        self._next_sequence_number = 0
+        self._closed = False
+
+        self._journal = open(self._journal_path, "a+", encoding="utf-8")
+        for sequence_number, update in self._unfinished_journal_entries():
+            self._pending[update.key] = (sequence_number, update)
+            self._next_sequence_number = sequence_number + 1
+        if self._pending:
+            click.echo(f"Resending {len(self._pending)} item associations that weren't saved to Notion last time")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _unfinished_journal_entries(self) -> list[tuple[int, AssociationUpdate]]:
+        self._journal.seek(0)
+        lines = self._journal.read().splitlines(keepends=True)
+        if lines and not lines[-1].endswith("\n"):
+            # A partially written final line from a crash, which would corrupt the next entry appended after it
+            torn_line = lines.pop()
+            self._journal.truncate(self._journal.tell() - len(torn_line.encode("utf-8")))
+        update_for_sequence_number = {}
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry["type"] == "update":
+                update_for_sequence_number[entry["sequence_number"]] = AssociationUpdate.from_json(entry["update"])
+            else:
+                update_for_sequence_number.pop(entry["sequence_number"], None)
+        return sorted(update_for_sequence_number.items())
+
+    def _append_to_journal(self, entry: dict):
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def put(self, update: AssociationUpdate):
+        """Queues an update to be sent to Notion, returning once it's safely in the journal."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot queue updates on a closed NotionWriteQueue")
+            sequence_number = self._next_sequence_number
+            self._next_sequence_number += 1
+            self._append_to_journal({"type": "update", "sequence_number": sequence_number,
+                                     "update": update.to_json()})
+            superseded = self._pending.get(update.key) or self._failed.pop(update.key, None)
+            if superseded is not None:
+                self._append_to_journal({"type": "done", "sequence_number": superseded[0]})
+            self._pending[update.key] = (sequence_number, update)
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending) + self._in_flight
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits for all queued updates to be sent, returning whether they were."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._in_flight, timeout=timeout)
+
+    def close(self):
+        """Sends any queued updates and stops the background thread.
+
+        Updates that can't be sent, or aren't sent within the close timeout, stay in the journal for next time."""
+        with self._condition:
+            if self._pending or self._in_flight:
+                click.echo(f"Saving {len(self._pending) + self._in_flight} item associations to Notion...")
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(self._close_timeout)
+        with self._condition:
+            if self._thread.is_alive():
+                click.secho(f"\nGave up waiting for Notion, {len(self._pending) + self._in_flight} item associations "
+                            f"will be saved next time", fg="red")
+            elif not self._pending and not self._failed:
+                # Everything has been sent, so the journal can start again from empty
+                self._journal.truncate(0)
+            self._journal.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending or self._journal.closed:
+                    return
+                key = next(iter(self._pending))
+                sequence_number, update = self._pending.pop(key)
+                self._in_flight += 1
+
+            done = self._send(update)
+
+            with self._condition:
+                self._in_flight -= 1
+                if self._journal.closed:
+                    # Closing gave up waiting, so the update is left in the journal whether or not it was sent
+                    return
+                if done:
+                    self._append_to_journal({"type": "done", "sequence_number": sequence_number})
+                elif key not in self._pending:
+                    # Keep it for next time, unless a newer update has replaced it in the meantime
+                    self._failed[key] = (sequence_number, update)
+                else:
+                    self._append_to_journal({"type": "done", "sequence_number": sequence_number})
+                self._condition.notify_all()
+
+    def _send(self, update: AssociationUpdate) -> bool:
+        """Sends an update, returning False if it should be tried again next time.
+
+        Throttled and transiently failed requests have already been retried by the Notion session, so failures aren't
+        retried again here."""
+        try:
+            self._write(update)
+            return True
+        except ItemNameLookupError as e:
+            # The shopping list itself is wrong (e.g. two items with the same name), so it can never succeed
+            click.secho(f"\nFailed to save '{update.sainsburys_item_name}' for {update.item_name} to Notion: {e}",
+                        fg="red")
+            return True
+        except Exception as e:
+            # e.g. an expired secret or Notion being down, which may well work next time
+            click.secho(f"\nCould not save '{update.sainsburys_item_name}' for {update.item_name} to Notion, "
+                        f"will try again next time: {e}", fg="red")
+            return False
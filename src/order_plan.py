@@ -0,0 +1,146 @@
+"""
+A plan of what an order run will do, worked out from the shopping list alone: the product and quantity to add to
+the trolley for each item, and the items that will be left to order manually.
+
+Plans can be saved as JSON and carried out later by passing them to main with --plan.
+"""
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+from data_model import ShoppingItem, Trolley, TrolleyItem, TrolleyQuantity, TrolleyQuantityByWeight, trolley_for_items
+from notion_data_provider import trolley_item_for_mapping
+from product_matcher import ProductMatcher, Match, AUTO_APPLY_SCORE
+from run_journal import item_key, shopping_item_to_json, shopping_item_from_json
+
+_FORMAT_VERSION = 1
+
+
+def match_similar_item(item: ShoppingItem, matcher: ProductMatcher) -> tuple[ShoppingItem, Match | None]:
+    """Gives an item without a product the product of a closely matching item, if there is one.
+
+    Returns the item (with its product if it was given one) along with the item it matched."""
+    if item.trolley_item or item.display_quantity.value <= 0:
+        return item, None
+    match = matcher.best_match(item.display_name, item.display_quantity.unit, min_score=AUTO_APPLY_SCORE)
+    if match is None:
+        return item, None
+    return item._replace(trolley_item=trolley_item_for_mapping(match.mapping, item.display_quantity.value)), match
+
+
+def _display_trolley_quantity(quantity: TrolleyQuantity) -> str:
+    if isinstance(quantity, TrolleyQuantityByWeight):
+        return f"{quantity.weight_kg:g}kg"
+    return f"x{quantity.number_of_items}"
+
+
+class OrderPlan(NamedTuple):
+    # The shopping list, with the product to add for each item that can be added automatically
+    items: list[ShoppingItem]
+    # The names of the items whose products were given to other items, by the key of the item given it
+    similar_item_name_for_key: dict[str, str]
+    created_at: datetime
+
+    @property
+    def automatic_items(self) -> list[ShoppingItem]:
+        mixed_unit_items = trolley_for_items(self.items)[1]
+        return [item for item in self.items if item.trolley_item and item not in mixed_unit_items]
+
+    @property
+    def manual_items(self) -> list[ShoppingItem]:
+        """The items without a product, and those whose product an earlier item needs in a different unit."""
+        mixed_unit_items = trolley_for_items(self.items)[1]
+        return [item for item in self.items if not item.trolley_item or item in mixed_unit_items]
+
+    @property
+    def trolley(self) -> Trolley:
+        """The trolley that adding the automatic items to an empty trolley gives."""
+        return trolley_for_items(self.items)[0]
+
+    def trolley_operations(self, current_trolley: Trolley | None = None) -> list[dict]:
+        """The operations that ordering the plan performs on the trolley.
+
+        That's emptying it and then adding each product once, with the quantities of the items that share it combined,
+        or when reconciling with `current_trolley`, only the additions, changes and removals needed to update it."""
+        item_names_for_product_id = defaultdict(list)
+        for item in self.automatic_items:
+            item_names_for_product_id[item.trolley_item.id].append(item.display_name)
+
+        def operation(name: str, trolley_item: TrolleyItem) -> dict:
+            return {
+                "operation": name,
+                "product_id": trolley_item.id,
+                "product_name": trolley_item.name,
+                "quantity": trolley_item.quantity._asdict(),
+                "for": item_names_for_product_id.get(trolley_item.id, []),
+            }
+
+        if current_trolley is None:
+            return [{"operation": "empty"}] + [operation("add", trolley_item) for trolley_item in self.trolley]
+        diff = current_trolley.diff(self.trolley)
+        return [operation("add", trolley_item) for trolley_item in diff.added] + \
+            [operation("set", change.after) for change in diff.changed] + \
+            [operation("remove", trolley_item) for trolley_item in diff.removed]
+
+    def to_json(self, current_trolley: Trolley | None = None) -> dict:
+        return {
+            "version": _FORMAT_VERSION,
+            "created_at": self.created_at.isoformat(),
+            "items": [shopping_item_to_json(item) for item in self.items],
+            "similar_item_name_for_key": self.similar_item_name_for_key,
+            # Summaries for reading the plan, which aren't read back as they follow from the items
+            "trolley_operations": self.trolley_operations(current_trolley),
+            "manual": [item.display_name for item in self.manual_items],
+        }
+
+    @classmethod
+    def from_json(cls, value: dict) -> "OrderPlan":
+        if value.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported plan version: {value.get('version')}")
+        return cls(
+            items=[shopping_item_from_json(item) for item in value["items"]],
+            similar_item_name_for_key=value["similar_item_name_for_key"],
+            created_at=datetime.fromisoformat(value["created_at"]),
+        )
+
+    def save(self, path: Path, current_trolley: Trolley | None = None):
+        path.write_text(json.dumps(self.to_json(current_trolley), indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "OrderPlan":
+        return cls.from_json(json.loads(path.read_text(encoding="utf-8")))
+
+    def table_lines(self) -> Iterator[str]:
+        automatic_items = self.automatic_items
+        manual_items = self.manual_items
+        name_width = max((len(item.display_name) for item in self.items), default=0)
+        quantity_width = max((len(str(item.display_quantity)) for item in self.items), default=0)
+        yield f"Add to trolley ({len(automatic_items)}):"
+        for item in automatic_items:
+            similar_item_name = self.similar_item_name_for_key.get(item_key(item))
+            yield f"  {item.display_name:{name_width}}  {str(item.display_quantity):{quantity_width}}  " \
+                  f"{_display_trolley_quantity(item.trolley_item.quantity):>8}  {item.trolley_item.name}" \
+                  + (f" (like {similar_item_name})" if similar_item_name else "")
+        yield f"Order manually ({len(manual_items)}):"
+        for item in manual_items:
+            yield f"  {item.display_name:{name_width}}  {str(item.display_quantity):{quantity_width}}"
+
+
+def build_plan(items: Iterable[ShoppingItem], matcher: ProductMatcher | None = None) -> OrderPlan:
+    """Plans the order of the given shopping list, giving unmapped items the products of similar items if a
+    matcher is given."""
+    planned_items = []
+    similar_item_name_for_key = {}
+    for item in items:
+        if matcher is not None:
+            item, match = match_similar_item(item, matcher)
+            if match is not None:
+                similar_item_name_for_key[item_key(item)] = match.display_name
+        planned_items.append(item)
+    return OrderPlan(
+        items=planned_items,
+        similar_item_name_for_key=similar_item_name_for_key,
+        created_at=datetime.now(timezone.utc),
+    )
@@ -0,0 +1,70 @@
+"""
+Works out what an order run would do, without starting a browser or changing the trolley.
+
+Run with: python src/plan.py [--mirror | --offline] [--reconcile] [--format table|json] [--output plan.json]
+A saved plan can then be ordered with: python src/main.py --plan plan.json [--reconcile]
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+
+from notion_data_provider import iter_items
+from notion_mirror import NotionMirror, iter_mirrored_items
+from order_plan import OrderPlan, build_plan
+from product_matcher import ProductMatcher, load_product_matcher
+
+
+def _offline_plan() -> OrderPlan:
+    """Plans from the local copy of the Notion databases as it is, without any requests."""
+    with NotionMirror() as notion_mirror:
+        return build_plan(notion_mirror.get_items(), matcher=ProductMatcher(notion_mirror.product_mappings()))
+
+
+@click.command()
+@click.option("--mirror", is_flag=True,
+              help="Bring the local copy of the Notion databases up to date and plan from it, only fetching what "
+                   "changed.")
+@click.option("--offline", is_flag=True,
+              help="Plan from the local copy of the Notion databases as it is, without fetching anything.")
+@click.option("--reconcile", is_flag=True,
+              help="Plan the changes to the trolley as it is now, using the saved Sainsbury's session, rather than "
+                   "emptying it first.")
+@click.option("--format", "output_format", type=click.Choice(["table", "json"]), default="table",
+              show_default=True)
+@click.option("--output", type=click.Path(dir_okay=False, path_type=Path),
+              help="Save the plan to this file, to be ordered later with main.py --plan.")
+def plan(mirror: bool, offline: bool, reconcile: bool, output_format: str, output: Path | None):
+    start_time = time.perf_counter()
+    current_trolley = None
+    if reconcile:
+        import session_cache
+        api = session_cache.load_api_client()
+        if api is None or not api.is_authenticated():
+            click.secho("No saved Sainsbury's session to read the trolley with, run main.py to log in", fg="red")
+            exit(1)
+        current_trolley = api.trolley
+    if offline:
+        order_plan = _offline_plan()
+    else:
+        # The existing product mappings are loaded while the shopping list is fetched
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            matcher = executor.submit(load_product_matcher, mirror)
+            items = list(iter_mirrored_items(full_sync=False) if mirror else iter_items())
+            order_plan = build_plan(items, matcher=matcher.result())
+
+    if output_format == "json":
+        click.echo(json.dumps(order_plan.to_json(current_trolley), indent=2))
+    else:
+        for line in order_plan.table_lines():
+            click.echo(line)
+    if output is not None:
+        order_plan.save(output, current_trolley)
+        click.echo(f"Saved plan to {output}", err=True)
+    click.echo(f"Planned {len(order_plan.items)} items in {time.perf_counter() - start_time:.2f}s", err=True)
+
+
+if __name__ == '__main__':
+    plan()
@@ -0,0 +1,131 @@
+"""
+A fuzzy index of the shopping items that already have a product, so that an item without one can borrow the
+product of a similarly named item, e.g. "Red onion" from "Red onions".
+
+Names are compared by the trigrams of their normalised words (lowercased, punctuation dropped and plurals made
+singular), found through an inverted index from trigram to names so that matching doesn't compare against every
+mapped item.
+"""
+import re
+import threading
+from collections import Counter
+from typing import Iterable, NamedTuple
+
+import click
+
+from data_model import ProductMapping
+from notion_data_provider import iter_product_mappings
+from notion_mirror import NotionMirror
+
+# Matches at least this close are used without asking
+AUTO_APPLY_SCORE = 0.9
+# Matches at least this close are offered when ordering manually
+MIN_PROPOSAL_SCORE = 0.6
+
+
+class Match(NamedTuple):
+    # The name of the mapped item that matched
+    display_name: str
+    mapping: ProductMapping
+    # From 0 to 1, where 1 means the names are the same once normalised
+    score: float
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes", "oes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def normalised_name(name: str) -> str:
+    return " ".join(_singular(word) for word in re.findall(r"[a-z0-9]+", name.lower()))
+
+
+def _trigrams(normalised: str) -> set[str]:
+    padded = f"  {normalised} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def _normalised_unit(unit: str | None) -> str | None:
+    return unit.strip().lower() if unit else None
+
+
+class _Entry(NamedTuple):
+    display_name: str
+    mapping: ProductMapping
+    trigrams: set[str]
+
+
+class ProductMatcher:
+    def __init__(self, mappings: Iterable[tuple[str, ProductMapping]] = ()):
+        self._entry_for_name: dict[str, _Entry] = {}
+        self._names_for_trigram: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        for display_name, mapping in mappings:
+            self.add(display_name, mapping)
+
+    def __len__(self):
+        return len(self._entry_for_name)
+
+    def add(self, display_name: str, mapping: ProductMapping):
+        """Indexes (or re-indexes) the product mapping of a shopping item."""
+        name = normalised_name(display_name)
+        if not name:
+            return
+        trigrams = _trigrams(name)
+        with self._lock:
+            self._entry_for_name[name] = _Entry(display_name, mapping, trigrams)
+            for trigram in trigrams:
+                self._names_for_trigram.setdefault(trigram, set()).add(name)
+
+    def matches(self, display_name: str, display_unit: str | None, min_score: float = MIN_PROPOSAL_SCORE
+                ) -> list[Match]:
+        """Finds mapped items with names like `display_name`, best first.
+
+        Only items measured in the same unit are matched, since the mapping's multiplier converts from it."""
+        name = normalised_name(display_name)
+        if not name:
+            return []
+        trigrams = _trigrams(name)
+        with self._lock:
+            shared_trigram_count_for_name = Counter(
+                candidate
+                for trigram in trigrams
+                for candidate in self._names_for_trigram.get(trigram, ())
+            )
+            candidates = [
+                (self._entry_for_name[candidate], shared_trigram_count)
+                for candidate, shared_trigram_count in shared_trigram_count_for_name.items()
+            ]
+        matches = []
+        for entry, shared_trigram_count in candidates:
+            if _normalised_unit(entry.mapping.display_unit) != _normalised_unit(display_unit):
+                continue
+            # Dice coefficient of the two names' trigrams
+            score = 2 * shared_trigram_count / (len(trigrams) + len(entry.trigrams))
+            if score >= min_score:
+                matches.append(Match(display_name=entry.display_name, mapping=entry.mapping, score=score))
+        return sorted(matches, key=lambda match: match.score, reverse=True)
+
+    def best_match(self, display_name: str, display_unit: str | None, min_score: float = MIN_PROPOSAL_SCORE
+                   ) -> Match | None:
+        matches = self.matches(display_name, display_unit, min_score)
+        return matches[0] if matches else None
+
+
+def load_product_matcher(mirror: bool) -> ProductMatcher:
+    """Indexes the items that are already mapped to products, or returns an empty index if they can't be fetched."""
+    try:
+        if mirror:
+            with NotionMirror() as notion_mirror:
+                mappings = list(notion_mirror.product_mappings())
+            if mappings:
+                return ProductMatcher(mappings)
+        return ProductMatcher(iter_product_mappings())
+    except Exception as e:
+        click.secho(f"Couldn't load the existing product mappings to match items against: {e}", fg="yellow")
+        return ProductMatcher()
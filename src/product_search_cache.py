@@ -0,0 +1,78 @@
+"""
+A local cache of product search results, so that searching for the same things week after week doesn't wait on
+the groceries API.
+
+Results are kept for a limited time (products and prices change) and only the most recently used searches are
+kept, so the cache doesn't grow without bound.
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from data_model import Product
+from storage import data_directory
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def normalised_search_term(term: str) -> str:
+    return " ".join(term.lower().split())
+
+
+class ProductSearchCache:
+    def __init__(self, path: Path | None = None, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or data_directory() / "product_searches.sqlite3",
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS searches (
+                    term TEXT PRIMARY KEY,
+                    products TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS searches_by_use ON searches (used_at);
+            """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def get(self, term: str) -> list[Product] | None:
+        """The cached results for `term`, or None if there are none that are still fresh."""
+        term = normalised_search_term(term)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT products FROM searches WHERE term = ? AND fetched_at >= ?", (term, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE searches SET used_at = ? WHERE term = ?", (now, term))
+        return [Product(*product) for product in json.loads(row[0])]
+
+    def put(self, term: str, products: list[Product]):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO searches (term, products, fetched_at, used_at) VALUES (?, ?, ?, ?)",
+                (normalised_search_term(term), json.dumps(products), now, now),
+            )
+            # Drop expired searches and the least recently used beyond the limit
+            self._connection.execute("DELETE FROM searches WHERE fetched_at < ?", (now - self.ttl_seconds,))
+            self._connection.execute(
+                "DELETE FROM searches WHERE term NOT IN (SELECT term FROM searches ORDER BY used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
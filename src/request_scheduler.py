@@ -0,0 +1,212 @@
+"""
+Paces the requests sent to each host, so that bursts of concurrent requests run as fast as the host will allow
+rather than failing once it starts throttling them.
+
+Each host gets a token bucket limiting its request rate and a concurrency limit that adapts to how the host is
+responding: it grows while requests succeed and halves when the host throttles or fails them. Throttled and
+transiently failed requests are retried after the delay the host asks for with `Retry-After`, or with
+exponential backoff and jitter when it doesn't say.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, NamedTuple
+from urllib.parse import urlsplit
+
+import requests
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Status codes meaning the host rejected the request without acting on it, so any request can be retried
+THROTTLED_STATUS_CODES = {429, 503}
+# Other failures are only retried for requests that are safe to repeat
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY_SECONDS = 0.5
+DEFAULT_MAX_DELAY_SECONDS = 30.0
+
+
+def retry_after_seconds(response: requests.Response) -> float | None:
+    """The delay asked for by the response's `Retry-After` header, if it has one."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    if retry_after.strip().isdigit():
+        return float(retry_after)
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float = DEFAULT_MAX_DELAY_SECONDS) -> float:
+    """An exponential backoff delay for the given (zero-based) retry attempt, with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class TokenBucket:
+    """Limits requests to `rate` per second on average, allowing bursts of up to `burst` requests."""
+    def __init__(self, rate: float | None, burst: int, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        """Holds back all requests for the given time, e.g. when the host has asked us to slow down."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                if self.rate is not None:
+                    self._tokens = min(float(self.burst), self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.rate is None:
+                    return
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class AdaptiveConcurrencyLimit:
+    """Caps the number of requests in flight, adjusting the cap with additive increase, multiplicative decrease.
+
+    Each successful request raises the cap by 1/cap (so by about one per cap's worth of requests) and each
+    throttled or failed request halves it. Only one decrease is made per round of requests, so a burst of
+    failures from requests that were all sent under the old cap doesn't collapse it to the minimum."""
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, clock: Callable[[], float] = time.monotonic):
+        assert minimum <= initial <= maximum
+        self.minimum = minimum
+        self.maximum = maximum
+        self._limit = float(initial)
+        self._clock = clock
+        self._in_flight = 0
+        self._decreased_at = float("-inf")
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self) -> float:
+        """Waits for room under the cap, returning the time the request was let through."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+            return self._clock()
+
+    def release(self, started_at: float, succeeded: bool):
+        with self._condition:
+            self._in_flight -= 1
+            if succeeded:
+                self._limit = min(float(self.maximum), self._limit + 1 / self._limit)
+            elif started_at >= self._decreased_at:
+                self._limit = max(float(self.minimum), self._limit / 2)
+                self._decreased_at = self._clock()
+            self._condition.notify_all()
+
+
+class HostLimits(NamedTuple):
+    requests_per_second: float | None = None
+    burst: int = 10
+    max_concurrency: int = 16
+
+
+class _HostSchedule(NamedTuple):
+    bucket: TokenBucket
+    concurrency: AdaptiveConcurrencyLimit
+
+
+class RequestScheduler:
+    """Sends requests through per-host rate and concurrency limits, retrying them when the host throttles them."""
+    def __init__(self, default_limits: HostLimits = HostLimits(), max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_delay: float = DEFAULT_BASE_DELAY_SECONDS, max_delay: float = DEFAULT_MAX_DELAY_SECONDS,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.default_limits = default_limits
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._sleep = sleep
+        self._limits_for_host: dict[str, HostLimits] = {}
+        self._schedule_for_host: dict[str, _HostSchedule] = {}
+        self._lock = threading.Lock()
+
+    def configure_host(self, host: str, limits: HostLimits):
+        """Sets the limits for requests to `host`. Takes effect for hosts that haven't been sent requests yet."""
+        with self._lock:
+            self._limits_for_host[host] = limits
+
+    def _schedule(self, host: str) -> _HostSchedule:
+        with self._lock:
+            if host not in self._schedule_for_host:
+                limits = self._limits_for_host.get(host, self.default_limits)
+                self._schedule_for_host[host] = _HostSchedule(
+                    bucket=TokenBucket(limits.requests_per_second, limits.burst, clock=self._clock,
+                                       sleep=self._sleep),
+                    concurrency=AdaptiveConcurrencyLimit(
+                        initial=limits.max_concurrency, maximum=limits.max_concurrency, clock=self._clock),
+                )
+            return self._schedule_for_host[host]
+
+    def concurrency_limit(self, host: str) -> int:
+        return self._schedule(host).concurrency.limit
+
+    def _retry_delay(self, method: str, response: requests.Response, attempt: int) -> float | None:
+        """How long to wait before retrying after `response`, or None if it shouldn't be retried."""
+        if attempt >= self.max_retries or response.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        if response.status_code not in THROTTLED_STATUS_CODES and method.upper() not in IDEMPOTENT_METHODS:
+            return None
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    def send(self, method: str, url: str, send: Callable[[], requests.Response]) -> requests.Response:
+        """Calls `send` once the host's limits allow it, retrying while the host throttles or transiently fails it.
+
+        Returns the last response, which is an error response if the retries ran out."""
+        schedule = self._schedule(urlsplit(url).netloc)
+        attempt = 0
+        while True:
+            schedule.bucket.acquire()
+            started_at = schedule.concurrency.acquire()
+            response = None
+            try:
+                response = send()
+            finally:
+                schedule.concurrency.release(
+                    started_at, succeeded=response is not None and response.status_code not in RETRYABLE_STATUS_CODES)
+            delay = self._retry_delay(method, response, attempt)
+            if delay is None:
+                return response
+            if response.status_code in THROTTLED_STATUS_CODES:
+                # Hold back the other requests to this host too, rather than having each find out for itself
+                schedule.bucket.pause(delay)
+            else:
+                self._sleep(delay)
+            response.close()
+            attempt += 1
+
+
+_default_scheduler = RequestScheduler()
+
+
+def default_scheduler() -> RequestScheduler:
+    """The scheduler shared by all sessions, so requests to a host are paced together wherever they're sent from."""
+    return _default_scheduler
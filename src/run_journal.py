@@ -0,0 +1,153 @@
+"""
+A journal of the progress of an order run, so that a run that dies part way through can be resumed.
+
+The journal records the shopping list as it's fetched, each item added to the trolley and each manual item dealt
+with. Entries are only ever appended (and flushed to disk) while a run is in progress, and the journal starts
+again from empty when the next run starts.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+from data_model import ShoppingItem, DisplayQuantity, TrolleyItem, TrolleyQuantityByItems, TrolleyQuantityByWeight
+from storage import data_directory
+
+
+def item_key(item: ShoppingItem) -> str:
+    """Identifies a shopping item across runs."""
+    return item.page_id or item.display_name
+
+
+def shopping_item_to_json(item: ShoppingItem) -> dict:
+    trolley_item = item.trolley_item
+    return {
+        "display_name": item.display_name,
+        "display_quantity": item.display_quantity._asdict(),
+        "trolley_item": None if trolley_item is None else {
+            "id": trolley_item.id,
+            "name": trolley_item.name,
+            "quantity": trolley_item.quantity._asdict(),
+        },
+        "page_id": item.page_id,
+    }
+
+
+def shopping_item_from_json(value: dict) -> ShoppingItem:
+    trolley_item = value["trolley_item"]
+    if trolley_item is not None:
+        quantity = trolley_item["quantity"]
+        trolley_item = TrolleyItem(
+            id=trolley_item["id"],
+            name=trolley_item["name"],
+            quantity=(TrolleyQuantityByWeight(**quantity) if "weight_kg" in quantity
+                      else TrolleyQuantityByItems(**quantity)),
+        )
+    return ShoppingItem(
+        display_name=value["display_name"],
+        display_quantity=DisplayQuantity(**value["display_quantity"]),
+        trolley_item=trolley_item,
+        page_id=value["page_id"],
+    )
+
+
+class RunState(NamedTuple):
+    """How far a run got, as recorded in the journal."""
+    reconcile: bool
+    # The shopping list as far as it was fetched
+    items: list[ShoppingItem]
+    items_complete: bool
+    # Keys of the items added to the trolley automatically
+    added_keys: set[str]
+    # Keys of the items left to order manually, once adding items automatically had finished
+    manual_keys: list[str] | None
+    # Keys of the manual items that were dealt with
+    handled_keys: set[str]
+    finished: bool
+
+
+class RunJournal:
+    def __init__(self, path: Path | None = None):
+        self._path = path or data_directory() / "run_journal.jsonl"
+        self._lock = threading.Lock()
+        self._journal = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def last_run(self) -> RunState | None:
+        """The state of the last run recorded in the journal, if there is one."""
+        if not self._path.exists():
+            return None
+        state = None
+        # A resumed run may fetch the list again, so later entries for an item replace earlier ones
+        item_for_key = {}
+        with open(self._path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A partially written final line from a crash
+                    continue
+                match entry["type"]:
+                    case "started":
+                        state = RunState(reconcile=entry["reconcile"], items=[], items_complete=False,
+                                         added_keys=set(), manual_keys=None, handled_keys=set(), finished=False)
+                    case "item":
+                        item = shopping_item_from_json(entry["item"])
+                        item_for_key[item_key(item)] = item
+                    case "items_complete":
+                        state = state._replace(items_complete=True)
+                    case "added":
+                        state.added_keys.add(entry["key"])
+                    case "manual":
+                        state = state._replace(manual_keys=entry["keys"])
+                    case "handled":
+                        state.handled_keys.add(entry["key"])
+                    case "finished":
+                        state = state._replace(finished=True)
+        return state._replace(items=list(item_for_key.values())) if state is not None else None
+
+    def _append(self, entry: dict):
+        with self._lock:
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def start(self, reconcile: bool):
+        """Starts journaling a new run, replacing the last one."""
+        self._journal = open(self._path, "w", encoding="utf-8")
+        self._append({"type": "started", "reconcile": reconcile})
+
+    def resume(self):
+        """Carries on journaling the last run."""
+        self._journal = open(self._path, "a", encoding="utf-8")
+
+    def journal_items(self, items: Iterable[ShoppingItem]) -> Iterator[ShoppingItem]:
+        """Passes the shopping list through, recording each item and then that the list is complete."""
+        for item in items:
+            self._append({"type": "item", "item": shopping_item_to_json(item)})
+            yield item
+        self._append({"type": "items_complete"})
+
+    def record_added(self, item: ShoppingItem):
+        self._append({"type": "added", "key": item_key(item)})
+
+    def record_manual(self, items: list[ShoppingItem]):
+        """Records the items left to order manually, which also marks the end of adding items automatically."""
+        self._append({"type": "manual", "keys": [item_key(item) for item in items]})
+
+    def record_handled(self, item: ShoppingItem):
+        self._append({"type": "handled", "key": item_key(item)})
+
+    def record_finished(self):
+        self._append({"type": "finished"})
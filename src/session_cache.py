@@ -0,0 +1,101 @@
+"""
+An encrypted on-disk cache of Sainsbury's API credentials so that repeat runs can skip the browser login.
+
+The cache is encrypted with a key derived from SAINSBURYS_PASSWORD, so it is only used when that is set.
+"""
+import base64
+import json
+import os
+import time
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from requests.cookies import RequestsCookieJar
+
+from shopping_driver import SainsburysAPIClient, Credentials
+from storage import data_directory
+
+# Sessions that would expire within this many seconds are treated as already expired,
+# so that they don't run out part way through ordering
+EXPIRY_MARGIN_SECONDS = 10 * 60
+_KEY_DERIVATION_ITERATIONS = 480_000
+
+
+def _cache_path():
+    return data_directory() / "session.enc"
+
+
+def _fernet(salt: bytes) -> Fernet | None:
+    if "SAINSBURYS_PASSWORD" not in os.environ:
+        return None
+    key_derivation = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt,
+                                iterations=_KEY_DERIVATION_ITERATIONS)
+    return Fernet(base64.urlsafe_b64encode(key_derivation.derive(os.environ["SAINSBURYS_PASSWORD"].encode())))
+
+
+def save_api_client(api: SainsburysAPIClient):
+    """Stores the credentials of the given client, if the cache can be encrypted."""
+    save_credentials(api.credentials)
+
+
+def save_credentials(credentials: Credentials):
+    """Stores the given credentials, if the cache can be encrypted."""
+    salt = os.urandom(16)
+    fernet = _fernet(salt)
+    if fernet is None:
+        return
+    session = {
+        "access_token": credentials.access_token,
+        "wc_auth_token": credentials.wc_auth_token,
+        "expires_at": credentials.expires_at,
+        "cookies": [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "expires": cookie.expires,
+            }
+            for cookie in credentials.cookies
+        ],
+    }
+    path = _cache_path()
+    path.touch(mode=0o600, exist_ok=True)
+    path.write_text(json.dumps({
+        "salt": base64.b64encode(salt).decode(),
+        "session": fernet.encrypt(json.dumps(session).encode()).decode(),
+    }))
+
+
+def load_api_client() -> SainsburysAPIClient | None:
+    """Creates a client from the cached credentials, or returns None if there are none that are still valid."""
+    path = _cache_path()
+    if not path.exists():
+        return None
+    try:
+        cache = json.loads(path.read_text())
+        fernet = _fernet(base64.b64decode(cache["salt"]))
+        if fernet is None:
+            return None
+        session = json.loads(fernet.decrypt(cache["session"].encode()))
+    except (ValueError, KeyError, InvalidToken):
+        # Unreadable, or encrypted with a different password
+        clear()
+        return None
+
+    if session["expires_at"] is None or session["expires_at"] - EXPIRY_MARGIN_SECONDS < time.time():
+        return None
+    cookie_jar = RequestsCookieJar()
+    for cookie in session["cookies"]:
+        cookie_jar.set(**cookie)
+    return SainsburysAPIClient(
+        access_token=session["access_token"],
+        wc_auth_token=session["wc_auth_token"],
+        cookies=cookie_jar,
+        expires_at=session["expires_at"],
+    )
+
+
+def clear():
+    _cache_path().unlink(missing_ok=True)
@@ -1,179 +1,498 @@
-import json
 import os
-from functools import cached_property
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, Future
+from typing import Iterator, Callable, TypeVar, Iterable, NamedTuple
 
-import click
 import requests
 from requests.cookies import RequestsCookieJar
-from selenium import webdriver
-from selenium.common import TimeoutException, NoSuchElementException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.remote.webelement import WebElement
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.wait import WebDriverWait
 
-from data_model import ShoppingItem, TrolleyQuantityByItems, TrolleyQuantityByWeight, TrolleyItem, Trolley
+from data_model import ShoppingItem, TrolleyQuantityByItems, TrolleyQuantityByWeight, TrolleyItem, Trolley, \
+    TrolleyQuantity, TrolleyDiff, Product
+from http_session import PooledSession, ConnectionStats, DEFAULT_POOL_SIZE
+from product_search_cache import ProductSearchCache
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+# Where the groceries API is, which can be pointed somewhere else (e.g. a local stand-in for benchmarking)
+SAINSBURYS_API_URL = os.environ.get("SAINSBURYS_API_URL",
+                                    "https://www.sainsburys.co.uk/groceries-api/gol-services").rstrip("/")
+# Credentials due to expire within this time are refreshed before sending a request, rather than waiting for a 401
+REFRESH_MARGIN_SECONDS = 60
+# Don't try refreshing ahead of expiry more often than this, in case refreshing doesn't extend the expiry
+MIN_SECONDS_BETWEEN_REFRESHES = 30
+
+T = TypeVar("T")
+
+
+def _quantity_and_uom(quantity: TrolleyQuantity) -> tuple[int | float, str]:
+    match quantity:
+        case TrolleyQuantityByItems(number):
+            return number, "ea"
+        case TrolleyQuantityByWeight(weight_kg):
+            return weight_kg, "kg"
+        case _:
+            raise ValueError(f"Unexpected item quantity type {type(quantity)}")
+
+
+def _zero_quantity_like(quantity: TrolleyQuantity) -> TrolleyQuantity:
+    return TrolleyQuantityByWeight(0.0) if isinstance(quantity, TrolleyQuantityByWeight) else TrolleyQuantityByItems(0)
+
+
+def _in_parallel(function: Callable[[T], object], arguments: Iterable[T], max_concurrent_requests: int
+                 ) -> Iterator[tuple[int, Exception | None]]:
+    """Calls `function` with each of `arguments` on a bounded thread pool.
+
+    Arguments are submitted as they are produced, so calls can start before a slow iterable is exhausted.
+    Yields the index of each argument along with the exception raised by its call (or None),
+    in the order that the calls complete."""
+    with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
+        index_for_future = {}
+        for index, argument in enumerate(arguments):
+            index_for_future[executor.submit(function, argument)] = index
+            for future in [future for future in index_for_future if future.done()]:
+                yield index_for_future.pop(future), future.exception()
+        for future in as_completed(index_for_future):
+            yield index_for_future[future], future.exception()
+
+
+def search_term_for_item(item: ShoppingItem) -> str:
+    return item.trolley_item.name if item.trolley_item else item.display_name
+
+
+def _trolley_for_basket_json(basket_json: dict) -> Trolley:
+    trolley = Trolley()
+    for json_item in basket_json["items"]:
+        try:
+            trolley.add(TrolleyItem(
+                id=json_item["product"]["product_uid"],
+                name=json_item["product"]["name"],
+                quantity=(
+                    TrolleyQuantityByWeight(json_item["quantity"])
+                    if json_item["uom"] == "kg"
+                    else TrolleyQuantityByItems(json_item["quantity"])
+                )
+            ))
+        except TypeError:
+            # Another line has the same product in the other unit, which a Trolley can't hold as well. Reading the
+            # rest of the trolley matters more, and the line is still there to see in the browser
+            continue
+    return trolley
+
+
+class Credentials(NamedTuple):
+    access_token: str
+    wc_auth_token: str
+    cookies: RequestsCookieJar
+    # Unix time after which the credentials are no longer accepted, if known
+    expires_at: float | None = None
 
 
 class SainsburysAPIClient:
-    """Provides a wrapper around basic Sainsbury's API calls."""
-    def __init__(self, access_token: str, wc_auth_token: str, cookies: RequestsCookieJar):
-        self.access_token = access_token
-        self.wc_auth_token = wc_auth_token
-        self.cookies = cookies
+    """Provides a wrapper around basic Sainsbury's API calls.
+
+    If `refresh_credentials` is given, it is called for new credentials when the current ones are about to expire
+    or are rejected, and the rejected request is retried with them."""
+    def __init__(self, access_token: str, wc_auth_token: str, cookies: RequestsCookieJar,
+                 expires_at: float | None = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 refresh_credentials: Callable[[], Credentials] | None = None, base_url: str = SAINSBURYS_API_URL):
+        self._session = PooledSession(pool_size=pool_size)
+        self.base_url = base_url
+        self.refresh_credentials = refresh_credentials
+        self._credentials_lock = threading.Lock()
+        self._refreshed_at = float("-inf")
+        # Where product searches are cached between runs, if anywhere
+        self.search_cache: ProductSearchCache | None = None
+        self._set_credentials(Credentials(access_token, wc_auth_token, cookies, expires_at))
+        # Local copy of the trolley kept up to date from this client's requests, or None when it isn't known
+        self._trolley: Trolley | None = None
+        # The ETag of the version of the basket that the local copy matches, or None if it isn't known
+        self._trolley_etag: str | None = None
+        self._trolley_lock = threading.Lock()
+        # Tokens of the trolley changes in flight, and of those that were ever in flight alongside another
+        self._changes_in_flight: set[object] = set()
+        self._overlapping_changes: set[object] = set()
+
+    @classmethod
+    def from_credentials(cls, credentials: Credentials, **kwargs) -> "SainsburysAPIClient":
+        return cls(*credentials, **kwargs)
+
+    @property
+    def credentials(self) -> Credentials:
+        return Credentials(self.access_token, self.wc_auth_token, self.cookies, self.expires_at)
+
+    def _set_credentials(self, credentials: Credentials):
+        self.access_token, self.wc_auth_token, self.cookies, self.expires_at = credentials
+        self._session.headers.update({
+            "Authorization": f"Bearer {credentials.access_token}",
+            "WCAuthToken": credentials.wc_auth_token,
+        })
+        self._session.cookies.update(credentials.cookies)
+
+    def _refresh_credentials(self, rejected_access_token: str):
+        with self._credentials_lock:
+            if self.access_token != rejected_access_token:
+                # Already refreshed by another request
+                return
+            self._refreshed_at = time.monotonic()
+            self._set_credentials(self.refresh_credentials())
+
+    def _expires_soon(self) -> bool:
+        return (
+            self.expires_at is not None
+            and self.expires_at - REFRESH_MARGIN_SECONDS < time.time()
+            and time.monotonic() - self._refreshed_at > MIN_SECONDS_BETWEEN_REFRESHES
+        )
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends an authenticated request, refreshing the credentials and retrying once if they've expired."""
+        if self.refresh_credentials is None:
+            return self._session.request(method, url, **kwargs)
+        if self._expires_soon():
+            self._refresh_credentials(self.access_token)
+        access_token = self.access_token
+        response = self._session.request(method, url, **kwargs)
+        if response.status_code == 401:
+            response.close()
+            self._refresh_credentials(access_token)
+            response = self._session.request(method, url, **kwargs)
+        return response
+
+    def connection_stats(self) -> ConnectionStats:
+        return self._session.connection_stats()
+
+    def is_authenticated(self) -> bool:
+        """Checks that the credentials are still accepted by making a request that needs them."""
+        response = self._session.get(
+            url=f"{self.base_url}/basket/v1/basket",
+        )
+        return response.ok
 
     def add_item(self, item: TrolleyItem):
         """Adds the given item to the current trolley.
 
         If the item already exists, the quantity will be added in addition to what's already in the trolley."""
-        match item.quantity:
-            case TrolleyQuantityByItems(number):
-                quantity = number
-                uom = "ea"
-            case TrolleyQuantityByWeight(weight_kg):
-                quantity = weight_kg
-                uom = "kg"
-            case _:
-                raise ValueError(f"Unexpected item quantity type {type(item.quantity)}")
-
-        response = requests.post(
-            url="https://www.sainsburys.co.uk/groceries-api/gol-services/basket/v1/basket/item",
+        quantity, uom = _quantity_and_uom(item.quantity)
+        response = self._change_trolley(
+            lambda trolley: trolley.add(item),
+            "POST",
+            url=f"{self.base_url}/basket/v1/basket/item",
             json={
                 "quantity": quantity,
                 "uom": uom,
                 "selected_catchweight": "",
                 "product_uid": item.id,
             },
-            headers={
-                "Authorization": f"Bearer {self.access_token}",
-                "WCAuthToken": self.wc_auth_token,
-            },
-            cookies=self.cookies
         )
         assert response.ok, response.json()
 
-    def capture_trolley(self) -> Trolley:
-        response = requests.get(
-            url="https://www.sainsburys.co.uk/groceries-api/gol-services/basket/v1/basket",
-            headers={
-                "Authorization": f"Bearer {self.access_token}",
-                "WCAuthToken": self.wc_auth_token,
+    def add_items(self, items: Iterable[TrolleyItem], max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS
+                  ) -> Iterator[tuple[int, Exception | None]]:
+        """Adds all the given items to the current trolley, with up to `max_concurrent_requests` requests in flight.
+
+        Yields the index of each item in `items` along with the exception raised while adding it (or None),
+        in the order that the requests complete."""
+        return _in_parallel(self.add_item, items, max_concurrent_requests)
+
+    def update_item_quantity(self, item: TrolleyItem):
+        """Sets the quantity of the given item in the current trolley, replacing what's already there.
+
+        A zero quantity removes the item from the trolley."""
+        quantity, uom = _quantity_and_uom(item.quantity)
+        response = self._change_trolley(
+            lambda trolley: trolley.set(item),
+            "PUT",
+            url=f"{self.base_url}/basket/v1/basket",
+            json={
+                "items": [
+                    {
+                        "quantity": quantity,
+                        "uom": uom,
+                        "selected_catchweight": "",
+                        "product_uid": item.id,
+                    }
+                ]
             },
-            cookies=self.cookies
         )
+        assert response.ok, response.text
+
+    def _apply_trolley_item_change(self, change: tuple[TrolleyItem | None, TrolleyItem]):
+        before, after = change
+        if before is None:
+            self.add_item(after)
+        elif type(before.quantity) == type(after.quantity) and after.quantity > before.quantity:
+            # Adding the difference uses the same request as a fresh add
+            self.add_item(after._replace(quantity=after.quantity - before.quantity))
+        else:
+            self.update_item_quantity(after)
+
+    def apply_trolley_diff(self, diff: TrolleyDiff, max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS
+                           ) -> Iterator[tuple[TrolleyItem, Exception | None]]:
+        """Makes the minimal set of requests to apply the given diff to the current trolley.
+
+        Yields the item affected by each request (with the target quantity, or zero for removals)
+        along with the exception raised by the request (or None), in the order that the requests complete."""
+        changes = (
+            [(None, item) for item in diff.added] +
+            [(change.before, change.after) for change in diff.changed] +
+            [(item, item._replace(quantity=_zero_quantity_like(item.quantity))) for item in diff.removed]
+        )
+        for index, error in _in_parallel(self._apply_trolley_item_change, changes, max_concurrent_requests):
+            yield changes[index][1], error
+
+    def search_products(self, term: str, max_results: int = 10) -> list[Product]:
+        """Searches the groceries API for products matching `term`, best matches first.
+
+        Results come from the search cache where possible."""
+        if self.search_cache is not None:
+            products = self.search_cache.get(term)
+            if products is not None:
+                return products[:max_results]
+        response = self._request(
+            "GET",
+            url=f"{self.base_url}/product/v1/product",
+            params={
+                "filter[keyword]": term,
+                "page_number": 1,
+                "page_size": max_results,
+                "sort_order": "FAVOURITES_FIRST",
+            },
+        )
+        assert response.ok, response.text
+        products = [
+            Product(
+                id=json_product["product_uid"],
+                name=json_product["name"],
+                price=json_product.get("retail_price", {}).get("price"),
+            )
+            for json_product in response.json().get("products", [])
+        ]
+        if self.search_cache is not None:
+            self.search_cache.put(term, products)
+        return products
+
+    def capture_trolley(self) -> Trolley:
+        trolley, _ = self.capture_trolley_if_changed(etag=None)
+        return trolley
+
+    def capture_trolley_if_changed(self, etag: str | None) -> tuple[Trolley | None, str | None]:
+        """Captures the trolley unless it is unchanged since the response that had the given ETag.
+
+        Returns the trolley (or None if unchanged) along with the ETag of the response, if the server sent one."""
+        response = self._request(
+            "GET",
+            url=f"{self.base_url}/basket/v1/basket",
+            headers={"If-None-Match": etag} if etag else None,
+        )
+        if response.status_code == 304:
+            return None, etag
         assert response.ok
         response_json = response.json()
         assert "items" in response_json
-        return Trolley(items=[
-            TrolleyItem(
-                id=json_item["product"]["product_uid"],
-                name=json_item["product"]["name"],
-                quantity=(
-                    TrolleyQuantityByWeight(json_item["quantity"])
-                    if json_item["uom"] == "kg"
-                    else TrolleyQuantityByItems(json_item["quantity"])
-                )
-            )
-            for json_item in response_json["items"]
-        ])
+        trolley = _trolley_for_basket_json(response_json)
+        etag = response.headers.get("ETag")
+        with self._trolley_lock:
+            # A change in flight may or may not be in this basket, so leave the local copy to that change
+            if not self._changes_in_flight:
+                self._trolley, self._trolley_etag = trolley.copy(), etag
+        return trolley, etag
+
+    @property
+    def trolley(self) -> Trolley:
+        """The current trolley, from the local copy kept up to date by this client's requests.
+
+        The local copy is checked against the server's version of the basket with a conditional request, so that
+        changes made elsewhere (e.g. in the browser) are noticed. The whole basket is only downloaded when it has
+        changed or when the version the local copy matches isn't known: the first time, after changes that were
+        in flight together, or after a request that failed (so might or might not have changed the trolley)."""
+        with self._trolley_lock:
+            trolley = self._trolley.copy() if self._trolley is not None else None
+            etag = self._trolley_etag
+        if trolley is None or etag is None:
+            return self.capture_trolley()
+        captured, _ = self.capture_trolley_if_changed(etag)
+        return trolley if captured is None else captured
+
+    def _change_trolley(self, apply_locally: Callable[[Trolley], None], method: str, url: str, **kwargs):
+        """Sends a request that changes the trolley, keeping the local copy of the trolley up to date.
+
+        A response that includes the basket's items replaces the local copy, as long as no other change was in
+        flight at the same time (otherwise the basket in the response may be missing that change, or the change
+        may already have been applied locally). In every other case the change is applied to the local copy with
+        `apply_locally`."""
+        change = object()
+        with self._trolley_lock:
+            if self._changes_in_flight:
+                self._overlapping_changes.update(self._changes_in_flight)
+                self._overlapping_changes.add(change)
+            self._changes_in_flight.add(change)
+        try:
+            response = self._request(method, url, **kwargs)
+        except Exception:
+            with self._trolley_lock:
+                self._changes_in_flight.discard(change)
+                self._overlapping_changes.discard(change)
+                self._trolley = None
+            raise
+        try:
+            response_json = response.json()
+        except ValueError:
+            response_json = None
+        with self._trolley_lock:
+            self._changes_in_flight.discard(change)
+            overlapped = change in self._overlapping_changes
+            self._overlapping_changes.discard(change)
+            if not response.ok:
+                self._trolley = None
+            elif not overlapped and isinstance(response_json, dict) and "items" in response_json:
+                self._trolley = _trolley_for_basket_json(response_json)
+                self._trolley_etag = response.headers.get("ETag")
+            elif self._trolley is not None:
+                apply_locally(self._trolley)
+                # The version of the basket this matches isn't known, so the next check downloads it all
+                self._trolley_etag = None
+        return response
+
+    def watch_trolley(self, min_interval: float = 0.5, max_interval: float = 4.0) -> "TrolleyWatcher":
+        return TrolleyWatcher(self, min_interval=min_interval, max_interval=max_interval)
 
     def empty_trolley(self):
-        response = requests.delete(
-            url="https://www.sainsburys.co.uk/groceries-api/gol-services/basket/v1/basket",
-            headers={
-                "Authorization": f"Bearer {self.access_token}",
-                "WCAuthToken": self.wc_auth_token,
-            },
-            cookies=self.cookies
+        response = self._change_trolley(
+            lambda trolley: trolley.clear(),
+            "DELETE",
+            url=f"{self.base_url}/basket/v1/basket",
         )
         assert response.ok, response.text
+        with self._trolley_lock:
+            # Known to be empty now, even if it wasn't known before
+            self._trolley = Trolley()
 
 
-class SainsburysShoppingDriver:
-    """
-    Provides basic programmatic control of an interactive Sainsbury's browser session.
-    """
-    def __init__(self):
-        self._driver = webdriver.Firefox()
+class ProductSearches:
+    """Searches for products for shopping items on background threads, so the results are ready to show by the time
+    each item comes up."""
+    def __init__(self, api: SainsburysAPIClient, max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS):
+        self._api = api
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_requests)
+        self._search_for_term: dict[str, Future[list[Product]]] = {}
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._driver.quit()
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
-    def refresh(self):
-        self._driver.refresh()
+    def start(self, item: ShoppingItem):
+        """Starts searching for the given item, unless it's already been searched for."""
+        term = search_term_for_item(item)
+        if term not in self._search_for_term:
+            self._search_for_term[term] = self._executor.submit(self._api.search_products, term)
 
-    @cached_property
-    def api(self) -> SainsburysAPIClient:
-        """A Sainsbury's API Client constructed using credentials from the browser instance."""
-        access_token = json.loads(
-            self._driver.execute_script(
-                "return window.localStorage.getItem('oidc.user:https://account.sainsburys.co.uk:gol');"
-            )
-        )["access_token"]
-        wc_auth_token = next(
-            cookie["value"]
-            for cookie in self._driver.get_cookies()
-            if cookie["name"].startswith("WC_AUTHENTICATION_")
-        )
-        cookie_jar = requests.cookies.RequestsCookieJar()
-        for cookie in self._driver.get_cookies():
-            cookie_jar.set(name=cookie["name"], value=cookie["value"], domain=cookie["domain"], path=cookie["path"])
-
-        return SainsburysAPIClient(
-            access_token=access_token,
-            wc_auth_token=wc_auth_token,
-            cookies=cookie_jar,
-        )
+    def start_for_unmapped(self, items: Iterable[ShoppingItem]) -> Iterator[ShoppingItem]:
+        """Passes the given items through, starting searches for those not yet mapped to a product as they go by."""
+        for item in items:
+            if not item.trolley_item:
+                self.start(item)
+            yield item
 
-    def _accept_cookies(self):
-        cookie_button = WebDriverWait(self._driver, 5).until(
-            EC.presence_of_element_located((By.ID, "onetrust-accept-btn-handler"))
-        )
-        self._driver.execute_script("""document.getElementById("onetrust-accept-btn-handler").click()""")
-        cookie_button.click()
-        WebDriverWait(self._driver, 10).until(EC.invisibility_of_element(cookie_button))
-
-    def login(self):
-        if 'SAINSBURYS_EMAIL' not in os.environ or 'SAINSBURYS_PASSWORD' not in os.environ:
-            print("In order to login automatically, please set the SAINSBURYS_EMAIL and SAINSBURYS_PASSWORD environment variables.")
-        self._driver.get(
-            "https://www.sainsburys.co.uk/webapp/wcs/stores/servlet/LogonView?catalogId=10122&langId=44&storeId=10151&logonCallerId=LogonButton&URL=TopCategoriesDisplayView")
-        assert "Sainsbury's" in self._driver.title
-        self._accept_cookies()
-        WebDriverWait(self._driver, 3).until(
-            EC.presence_of_element_located((By.ID, "username"))
-        ).send_keys(os.environ['SAINSBURYS_EMAIL'])
-        self._driver.find_element(By.ID, "password").send_keys(os.environ['SAINSBURYS_PASSWORD'])
-        self._driver.find_element(By.ID, "password").send_keys(Keys.RETURN)
+    def results(self, item: ShoppingItem, timeout: float | None = None) -> list[Product] | None:
+        """The products found for the given item, or None if they aren't ready within `timeout` or the search failed."""
+        self.start(item)
         try:
-            # High timeout as might need to wait for user to enter verification code
-            WebDriverWait(self._driver, 300).until(
-                EC.any_of(
-                    EC.presence_of_element_located((By.CLASS_NAME, "loggedOutLink")),
-                    EC.presence_of_element_located((By.CLASS_NAME, "top-right-links--logout"))
-                )
-            )
-        except TimeoutException:
-            print("Did not detect login")
-            self._driver.quit()
-            exit(1)
+            return self._search_for_term[search_term_for_item(item)].result(timeout=timeout)
+        except Exception:
+            return None
 
-    def _find_search_bar_element(self) -> WebElement:
-        try:
-            return self._driver.find_element(By.ID, "search")
-        except NoSuchElementException:
-            return self._driver.find_element(By.ID, "search-bar-input")
-
-    def search_for_item(self, item: ShoppingItem):
-        """Enters the name of the given shopping item into the search bar and starts the search.
-
-        Does *not* wait for results to be shown."""
-        search_bar_element = self._find_search_bar_element()
-        search_term = item.trolley_item.name if item.trolley_item else item.display_name
-        search_bar_element.clear()
-        search_bar_element.send_keys(search_term)
-        search_bar_element.send_keys(Keys.RETURN)
+
+class TrolleyWatcher:
+    """Polls the trolley on a background thread, so that changes made in the browser are noticed as they happen.
+
+    Each change is published to `diffs` once it has settled, i.e. once the next poll finds the trolley unchanged,
+    so that several clicks in quick succession are reported as one change. Polls every `min_interval` seconds
+    after a change and backs off to every `max_interval` seconds while nothing changes, using conditional requests
+    where the server supports them."""
+    def __init__(self, api: SainsburysAPIClient, min_interval: float, max_interval: float):
+        self.diffs: queue.Queue[TrolleyDiff] = queue.Queue()
+        self._api = api
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._interval = min_interval
+        self._lock = threading.Lock()
+        # Start from the trolley as it is now, so that only changes made from now on are reported
+        self._trolley = api.trolley
+        # The trolley as of the latest poll, which may not have settled yet
+        self._latest_trolley = self._trolley
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+
+    @property
+    def trolley(self) -> Trolley:
+        """The trolley as of the latest settled change."""
+        with self._lock:
+            return self._trolley
+
+    def poll_soon(self):
+        """Goes back to polling as often as possible, for when a change is expected."""
+        self._interval = self._min_interval
+        self._wake.set()
+
+    def _capture(self) -> bool:
+        """Captures the trolley, returning whether it changed since the last capture."""
+        trolley = self._api.trolley
+        if not self._latest_trolley.diff(trolley).number_of_changes:
+            return False
+        self._latest_trolley = trolley
+        return True
+
+    def _settle(self):
+        """Publishes the change up to the latest poll, if there is one."""
+        diff = self._trolley.diff(self._latest_trolley)
+        self._trolley = self._latest_trolley
+        if diff.number_of_changes:
+            self.diffs.put(diff)
+
+    def poll(self):
+        """Polls the trolley once, publishing a change only once a poll finds the trolley unchanged since it."""
+        with self._lock:
+            if self._capture():
+                # Check again soon to see if it has settled
+                self._interval = self._min_interval
+            elif self._latest_trolley is not self._trolley:
+                self._settle()
+                self._interval = self._min_interval
+            else:
+                self._interval = min(self._interval * 2, self._max_interval)
+
+    def refresh(self) -> Trolley:
+        """Polls the trolley straight away and takes it as settled, returning the latest trolley.
+
+        For when the trolley is known to have finished changing, e.g. once the user has said so."""
+        with self._lock:
+            self._capture()
+            self._settle()
+            return self._trolley
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self._interval)
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                self.poll()
+            except Exception:
+                # Try again later, the caller can always fall back to capturing the trolley itself
+                self._interval = self._max_interval
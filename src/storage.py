@@ -0,0 +1,14 @@
+"""
+Locations of the files this app keeps between runs.
+"""
+import os
+from pathlib import Path
+
+
+def data_directory() -> Path:
+    """The directory for caches and journals, created on first use.
+
+    Defaults to ~/.cache/sainsburys-assistant and can be moved with SAINSBURYS_ASSISTANT_DATA_DIR."""
+    directory = Path(os.environ.get("SAINSBURYS_ASSISTANT_DATA_DIR", Path.home() / ".cache" / "sainsburys-assistant"))
+    directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+    return directory
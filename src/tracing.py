@@ -0,0 +1,170 @@
+"""
+Records where a run spends its time: every HTTP request sent through a `PooledSession`, every command sent to the
+browser and the phases of the run, as spans with their timing and details.
+
+Tracing is off unless `enable` is called, in which case nothing is recorded and the only cost to the code being
+traced is checking `current()`. Recorded spans can be summarised as a table or exported as a Chrome trace (which
+can be opened in chrome://tracing or https://ui.perfetto.dev).
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import NamedTuple, Iterator
+from urllib.parse import urlsplit
+
+HTTP = "http"
+BROWSER = "browser"
+PHASE = "phase"
+
+# Notion page and database ids, which are left out of span names so that requests for different pages group
+_ID_PATTERN = re.compile(r"[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}", re.IGNORECASE)
+
+
+class Span(NamedTuple):
+    category: str
+    name: str
+    # Seconds since the tracer was created
+    start: float
+    duration: float
+    thread_id: int
+    # Extra details, e.g. the status, size and retries of an HTTP request
+    args: dict
+
+    @property
+    def failed(self) -> bool:
+        return "error" in self.args or self.args.get("status", 0) >= 400
+
+
+class SpanSummary(NamedTuple):
+    category: str
+    name: str
+    count: int
+    total: float
+    max: float
+    failures: int
+    retries: int
+    bytes: int
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Tracer:
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    @property
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def record(self, category: str, name: str, start: float, duration: float, **args):
+        """Records a span that started at `start` (from `time.perf_counter`) and took `duration` seconds."""
+        span = Span(category, name, start - self._origin, duration, threading.get_ident(), args)
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, category: str, name: str, **args):
+        """Records the time taken by the body of the `with` block, noting the exception if it raises one."""
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(category, name, start, time.perf_counter() - start, **args)
+
+    def summary(self) -> list[SpanSummary]:
+        """Totals up the spans with the same category and name, in the order they were first recorded."""
+        summary_for_key: dict[tuple[str, str], SpanSummary] = {}
+        for span in self.spans:
+            key = (span.category, span.name)
+            previous = summary_for_key.get(key, SpanSummary(span.category, span.name, 0, 0.0, 0.0, 0, 0, 0))
+            summary_for_key[key] = SpanSummary(
+                category=span.category,
+                name=span.name,
+                count=previous.count + 1,
+                total=previous.total + span.duration,
+                max=max(previous.max, span.duration),
+                failures=previous.failures + span.failed,
+                retries=previous.retries + span.args.get("retries", 0),
+                bytes=previous.bytes + span.args.get("bytes", 0),
+            )
+        return list(summary_for_key.values())
+
+    def summary_lines(self) -> Iterator[str]:
+        """The summary as a table with a row per category and name."""
+        rows = self.summary()
+        name_width = max((len(f"{row.category} {row.name}") for row in rows), default=0)
+        yield f"{'':{name_width}}  {'count':>6}  {'total':>8}  {'mean':>8}  {'max':>8}  {'failed':>6}  " \
+              f"{'retries':>7}  {'bytes':>10}"
+        for row in rows:
+            yield f"{f'{row.category} {row.name}':{name_width}}  {row.count:>6}  {row.total:>7.2f}s  " \
+                  f"{row.mean:>7.3f}s  {row.max:>7.3f}s  {row.failures:>6}  {row.retries:>7}  {row.bytes:>10}"
+
+    def chrome_trace(self) -> dict:
+        """The spans in the Chrome trace event format, as complete ("X") events timed in microseconds."""
+        return {
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": span.thread_id,
+                    "args": span.args,
+                }
+                for span in self.spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export_chrome_trace(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.chrome_trace(), default=str))
+
+
+_tracer: Tracer | None = None
+
+
+def enable() -> Tracer:
+    """Starts recording spans, returning the tracer recording them."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def current() -> Tracer | None:
+    """The tracer recording spans, or None if tracing is off."""
+    return _tracer
+
+
+def span(category: str, name: str, **args):
+    """Records a span around the body of a `with` block, if tracing is on."""
+    tracer = _tracer
+    if tracer is None:
+        return nullcontext(args)
+    return tracer.span(category, name, **args)
+
+
+def http_span_name(method: str, url: str) -> str:
+    """Names an HTTP request by its method, host and path, leaving out the query and ids so that similar requests
+    group together."""
+    parts = urlsplit(url)
+    return f"{method.upper()} {parts.netloc}{_ID_PATTERN.sub('{id}', parts.path)}"
@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+import pytest
+
+from data_model import ShoppingItem, DisplayQuantity, TrolleyItem, TrolleyQuantity
+
+# The tests don't talk to Notion, but the mirror's tests use these database ids
+os.environ.setdefault("NOTION_SECRET", "unused")
+os.environ.setdefault("NOTION_SHOPPING_ITEM_DB", "shopping-items")
+os.environ.setdefault("NOTION_RECIPE_DB", "recipes")
+
+# Some tests run against the local stand-ins for the APIs that the benchmarks use
+sys.path.append(str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+VALID_TOKEN = "fresh-token"
+
+
+class _OKHandler(BaseHTTPRequestHandler):
+    """Answers every GET with "ok", unless it's sent with an access token other than VALID_TOKEN."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        authorization = self.headers.get("Authorization")
+        if authorization is not None and authorization != f"Bearer {VALID_TOKEN}":
+            self.send_response(401)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OKHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def make_item():
+    """Builds a shopping item named `name`, with a product to add in `quantity` if it's given."""
+    def make_item(name: str, quantity: TrolleyQuantity | None = None, value: float = 1) -> ShoppingItem:
+        return ShoppingItem(
+            display_name=name,
+            display_quantity=DisplayQuantity(value=value, unit=None),
+            trolley_item=None if quantity is None else TrolleyItem(id=f"{name}-id", name=name, quantity=quantity),
+            page_id=f"{name}-page",
+        )
+    return make_item
@@ -1,4 +1,5 @@
-from data_model import TrolleyQuantityByItems, TrolleyQuantityByWeight, TrolleyItem, Trolley
+from data_model import TrolleyQuantityByItems, TrolleyQuantityByWeight, TrolleyItem, Trolley, ShoppingItem, \
+    DisplayQuantity, trolley_for_items
 
 
 def test_can_diff_trolleys():
@@ -37,3 +38,121 @@ def test_can_diff_trolleys():
         TrolleyItem(id="avolarge", name='By Sainsbury’s Large Ripe & Ready Avocado',
                    quantity=TrolleyQuantityByItems(number_of_items=1))
     ]
+
+
+def test_can_combine_items_sharing_an_id():
+    trolley = Trolley.from_items([
+        TrolleyItem(id="onion", name="Sainsbury's Brown Onions Loose", quantity=TrolleyQuantityByItems(2)),
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.5)),
+        TrolleyItem(id="onion", name="Sainsbury's Brown Onions Loose", quantity=TrolleyQuantityByItems(1)),
+    ])
+
+    assert list(trolley) == [
+        TrolleyItem(id="onion", name="Sainsbury's Brown Onions Loose", quantity=TrolleyQuantityByItems(3)),
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.5)),
+    ]
+
+
+def test_can_find_changes_between_trolleys():
+    current_trolley = Trolley(items=[
+        TrolleyItem(id="soup", name="Sainsbury's Tomato & Basil Soup 600g (Serves 2)",
+                    quantity=TrolleyQuantityByItems(number_of_items=1)),
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose",
+                    quantity=TrolleyQuantityByWeight(weight_kg=0.1 + 0.2)),
+        TrolleyItem(id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado',
+                    quantity=TrolleyQuantityByItems(number_of_items=1)),
+        TrolleyItem(id="broc", name="Sainsbury's Purple Sprouting Broccoli Spears 200g",
+                    quantity=TrolleyQuantityByItems(number_of_items=2))])
+    target_trolley = Trolley(items=[
+        TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose",
+                    quantity=TrolleyQuantityByItems(number_of_items=1)),
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose",
+                    quantity=TrolleyQuantityByWeight(weight_kg=0.3)),
+        TrolleyItem(id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado',
+                    quantity=TrolleyQuantityByItems(number_of_items=3)),
+        TrolleyItem(id="broc", name="Sainsbury's Purple Sprouting Broccoli Spears 200g",
+                    quantity=TrolleyQuantityByItems(number_of_items=2))])
+
+    diff = current_trolley.diff(target_trolley)
+
+    assert diff.added == [
+        TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose",
+                    quantity=TrolleyQuantityByItems(number_of_items=1)),
+    ]
+    assert diff.removed == [
+        TrolleyItem(id="soup", name="Sainsbury's Tomato & Basil Soup 600g (Serves 2)",
+                    quantity=TrolleyQuantityByItems(number_of_items=1)),
+    ]
+    assert [(change.before.quantity, change.after.quantity) for change in diff.changed] == [
+        (TrolleyQuantityByItems(number_of_items=1), TrolleyQuantityByItems(number_of_items=3)),
+    ]
+    assert diff.number_of_changes == 3
+
+
+def test_can_find_increases_between_trolleys():
+    before = Trolley(items=[
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.5)),
+        TrolleyItem(id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado', quantity=TrolleyQuantityByItems(3)),
+    ])
+    after = Trolley(items=[
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.75)),
+        TrolleyItem(id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado', quantity=TrolleyQuantityByItems(1)),
+        TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose", quantity=TrolleyQuantityByItems(1)),
+    ])
+
+    assert before.diff(after).increases == [
+        TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose", quantity=TrolleyQuantityByItems(1)),
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.25)),
+    ]
+
+
+def test_can_update_trolley_in_place():
+    trolley = Trolley(items=[
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.5)),
+        TrolleyItem(id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado', quantity=TrolleyQuantityByItems(3)),
+    ])
+
+    trolley.add(TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.25)))
+    trolley.add(TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose", quantity=TrolleyQuantityByItems(1)))
+    trolley.set(TrolleyItem(id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado', quantity=TrolleyQuantityByItems(0)))
+
+    assert list(trolley) == [
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.75)),
+        TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose", quantity=TrolleyQuantityByItems(1)),
+    ]
+
+
+def test_can_look_up_and_remove_trolley_items_by_id():
+    trolley = Trolley(items=[
+        TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose", quantity=TrolleyQuantityByWeight(0.5)),
+        TrolleyItem(id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado', quantity=TrolleyQuantityByItems(3)),
+        TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose", quantity=TrolleyQuantityByItems(1)),
+    ])
+
+    trolley.remove("carrot")
+    trolley.merge(Trolley(items=[
+        TrolleyItem(id="banana", name="Sainsbury's Fairtrade Bananas Loose", quantity=TrolleyQuantityByItems(2)),
+    ]))
+
+    assert "carrot" not in trolley
+    assert trolley.get("carrot") is None
+    assert trolley.get("banana") == TrolleyItem(
+        id="banana", name="Sainsbury's Fairtrade Bananas Loose", quantity=TrolleyQuantityByItems(3))
+    assert trolley.get("avo") == TrolleyItem(
+        id="avo", name='By Sainsbury’s Medium Ripe & Ready Avocado', quantity=TrolleyQuantityByItems(3))
+    assert len(trolley) == 2
+
+
+def test_leaves_items_needing_a_product_in_another_unit_to_order_manually():
+    def item(name, quantity):
+        return ShoppingItem(display_name=name, display_quantity=DisplayQuantity(value=1, unit=None),
+                            trolley_item=TrolleyItem(id="carrot", name="Sainsbury's British Carrots Loose",
+                                                     quantity=quantity))
+    soup_carrots = item("Carrots for soup", TrolleyQuantityByWeight(weight_kg=0.5))
+    roast_carrots = item("Carrots for roast", TrolleyQuantityByWeight(weight_kg=1.0))
+    snack_carrots = item("Carrot sticks", TrolleyQuantityByItems(number_of_items=2))
+
+    trolley, mixed_unit_items = trolley_for_items([soup_carrots, snack_carrots, roast_carrots])
+
+    assert trolley.items == [soup_carrots.trolley_item._replace(quantity=TrolleyQuantityByWeight(weight_kg=1.5))]
+    assert mixed_unit_items == [snack_carrots]
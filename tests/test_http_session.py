@@ -0,0 +1,26 @@
+import tracing
+from http_session import PooledSession
+
+
+def test_session_reuses_connections(server_url):
+    session = PooledSession(pool_size=2)
+    for _ in range(5):
+        assert session.get(server_url).ok
+
+    stats = session.connection_stats()
+    assert stats.requests_sent == 5
+    assert stats.connections_opened == 1
+    assert stats.connections_reused == 4
+
+
+def test_traced_session_records_requests(server_url):
+    tracer = tracing.enable()
+    try:
+        assert PooledSession().get(f"{server_url}/basket", params={"page": 1}).ok
+    finally:
+        tracing.disable()
+
+    [span] = tracer.spans
+    assert span.category == tracing.HTTP
+    assert span.name == f"GET {server_url.removeprefix('http://')}/basket"
+    assert span.args == {"status": 200, "bytes": 2, "retries": 0}
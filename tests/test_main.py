@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+from main import _read_key
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Keys are read from the console rather than stdin on Windows")
+def test_reads_keys_sent_as_several_bytes_as_one_key_press(monkeypatch):
+    read_fd, write_fd = os.pipe()
+    # Up arrow, "y", "é" and F1
+    os.write(write_fd, "\x1b[Ayé\x1bOP".encode())
+    with os.fdopen(read_fd, "rb") as stdin:
+        monkeypatch.setattr(sys, "stdin", stdin)
+
+        keys = [_read_key(timeout=1) for _ in range(4)]
+        os.close(write_fd)
+
+    assert keys == ["\x1b[A", "y", "é", "\x1bOP"]
@@ -1,11 +1,48 @@
 import pytest
 
-from evaluate_math import evaluate_math_expression
+from evaluate_math import evaluate_math_expression, evaluate_math_expressions
 
 
 @pytest.mark.parametrize("expression,expected_value", [
     ("1+2+3", 6),
-    ("4/5", 0.8)
+    ("4/5", 0.8),
+    ("2 + 3 * 4", 14),
+    ("(2 + 3) * 4", 20),
+    ("-1/-4", 0.25),
+    ("1.5e1 - .5", 14.5),
+    ("500g/1kg", 0.5),
+    ("75cl/1l", 0.75),
 ])
 def test_can_evaluate_math_expression(expression, expected_value):
-    assert evaluate_math_expression(expression) == expected_value
+    assert evaluate_math_expression(expression) == pytest.approx(expected_value)
+
+
+@pytest.mark.parametrize("expression,unit,expected_value", [
+    ("500g", "kg", 0.5),
+    ("2*400g + 200g", "kg", 1.0),
+    ("1/4", "kg", 0.25),
+    ("330ml*6", "l", 1.98),
+    ("330ml*6", "ml", 1980),
+])
+def test_can_evaluate_math_expression_in_a_unit(expression, unit, expected_value):
+    assert evaluate_math_expression(expression, unit=unit) == pytest.approx(expected_value)
+
+
+@pytest.mark.parametrize("expression", [
+    "", "1+", "(1", "1)", "2**3", "1/0", "500g + 1l", "3 sticks", "__import__('os')", "(" * 10000 + "1" + ")" * 10000,
+    "1l", "500g",
+])
+def test_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        evaluate_math_expression(expression)
+
+
+@pytest.mark.parametrize("expression", ["1l", "2g*3g", "1kg/1l"])
+def test_rejects_expressions_left_in_other_units(expression):
+    with pytest.raises(ValueError):
+        evaluate_math_expression(expression, unit="kg")
+
+
+def test_evaluates_many_expressions():
+    assert evaluate_math_expressions(["1/4", "nonsense", "1/4", "250g"]) == [0.25, None, 0.25, None]
+    assert evaluate_math_expressions(["1/4", "250g", "1l"], unit="kg") == [0.25, 0.25, None]
@@ -0,0 +1,113 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import notion_data_provider
+from notion_data_provider import shopping_item_for_result, shopping_items_for_results_batch, query_database_pages, \
+    iter_items
+
+
+def _text(value):
+    return [{"plain_text": value}] if value is not None else []
+
+
+def _page(page_id, name, manual_quantity=None, weekly=False, unit=None, product=None):
+    product_name, product_uid, multiplier, sainsburys_unit = product or (None, None, None, None)
+    return {
+        "id": page_id,
+        "properties": {
+            "Grocery": {"title": _text(name)},
+            "Unit": {"rich_text": _text(unit)},
+            "Manual quantity": {"number": manual_quantity},
+            "Weekly Item": {"checkbox": weekly},
+            "Extra Item": {"checkbox": False},
+            "On-demand Item": {"checkbox": False},
+            "Sainsbury's Item Name": {"rich_text": _text(product_name)},
+            "Sainsbury's Product UID": {"rich_text": _text(product_uid)},
+            "Sainsbury's Multiplier": {"number": multiplier},
+            "Sainsbury's Unit": {"select": {"name": sainsburys_unit} if sainsburys_unit else None},
+        },
+    }
+
+
+def test_batch_conversion_matches_converting_each_page():
+    pages = [
+        _page("1", "Onions", manual_quantity=2, product=("Brown Onions Loose", "101", 1, "Items")),
+        _page("2", "Carrots", unit="g", product=("Carrots Loose", "102", 0.001, "Kilograms")),
+        _page("3", "Bread", weekly=True, product=("Wholemeal Loaf", "103", 1, "Items")),
+        _page("4", "Garlic", manual_quantity=0.1, product=("Garlic", "104", 1, "Items")),
+        _page("5", "Lemons", manual_quantity=1.1, product=("Lemons", "105", 1, "Items")),
+        _page("6", "Tinned tomatoes", unit="tins", manual_quantity=1.5, product=("Chopped Tomatoes", "106", 1, "Items")),
+        _page("7", "Saffron", manual_quantity=1),
+        _page("8", "Leeks"),
+    ]
+    quantity_in_meals_for_item_id = {"2": 450, "5": 0.2, "8": 2.0}
+
+    expected = [shopping_item_for_result(page, quantity_in_meals_for_item_id) for page in pages]
+    actual = shopping_items_for_results_batch(pages, quantity_in_meals_for_item_id)
+
+    assert actual == expected
+    assert [str(item.display_quantity) for item in actual] == [str(item.display_quantity) for item in expected]
+
+
+def test_batch_conversion_rejects_unrecognised_units():
+    with pytest.raises(ValueError):
+        shopping_items_for_results_batch([_page("1", "Milk", product=("Milk", "101", 1, "Litres"))], {})
+
+
+class _PagedNotion:
+    """Answers database queries a few results at a time, with the position of the next result as the cursor."""
+    def __init__(self, results_for_database: dict[str, list[dict]], page_size: int):
+        self._results_for_database = results_for_database
+        self._page_size = page_size
+        self.queries = []
+        self.cursor_requested = {}
+
+    def post(self, url, json, params=None):
+        database_id = url.split("/")[-2]
+        self.queries.append((database_id, json))
+        start = int(json.get("start_cursor", 0))
+        self.cursor_requested.setdefault(json.get("start_cursor"), threading.Event()).set()
+        results = self._results_for_database.get(database_id, [])
+        has_more = start + self._page_size < len(results)
+        body = {
+            "results": results[start:start + self._page_size],
+            "has_more": has_more,
+            "next_cursor": str(start + self._page_size) if has_more else None,
+        }
+        return SimpleNamespace(ok=True, json=lambda: body)
+
+
+@pytest.fixture
+def paged_notion(monkeypatch):
+    def install(results_for_database, page_size):
+        notion = _PagedNotion(results_for_database, page_size)
+        monkeypatch.setattr(notion_data_provider, "_notion_session", lambda: notion)
+        return notion
+    return install
+
+
+def test_query_follows_the_cursor_until_there_are_no_more_pages(paged_notion):
+    notion = paged_notion({"items": [{"id": str(i)} for i in range(7)]}, page_size=3)
+    query = {"filter": {"property": "Stocked?", "checkbox": {"equals": False}}}
+
+    pages = query_database_pages("items", query)
+    first_page = next(pages)
+    # The next page is requested before this one has been used
+    assert notion.cursor_requested.setdefault("3", threading.Event()).wait(timeout=5)
+    results = [first_page, *pages]
+
+    assert [[result["id"] for result in page] for page in results] == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+    assert notion.queries == [("items", query), ("items", {**query, "start_cursor": "3"}),
+                              ("items", {**query, "start_cursor": "6"})]
+
+
+def test_items_keep_their_order_across_pages(paged_notion):
+    names = ["Onions", "Carrots", "Bread", "Garlic", "Lemons", "Leeks", "Saffron"]
+    paged_notion({
+        "shopping-items": [_page(str(i), name, manual_quantity=1) for i, name in enumerate(names)],
+        "recipes": [],
+    }, page_size=2)
+
+    assert [item.display_name for item in iter_items()] == names
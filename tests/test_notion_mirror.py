@@ -0,0 +1,161 @@
+import urllib.parse
+from datetime import datetime, timezone
+
+import pytest
+
+import notion_mirror
+from notion_data_provider import RECIPE_INGREDIENT_FILTER, is_needed_in_recipes, is_on_shopping_list
+from notion_mirror import NotionMirror
+
+RECIPES_DB = "recipes"
+LONG_AGO = "2020-01-01T00:00:00+00:00"
+
+
+def _ingredient(page_id, item_ids, total_needed, last_edited_time=LONG_AGO):
+    return {
+        "id": page_id,
+        "last_edited_time": last_edited_time,
+        "properties": {
+            "Item": {"id": "item", "relation": [{"id": item_id} for item_id in item_ids]},
+            "Total Needed": {"id": "%3DtN", "formula": {"number": total_needed}},
+        },
+    }
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+@pytest.fixture
+def sent_queries():
+    """The database id, query and filter_properties of each query sent to Notion."""
+    return []
+
+
+@pytest.fixture
+def notion_pages(monkeypatch, sent_queries):
+    """The pages in each (fake) Notion database, which are filtered like Notion would."""
+    pages_for_database = {}
+
+    def query_database_pages(database_id, query, filter_properties=None):
+        sent_queries.append((database_id, query, filter_properties))
+        results = pages_for_database.get(database_id, [])
+        query_filter = query.get("filter")
+        if query_filter is not None and "last_edited_time" in query_filter:
+            edited_after = datetime.fromisoformat(query_filter["last_edited_time"]["on_or_after"])
+            results = [page for page in results if datetime.fromisoformat(page["last_edited_time"]) >= edited_after]
+        elif query_filter is not None:
+            matches_filter = is_needed_in_recipes if database_id == RECIPES_DB else is_on_shopping_list
+            results = [page for page in results if matches_filter(page)]
+        if filter_properties is not None:
+            results = [
+                {**page, "properties": {name: value for name, value in page["properties"].items()
+                                        if urllib.parse.unquote(value["id"]) in filter_properties}}
+                for page in results
+            ]
+        return iter([results])
+
+    monkeypatch.setattr(notion_mirror, "query_database_pages", query_database_pages)
+    return pages_for_database
+
+
+def test_keeps_meal_totals_up_to_date(tmp_path, notion_pages):
+    notion_pages[RECIPES_DB] = [
+        _ingredient("soup-onions", ["onion"], 2),
+        _ingredient("curry-alliums", ["onion", "garlic"], 3),
+    ]
+    with NotionMirror(tmp_path / "mirror.sqlite3") as mirror:
+        mirror.sync()
+        assert mirror.get_quantity_in_meals_for_item_id_dict() == {"onion": 5, "garlic": 3}
+        assert mirror.changed_item_ids() == {"onion", "garlic"}
+        mirror.clear_changed_items({"onion", "garlic"})
+
+        notion_pages[RECIPES_DB] = [
+            _ingredient("soup-onions", ["onion"], 0),
+            _ingredient("curry-alliums", ["onion", "garlic"], 3),
+            _ingredient("stew-carrots", ["carrot"], 0.5, last_edited_time=_now()),
+        ]
+        mirror.sync()
+        assert mirror.get_quantity_in_meals_for_item_id_dict() == {"onion": 3, "garlic": 3, "carrot": 0.5}
+        assert mirror.changed_item_ids() == {"onion", "carrot"}
+
+        mirror.sync()
+        assert mirror.get_quantity_in_meals_for_item_id_dict() == {"onion": 3, "garlic": 3, "carrot": 0.5}
+        # Kept until they've been reconciled
+        assert mirror.changed_item_ids() == {"onion", "carrot"}
+        mirror.clear_changed_items({"onion"})
+        assert mirror.changed_item_ids() == {"carrot"}
+
+
+def test_full_sync_removes_deleted_ingredients_from_meal_totals(tmp_path, notion_pages):
+    notion_pages[RECIPES_DB] = [_ingredient("soup-onions", ["onion"], 2), _ingredient("stew-carrots", ["carrot"], 1)]
+    with NotionMirror(tmp_path / "mirror.sqlite3") as mirror:
+        mirror.sync()
+
+        notion_pages[RECIPES_DB] = [_ingredient("stew-carrots", ["carrot"], 1)]
+        mirror.sync(full=True)
+
+        assert mirror.get_quantity_in_meals_for_item_id_dict() == {"carrot": 1}
+        assert mirror.changed_item_ids() == {"onion", "carrot"}
+
+
+def test_only_fetches_edited_pages_and_the_formula_of_matching_pages(tmp_path, notion_pages, sent_queries):
+    notion_pages[RECIPES_DB] = [
+        _ingredient("soup-onions", ["onion"], 2),
+        _ingredient("curry-alliums", ["onion", "garlic"], 3),
+        _ingredient("pie-apples", ["apple"], 4),
+    ]
+    with NotionMirror(tmp_path / "mirror.sqlite3") as mirror:
+        mirror.sync()
+        sent_queries.clear()
+
+        notion_pages[RECIPES_DB] = [
+            # Edited to need leeks instead
+            _ingredient("soup-onions", ["leek"], 2, last_edited_time=_now()),
+            # Its recipe needs more servings, which doesn't count as editing the ingredient
+            _ingredient("curry-alliums", ["onion", "garlic"], 6),
+            # Its recipe is no longer planned
+            _ingredient("pie-apples", ["apple"], 0),
+        ]
+        sync_results = mirror.sync()
+
+        recipe_queries = [(query, filter_properties) for database_id, query, filter_properties in sent_queries
+                          if database_id == RECIPES_DB]
+        (edited_query, edited_filter_properties), (matching_query, matching_filter_properties) = recipe_queries
+        assert list(edited_query["filter"]) == ["timestamp", "last_edited_time"]
+        assert edited_filter_properties is None
+        assert matching_query["filter"] == RECIPE_INGREDIENT_FILTER
+        assert matching_filter_properties == ["=tN"]
+
+        assert sync_results[RECIPES_DB].changed_page_ids == {"soup-onions", "curry-alliums", "pie-apples"}
+        assert mirror.get_quantity_in_meals_for_item_id_dict() == {"leek": 2, "onion": 6, "garlic": 6}
+        # The rest of the unedited page is kept from when it was last transferred
+        curry_alliums, = (page for page in mirror.pages(RECIPES_DB, matching_filter_only=True)
+                          if page["id"] == "curry-alliums")
+        assert curry_alliums["properties"]["Item"]["relation"] == [{"id": "onion"}, {"id": "garlic"}]
+
+
+def _shopping_item(page_id, manual_quantity, last_edited_time=LONG_AGO):
+    return {
+        "id": page_id,
+        "last_edited_time": last_edited_time,
+        "properties": {
+            "Total Needed": {"id": "tn", "formula": {"number": 0}},
+            "Manual quantity": {"id": "mq", "number": manual_quantity},
+            **{name: {"id": name.lower(), "checkbox": False}
+               for name in ["Weekly Item", "Extra Item", "On-demand Item", "Stocked?"]},
+        },
+    }
+
+
+def test_records_edited_shopping_items_as_changed(tmp_path, notion_pages):
+    notion_pages["shopping-items"] = [_shopping_item("milk", 1), _shopping_item("bread", 1)]
+    with NotionMirror(tmp_path / "mirror.sqlite3") as mirror:
+        mirror.sync()
+        mirror.clear_changed_items(mirror.changed_item_ids())
+
+        notion_pages["shopping-items"] = [_shopping_item("milk", 2, last_edited_time=_now()),
+                                          _shopping_item("bread", 1)]
+        mirror.sync()
+
+        assert mirror.changed_item_ids() == {"milk"}
@@ -0,0 +1,146 @@
+import json
+import threading
+
+import requests
+
+from data_model import TrolleyQuantityUnit
+from notion_data_provider import ItemNameLookupError
+from notion_writer import AssociationUpdate, NotionWriteQueue
+
+
+def _update(item_name, sainsburys_item_name="Bananas Loose"):
+    return AssociationUpdate(item_name=item_name, multiplier=1, sainsburys_item_name=sainsburys_item_name,
+                             sainsburys_product_uid=f"{sainsburys_item_name}-uid", unit=TrolleyQuantityUnit.ITEMS)
+
+
+def _http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+
+def test_coalesces_updates_to_the_same_item(tmp_path):
+    written = []
+    started, release = threading.Event(), threading.Event()
+
+    def write(update):
+        started.set()
+        release.wait()
+        written.append(update)
+
+    with NotionWriteQueue(tmp_path / "writes.jsonl", write=write) as queue:
+        queue.put(_update("Apples"))
+        started.wait()
+        # Queued while Apples is being sent, so only the last of these needs sending
+        for name in ["Bananas Loose", "Bananas Organic", "Bananas Fairtrade"]:
+            queue.put(_update("Bananas", name))
+        assert len(queue) == 2
+        release.set()
+        assert queue.flush(timeout=5)
+
+    assert written == [_update("Apples"), _update("Bananas", "Bananas Fairtrade")]
+
+
+def test_failed_update_stays_in_the_journal_and_is_sent_next_time(tmp_path):
+    path = tmp_path / "writes.jsonl"
+
+    def write(update):
+        if update.item_name == "Apples":
+            raise _http_error(401)
+
+    with NotionWriteQueue(path, write=write) as queue:
+        queue.put(_update("Apples"))
+        queue.put(_update("Bananas"))
+        queue.flush(timeout=5)
+
+    written = []
+    with NotionWriteQueue(path, write=written.append) as queue:
+        assert queue.flush(timeout=5)
+
+    assert written == [_update("Apples")]
+
+
+def test_only_drops_updates_for_items_that_cant_be_found(tmp_path):
+    path = tmp_path / "writes.jsonl"
+
+    def write(update):
+        if update.item_name == "Apples":
+            raise ItemNameLookupError("Multiple shopping items in database with the name Apples")
+        # e.g. a 502 from a proxy, with an HTML body
+        raise requests.JSONDecodeError("Expecting value", "<html>", 0)
+
+    with NotionWriteQueue(path, write=write) as queue:
+        queue.put(_update("Apples"))
+        queue.put(_update("Bananas"))
+        queue.flush(timeout=5)
+
+    written = []
+    with NotionWriteQueue(path, write=written.append) as queue:
+        assert queue.flush(timeout=5)
+
+    assert written == [_update("Bananas")]
+
+
+def test_closing_gives_up_waiting_and_leaves_updates_in_the_journal(tmp_path):
+    path = tmp_path / "writes.jsonl"
+    release = threading.Event()
+
+    queue = NotionWriteQueue(path, write=lambda update: release.wait(), close_timeout=0.1)
+    queue.put(_update("Apples"))
+    queue.put(_update("Bananas"))
+    queue.close()
+    release.set()
+
+    written = []
+    with NotionWriteQueue(path, write=written.append) as queue:
+        assert queue.flush(timeout=5)
+
+    assert written == [_update("Apples"), _update("Bananas")]
+
+
+def test_replays_updates_that_werent_sent_before_a_crash(tmp_path):
+    path = tmp_path / "writes.jsonl"
+    entries = [
+        {"type": "update", "sequence_number": 0, "update": _update("Apples").to_json()},
+        {"type": "update", "sequence_number": 1, "update": _update("Bananas").to_json()},
+        {"type": "done", "sequence_number": 0},
+        {"type": "update", "sequence_number": 2, "update": _update("Cheese").to_json()},
+    ]
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in entries), encoding="utf-8")
+
+    written = []
+    with NotionWriteQueue(path, write=written.append) as queue:
+        assert queue.flush(timeout=5)
+
+    assert written == [_update("Bananas"), _update("Cheese")]
+
+
+def test_skips_a_partially_written_final_line(tmp_path):
+    path = tmp_path / "writes.jsonl"
+    entry = {"type": "update", "sequence_number": 0, "update": _update("Apples").to_json()}
+    torn_entry = json.dumps({"type": "update", "sequence_number": 1, "update": _update("Bananas").to_json()})
+    path.write_text(json.dumps(entry) + "\n" + torn_entry[:len(torn_entry) // 2], encoding="utf-8")
+
+    written = []
+    queue = NotionWriteQueue(path, write=written.append)
+    queue.put(_update("Cheese"))
+    assert queue.flush(timeout=5)
+    # Not closed, as if it crashed, so the journal isn't emptied
+    queue._journal.close()
+
+    assert written == [_update("Apples"), _update("Cheese")]
+    # Every line in the journal is whole again, so nothing is sent twice
+    for line in path.read_text(encoding="utf-8").splitlines():
+        json.loads(line)
+    with NotionWriteQueue(path, write=written.append) as queue:
+        assert queue.flush(timeout=5)
+    assert written == [_update("Apples"), _update("Cheese")]
+
+
+def test_empties_the_journal_once_everything_is_sent(tmp_path):
+    path = tmp_path / "writes.jsonl"
+    with NotionWriteQueue(path, write=lambda update: None) as queue:
+        queue.put(_update("Apples"))
+        queue.put(_update("Bananas"))
+
+    assert path.read_text(encoding="utf-8") == ""
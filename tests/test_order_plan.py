@@ -0,0 +1,63 @@
+from data_model import TrolleyItem, TrolleyQuantityByItems, ProductMapping, Trolley, TrolleyQuantityUnit
+from order_plan import OrderPlan, build_plan
+from product_matcher import ProductMatcher
+
+RED_ONIONS = ProductMapping(product_id="123", product_name="Sainsbury's Red Onions Loose", multiplier=1,
+                            unit=TrolleyQuantityUnit.ITEMS)
+
+
+def test_plans_items_with_products_and_leaves_the_rest_to_order_manually(make_item):
+    apples = make_item("Apples", TrolleyQuantityByItems(3))
+    sumac = make_item("Sumac")
+
+    plan = build_plan([apples, sumac])
+
+    assert plan.automatic_items == [apples]
+    assert plan.manual_items == [sumac]
+    assert plan.trolley.items == [apples.trolley_item]
+
+
+def test_gives_unmapped_items_the_products_of_similar_items(make_item):
+    plan = build_plan([make_item("Red onion", value=2), make_item("Sumac")],
+                      matcher=ProductMatcher([("Red onions", RED_ONIONS)]))
+
+    [onion] = plan.automatic_items
+    assert onion.trolley_item == TrolleyItem(id="123", name="Sainsbury's Red Onions Loose",
+                                             quantity=TrolleyQuantityByItems(2))
+    assert plan.similar_item_name_for_key == {"Red onion-page": "Red onions"}
+    assert [item.display_name for item in plan.manual_items] == ["Sumac"]
+    assert any("(like Red onions)" in line for line in plan.table_lines())
+
+
+def test_saved_plan_loads_the_same(tmp_path, make_item):
+    plan = build_plan([make_item("Apples", TrolleyQuantityByItems(3)), make_item("Red onion"), make_item("Sumac")],
+                      matcher=ProductMatcher([("Red onions", RED_ONIONS)]))
+
+    plan.save(tmp_path / "plan.json")
+
+    assert OrderPlan.load(tmp_path / "plan.json") == plan
+
+
+def test_trolley_operations_add_each_product_once_to_an_empty_trolley(make_item):
+    # Both given the mapped red onions
+    plan = build_plan([make_item("Red onion", value=2), make_item("Red onions", value=3)],
+                      matcher=ProductMatcher([("Red onions", RED_ONIONS)]))
+
+    assert plan.trolley_operations() == [
+        {"operation": "empty"},
+        {"operation": "add", "product_id": "123", "product_name": "Sainsbury's Red Onions Loose",
+         "quantity": {"number_of_items": 5}, "for": ["Red onion", "Red onions"]},
+    ]
+
+
+def test_trolley_operations_only_update_the_current_trolley_when_reconciling(make_item):
+    plan = build_plan([make_item("Apples", TrolleyQuantityByItems(3)), make_item("Bread", TrolleyQuantityByItems(1))])
+    current_trolley = Trolley([TrolleyItem(id="Apples-id", name="Apples", quantity=TrolleyQuantityByItems(1)),
+                               TrolleyItem(id="Bread-id", name="Bread", quantity=TrolleyQuantityByItems(1)),
+                               TrolleyItem(id="Cheese-id", name="Cheese", quantity=TrolleyQuantityByItems(1))])
+
+    assert [(operation["operation"], operation["product_id"], operation["for"])
+            for operation in plan.trolley_operations(current_trolley)] == [
+        ("set", "Apples-id", ["Apples"]),
+        ("remove", "Cheese-id", []),
+    ]
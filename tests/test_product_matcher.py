@@ -0,0 +1,34 @@
+from data_model import ProductMapping, TrolleyQuantityUnit
+from product_matcher import ProductMatcher, AUTO_APPLY_SCORE
+
+RED_ONIONS = ProductMapping(product_id="123", product_name="Sainsbury's Red Onions Loose", multiplier=1,
+                            unit=TrolleyQuantityUnit.ITEMS)
+BROWN_ONIONS = ProductMapping(product_id="456", product_name="Sainsbury's Brown Onions Loose", multiplier=1,
+                              unit=TrolleyQuantityUnit.ITEMS)
+CARROTS = ProductMapping(product_id="789", product_name="Sainsbury's British Carrots Loose", multiplier=0.001,
+                         unit=TrolleyQuantityUnit.KILOGRAMS, display_unit="g")
+
+
+def test_matches_plurals_and_case_closely_enough_to_apply():
+    matcher = ProductMatcher([("Red onions", RED_ONIONS), ("Brown onions", BROWN_ONIONS)])
+
+    match = matcher.best_match("red onion", None, min_score=AUTO_APPLY_SCORE)
+
+    assert match.display_name == "Red onions"
+    assert match.mapping == RED_ONIONS
+
+
+def test_only_matches_items_measured_in_the_same_unit():
+    matcher = ProductMatcher([("Carrots", CARROTS)])
+
+    assert matcher.best_match("Carrot", "G") is not None
+    assert matcher.best_match("Carrot", None) is None
+
+
+def test_matches_newly_added_mappings():
+    matcher = ProductMatcher([("Brown onions", BROWN_ONIONS)])
+    assert matcher.best_match("Red onion", None, min_score=AUTO_APPLY_SCORE) is None
+
+    matcher.add("Red onions", RED_ONIONS)
+
+    assert matcher.best_match("Red onion", None, min_score=AUTO_APPLY_SCORE).mapping == RED_ONIONS
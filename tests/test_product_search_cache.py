@@ -0,0 +1,29 @@
+from data_model import Product
+from product_search_cache import ProductSearchCache
+
+
+def test_caches_results_by_normalised_search_term(tmp_path):
+    with ProductSearchCache(tmp_path / "searches.sqlite3") as cache:
+        cache.put("Carrots  Loose", [Product(id="123", name="Sainsbury's British Carrots Loose", price=0.6)])
+
+        assert cache.get("carrots loose") == [Product(id="123", name="Sainsbury's British Carrots Loose", price=0.6)]
+        assert cache.get("carrots") is None
+
+
+def test_expires_results(tmp_path):
+    with ProductSearchCache(tmp_path / "searches.sqlite3", ttl_seconds=-1) as cache:
+        cache.put("carrots", [Product(id="123", name="Sainsbury's British Carrots Loose")])
+
+        assert cache.get("carrots") is None
+
+
+def test_evicts_least_recently_used_searches(tmp_path):
+    with ProductSearchCache(tmp_path / "searches.sqlite3", max_entries=2) as cache:
+        cache.put("carrots", [])
+        cache.put("onions", [])
+        cache.get("carrots")
+        cache.put("leeks", [])
+
+        assert cache.get("carrots") == []
+        assert cache.get("leeks") == []
+        assert cache.get("onions") is None
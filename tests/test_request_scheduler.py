@@ -0,0 +1,89 @@
+import io
+
+import requests
+
+from request_scheduler import RequestScheduler, HostLimits, TokenBucket
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO(b"")
+    return response
+
+
+def _responses(*responses):
+    remaining = list(responses)
+    return lambda: remaining.pop(0)
+
+
+def test_retries_throttled_requests_after_the_requested_delay():
+    clock = _FakeClock()
+    scheduler = RequestScheduler(clock=clock, sleep=clock.sleep)
+
+    response = scheduler.send("POST", "https://example.com/basket", _responses(
+        _response(429, {"Retry-After": "2"}),
+        _response(200),
+    ))
+
+    assert response.status_code == 200
+    assert clock.sleeps == [2.0]
+
+
+def test_does_not_retry_failed_requests_that_are_not_safe_to_repeat():
+    clock = _FakeClock()
+    scheduler = RequestScheduler(clock=clock, sleep=clock.sleep)
+
+    response = scheduler.send("POST", "https://example.com/basket", _responses(_response(500), _response(200)))
+
+    assert response.status_code == 500
+
+
+def test_gives_up_after_max_retries():
+    clock = _FakeClock()
+    scheduler = RequestScheduler(max_retries=2, clock=clock, sleep=clock.sleep)
+
+    response = scheduler.send("GET", "https://example.com/basket", _responses(
+        _response(502), _response(502), _response(502), _response(200),
+    ))
+
+    assert response.status_code == 502
+    assert len(clock.sleeps) == 2
+
+
+def test_concurrency_limit_halves_when_throttled_and_recovers_on_success():
+    clock = _FakeClock()
+    scheduler = RequestScheduler(default_limits=HostLimits(max_concurrency=8), clock=clock, sleep=clock.sleep)
+
+    scheduler.send("GET", "https://example.com/basket", _responses(_response(429), _response(200)))
+    assert scheduler.concurrency_limit("example.com") == 4
+    assert scheduler.concurrency_limit("other.example.com") == 8
+
+    for _ in range(30):
+        scheduler.send("GET", "https://example.com/basket", _responses(_response(200)))
+    assert scheduler.concurrency_limit("example.com") == 8
+
+
+def test_token_bucket_limits_the_request_rate():
+    clock = _FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(6):
+        bucket.acquire()
+
+    # The first two are let through straight away, then one every half a second
+    assert clock.now == 2.0
@@ -0,0 +1,56 @@
+from data_model import TrolleyQuantityByItems, TrolleyQuantityByWeight
+from run_journal import RunJournal
+
+
+def test_records_the_progress_of_a_run(tmp_path, make_item):
+    items = [make_item("Apples", TrolleyQuantityByItems(3)), make_item("Cheese", TrolleyQuantityByWeight(0.25)),
+             make_item("Sumac")]
+    with RunJournal(tmp_path / "journal.jsonl") as journal:
+        journal.start(reconcile=False)
+        assert list(journal.journal_items(items)) == items
+        journal.record_added(items[0])
+        journal.record_manual(items[1:])
+        journal.record_handled(items[1])
+
+    state = RunJournal(tmp_path / "journal.jsonl").last_run()
+
+    assert state.items == items
+    assert state.items_complete
+    assert state.added_keys == {"Apples-page"}
+    assert state.manual_keys == ["Cheese-page", "Sumac-page"]
+    assert state.handled_keys == {"Cheese-page"}
+    assert not state.finished
+
+
+def test_resumed_run_carries_on_the_same_journal(tmp_path, make_item):
+    path = tmp_path / "journal.jsonl"
+    with RunJournal(path) as journal:
+        journal.start(reconcile=True)
+        next(iter(journal.journal_items([make_item("Apples"), make_item("Bread")])))
+
+    with RunJournal(path) as journal:
+        state = journal.last_run()
+        assert state.reconcile and not state.items_complete and len(state.items) == 1
+        journal.resume()
+        # The list is fetched again on resuming, without repeating the items already seen
+        list(journal.journal_items([make_item("Apples"), make_item("Bread")]))
+        journal.record_finished()
+
+    state = RunJournal(path).last_run()
+    assert [item.display_name for item in state.items] == ["Apples", "Bread"]
+    assert state.items_complete and state.finished
+
+
+def test_ignores_a_partially_written_entry(tmp_path, make_item):
+    path = tmp_path / "journal.jsonl"
+    with RunJournal(path) as journal:
+        journal.start(reconcile=False)
+        journal.record_added(make_item("Apples"))
+    with open(path, "a") as file:
+        file.write('{"type": "add')
+
+    assert RunJournal(path).last_run().added_keys == {"Apples-page"}
+
+
+def test_no_last_run_without_a_journal(tmp_path):
+    assert RunJournal(tmp_path / "journal.jsonl").last_run() is None
@@ -0,0 +1,217 @@
+import time
+
+import pytest
+from requests.cookies import RequestsCookieJar
+
+from data_model import TrolleyItem, TrolleyQuantityByItems, TrolleyQuantityByWeight, ShoppingItem, DisplayQuantity
+from main import automatically_order, reconcile_order
+import shopping_driver
+from shopping_driver import SainsburysAPIClient, Credentials, _trolley_for_basket_json
+
+
+def _credentials(access_token, expires_at=None):
+    return Credentials(access_token=access_token, wc_auth_token="wc-token", cookies=RequestsCookieJar(),
+                       expires_at=expires_at)
+
+
+def test_refreshes_rejected_credentials_and_retries(server_url):
+    refreshes = []
+
+    def refresh_credentials():
+        refreshes.append(time.time())
+        return _credentials("fresh-token")
+
+    api = SainsburysAPIClient.from_credentials(_credentials("stale-token"), refresh_credentials=refresh_credentials)
+
+    assert api._request("GET", server_url).ok
+    assert api._request("GET", server_url).ok
+    assert len(refreshes) == 1
+    assert api.access_token == "fresh-token"
+
+
+def test_refreshes_credentials_before_they_expire(server_url):
+    api = SainsburysAPIClient.from_credentials(
+        _credentials("expiring-token", expires_at=time.time() + 5),
+        refresh_credentials=lambda: _credentials("fresh-token", expires_at=time.time() + 3600),
+    )
+
+    response = api._request("GET", server_url)
+
+    assert response.ok
+    assert api.expires_at > time.time() + 60
+
+
+def test_sends_requests_to_the_given_base_url(server_url):
+    api = SainsburysAPIClient.from_credentials(_credentials("fresh-token"), base_url=server_url)
+
+    assert api.is_authenticated()
+
+
+@pytest.fixture
+def fake_api():
+    from fake_apis import FakeAPIServer
+    with FakeAPIServer(shopping_item_db="shopping-items", recipe_db="recipes", latency_seconds=0.005) as server:
+        yield server
+
+
+def _trolley_quantities(trolley):
+    return {item.id: item.quantity for item in trolley}
+
+
+def test_local_trolley_matches_server_after_concurrent_adds(fake_api):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    items = [TrolleyItem(id=str(index), name=f"Item {index}", quantity=TrolleyQuantityByItems(index % 3 + 1))
+             for index in range(60)]
+
+    # Responses are handled in a different order each time, so try several times to catch them out of order
+    for _ in range(10):
+        api.empty_trolley()
+        assert all(error is None for _, error in api.add_items(items, max_concurrent_requests=8))
+
+        assert len(api.trolley) == 60
+        assert _trolley_quantities(api.trolley) == _trolley_quantities(api.capture_trolley())
+
+
+def test_local_trolley_is_only_downloaded_again_once_changed_elsewhere(fake_api, monkeypatch):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    # Changes made in the browser
+    browser = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    api.empty_trolley()
+    api.add_item(TrolleyItem(id="1", name="Apples", quantity=TrolleyQuantityByItems(2)))
+    downloads = []
+    monkeypatch.setattr(shopping_driver, "_trolley_for_basket_json",
+                        lambda basket_json: downloads.append(basket_json) or _trolley_for_basket_json(basket_json))
+
+    assert _trolley_quantities(api.trolley) == {"1": TrolleyQuantityByItems(2)}
+    assert not downloads
+
+    browser.add_item(TrolleyItem(id="2", name="Bread", quantity=TrolleyQuantityByItems(1)))
+    downloads.clear()
+    assert _trolley_quantities(api.trolley) == {"1": TrolleyQuantityByItems(2), "2": TrolleyQuantityByItems(1)}
+    assert len(downloads) == 1
+
+
+def test_items_that_fail_to_add_are_left_to_order_manually_in_order(fake_api):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    api.empty_trolley()
+    items = [
+        ShoppingItem(
+            display_name=f"Item {index}",
+            display_quantity=DisplayQuantity(value=1, unit=None),
+            # Every fifth item has no product to add
+            trolley_item=None if index % 5 == 0 else TrolleyItem(id=str(index), name=f"Product {index}",
+                                                                  quantity=TrolleyQuantityByItems(1)),
+            page_id=str(index),
+        )
+        for index in range(30)
+    ]
+    fake_api.state.unavailable_product_uids = {"3", "7", "8", "21", "29"}
+    added = []
+
+    manual_items = automatically_order(api, items, max_concurrent_requests=8, on_added=added.append)
+
+    assert [item.display_name for item in manual_items] == [
+        f"Item {index}" for index in [0, 3, 5, 7, 8, 10, 15, 20, 21, 25, 29]
+    ]
+    assert sorted(item.trolley_item.id for item in added) == sorted(_trolley_quantities(api.capture_trolley()))
+    assert len(added) == 19
+
+
+def test_reconciling_only_changes_the_quantities_of_changed_items(fake_api):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    api.empty_trolley()
+    # Apples were increased by hand after the last reconcile
+    api.add_item(TrolleyItem(id="1", name="Apples", quantity=TrolleyQuantityByItems(3)))
+    api.add_item(TrolleyItem(id="2", name="Bread", quantity=TrolleyQuantityByItems(1)))
+    api.add_item(TrolleyItem(id="4", name="Cheese", quantity=TrolleyQuantityByItems(1)))
+    items = [
+        ShoppingItem(display_name=name, display_quantity=DisplayQuantity(value=quantity, unit=None),
+                     trolley_item=TrolleyItem(id=product_id, name=name, quantity=TrolleyQuantityByItems(quantity)),
+                     page_id=name.lower())
+        for product_id, name, quantity in [("1", "Apples", 2), ("2", "Bread", 2), ("3", "Milk", 1)]
+    ]
+
+    assert reconcile_order(api, items, changed_item_ids={"bread", "milk"}) == []
+
+    assert _trolley_quantities(api.capture_trolley()) == {
+        "1": TrolleyQuantityByItems(3), "2": TrolleyQuantityByItems(2), "3": TrolleyQuantityByItems(1)
+    }
+
+
+def test_reconciling_leaves_items_needing_a_product_in_another_unit_to_order_manually(fake_api):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    api.empty_trolley()
+    items = [
+        ShoppingItem(display_name=name, display_quantity=DisplayQuantity(value=1, unit=None),
+                     trolley_item=TrolleyItem(id="1", name="Carrots", quantity=quantity), page_id=name)
+        for name, quantity in [("Carrots", TrolleyQuantityByWeight(0.5)), ("Carrot sticks", TrolleyQuantityByItems(2))]
+    ]
+
+    manual_items = reconcile_order(api, items)
+
+    assert [item.display_name for item in manual_items] == ["Carrot sticks"]
+    assert _trolley_quantities(api.capture_trolley()) == {"1": TrolleyQuantityByWeight(0.5)}
+
+
+def test_reads_a_trolley_with_a_product_in_both_units():
+    basket_json = {"items": [
+        {"product": {"product_uid": "1", "name": "Carrots"}, "uom": "kg", "quantity": 0.5},
+        {"product": {"product_uid": "1", "name": "Carrots"}, "uom": "ea", "quantity": 2},
+        {"product": {"product_uid": "2", "name": "Bread"}, "uom": "ea", "quantity": 1},
+    ]}
+
+    assert _trolley_quantities(_trolley_for_basket_json(basket_json)) == {
+        "1": TrolleyQuantityByWeight(0.5), "2": TrolleyQuantityByItems(1)
+    }
+
+
+def test_captures_trolley_only_if_changed_since_etag(fake_api):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    api.empty_trolley()
+    trolley, etag = api.capture_trolley_if_changed(etag=None)
+    assert len(trolley) == 0 and etag is not None
+
+    assert api.capture_trolley_if_changed(etag) == (None, etag)
+
+    api.add_item(TrolleyItem(id="1", name="Apples", quantity=TrolleyQuantityByItems(2)))
+    trolley, new_etag = api.capture_trolley_if_changed(etag)
+    assert _trolley_quantities(trolley) == {"1": TrolleyQuantityByItems(2)}
+    assert new_etag != etag
+
+
+def test_watcher_reports_changes_once_the_trolley_settles(fake_api):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    api.empty_trolley()
+    api.add_item(TrolleyItem(id="1", name="Apples", quantity=TrolleyQuantityByItems(1)))
+    # Polled by hand rather than by the background thread
+    with api.watch_trolley(min_interval=3600, max_interval=3600) as watcher:
+        assert _trolley_quantities(watcher.trolley) == {"1": TrolleyQuantityByItems(1)}
+
+        # Several clicks on "+" in quick succession
+        for _ in range(3):
+            api.add_item(TrolleyItem(id="2", name="Bread", quantity=TrolleyQuantityByItems(1)))
+            watcher.poll()
+            assert watcher.diffs.empty()
+        watcher.poll()
+
+        diff = watcher.diffs.get_nowait()
+        assert diff.added == [TrolleyItem(id="2", name="Product 2", quantity=TrolleyQuantityByItems(3))]
+        assert not diff.changed and not diff.removed
+        assert _trolley_quantities(watcher.trolley) == {"1": TrolleyQuantityByItems(1),
+                                                        "2": TrolleyQuantityByItems(3)}
+        watcher.poll()
+        assert watcher.diffs.empty()
+
+
+def test_watcher_refresh_takes_the_latest_trolley_as_settled(fake_api):
+    api = SainsburysAPIClient.from_credentials(_credentials("token"), base_url=fake_api.sainsburys_api_url)
+    api.empty_trolley()
+    with api.watch_trolley(min_interval=3600, max_interval=3600) as watcher:
+        api.add_item(TrolleyItem(id="1", name="Apples", quantity=TrolleyQuantityByItems(1)))
+
+        trolley = watcher.refresh()
+
+        assert _trolley_quantities(trolley) == {"1": TrolleyQuantityByItems(1)}
+        assert watcher.diffs.get_nowait().increases == [
+            TrolleyItem(id="1", name="Product 1", quantity=TrolleyQuantityByItems(1))
+        ]
@@ -0,0 +1,44 @@
+import time
+
+import pytest
+from requests.cookies import RequestsCookieJar
+
+import session_cache
+from shopping_driver import SainsburysAPIClient
+
+
+@pytest.fixture(autouse=True)
+def data_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("SAINSBURYS_ASSISTANT_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("SAINSBURYS_PASSWORD", "hunter2")
+    return tmp_path
+
+
+def _api_client(expires_at):
+    cookies = RequestsCookieJar()
+    cookies.set(name="WC_AUTHENTICATION_123", value="wc-token", domain=".sainsburys.co.uk", path="/")
+    return SainsburysAPIClient(access_token="access-token", wc_auth_token="wc-token", cookies=cookies,
+                               expires_at=expires_at)
+
+
+def test_can_load_saved_session(data_directory):
+    session_cache.save_api_client(_api_client(expires_at=time.time() + 3600))
+
+    assert b"access-token" not in (data_directory / "session.enc").read_bytes()
+    api = session_cache.load_api_client()
+    assert api.access_token == "access-token"
+    assert api.wc_auth_token == "wc-token"
+    assert api.cookies.get("WC_AUTHENTICATION_123", domain=".sainsburys.co.uk") == "wc-token"
+
+
+def test_does_not_load_expired_session():
+    session_cache.save_api_client(_api_client(expires_at=time.time() + 60))
+
+    assert session_cache.load_api_client() is None
+
+
+def test_does_not_load_session_saved_with_another_password(monkeypatch):
+    session_cache.save_api_client(_api_client(expires_at=time.time() + 3600))
+    monkeypatch.setenv("SAINSBURYS_PASSWORD", "correct horse battery staple")
+
+    assert session_cache.load_api_client() is None
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SRC_DIRECTORY = Path(__file__).resolve().parent.parent / "src"
+
+
+def test_importing_main_does_not_load_the_browser_or_need_notion_configuration():
+    environment = {name: value for name, value in os.environ.items() if not name.startswith("NOTION_")}
+    environment["PYTHONPATH"] = str(SRC_DIRECTORY)
+    completed = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, main; print(' '.join(name for name in ('selenium', 'tqdm', 'cryptography') if name in sys.modules))"],
+        env=environment, capture_output=True, text=True,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == ""
+
+
+def test_browser_is_only_started_once_when_several_threads_need_it(monkeypatch):
+    import session_cache
+    from main import LazyBrowser, PhaseTimings
+    started = []
+
+    class FakeDriver:
+        api = None
+
+        def __init__(self):
+            started.append(self)
+            # Slow enough for the other threads to ask for it meanwhile, as Firefox is
+            time.sleep(0.1)
+
+        def login(self):
+            pass
+
+        def credentials(self):
+            return "credentials"
+
+    monkeypatch.setitem(sys.modules, "browser_driver", types.SimpleNamespace(SainsburysShoppingDriver=FakeDriver))
+    monkeypatch.setattr(session_cache, "save_api_client", lambda api: None)
+    monkeypatch.setattr(session_cache, "save_credentials", lambda credentials: None)
+    browser = LazyBrowser(PhaseTimings())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        credentials = list(executor.map(lambda _: browser.credentials(), range(8)))
+
+    assert credentials == ["credentials"] * 8
+    assert len(started) == 1
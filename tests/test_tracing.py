@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.enable()
+    yield tracer
+    tracing.disable()
+
+
+def test_records_nothing_while_disabled():
+    tracing.disable()
+    with tracing.span(tracing.PHASE, "Log in") as details:
+        details["status"] = 200
+    assert tracing.current() is None
+
+
+def test_summarises_spans_by_category_and_name(tracer):
+    for status, size, retries in [(200, 100, 0), (503, 20, 2), (200, 50, 1)]:
+        with tracing.span(tracing.HTTP, "GET example.com/basket") as details:
+            details.update(status=status, bytes=size, retries=retries)
+    with pytest.raises(ValueError):
+        with tracing.span(tracing.PHASE, "Log in"):
+            raise ValueError()
+
+    http, login = tracer.summary()
+
+    assert (http.category, http.name, http.count) == (tracing.HTTP, "GET example.com/basket", 3)
+    assert (http.failures, http.retries, http.bytes) == (1, 3, 170)
+    assert http.max <= http.total and http.mean == pytest.approx(http.total / 3)
+    assert (login.count, login.failures) == (1, 1)
+    assert len(list(tracer.summary_lines())) == 3
+
+
+def test_exports_chrome_trace(tracer, tmp_path):
+    with tracing.span(tracing.PHASE, "Add items to trolley"):
+        with tracing.span(tracing.BROWSER, "get", url="https://example.com"):
+            pass
+
+    tracer.export_chrome_trace(tmp_path / "trace.json")
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    # Spans are recorded as they finish
+    assert [(event["cat"], event["name"]) for event in events] == [
+        (tracing.BROWSER, "get"), (tracing.PHASE, "Add items to trolley")
+    ]
+    browser, phase = events
+    assert all(event["ph"] == "X" for event in events)
+    assert phase["ts"] <= browser["ts"] and browser["dur"] <= phase["dur"]
+    assert browser["args"] == {"url": "https://example.com"}
+
+
+def test_http_span_names_group_requests_for_different_pages():
+    assert tracing.http_span_name("patch", "https://api.notion.com/v1/pages/0a1b2c3d-4e5f-6a7b-8c9d-0e1f2a3b4c5d") \
+        == tracing.http_span_name("PATCH", "https://api.notion.com/v1/pages/ffffffffeeeeddddccccbbbbbbbbbbbb?x=1") \
+        == "PATCH api.notion.com/v1/pages/{id}"